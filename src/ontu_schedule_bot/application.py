@@ -0,0 +1,351 @@
+"""Builds the application: handlers, periodic jobs and startup hooks of the bot"""
+
+import functools
+import logging
+import os
+import time
+
+import telegram.error
+from telegram import Update
+from telegram.ext import (
+    Application,
+    CallbackQueryHandler,
+    CommandHandler,
+    InlineQueryHandler,
+    JobQueue,
+    MessageHandler,
+    PicklePersistence,
+    TypeHandler,
+    filters,
+)
+
+from ontu_schedule_bot import commands, patterns
+from ontu_schedule_bot.rate_limiter import LaneRateLimiter
+from ontu_schedule_bot.settings import settings
+from ontu_schedule_bot.update_processor import UpdateProcessor
+from ontu_schedule_bot.utils import KYIV_TIMEZONE
+from ontu_schedule_bot.warmup import WarmUp
+
+logger = logging.getLogger(__name__)
+
+
+async def post_init(
+    application: Application,
+    warm_up: WarmUp,
+    started_at: float,
+) -> None:
+    """Runs once the application is initialized, but before it starts receiving updates"""
+    initialized_in = time.perf_counter() - started_at
+
+    warm_up_summary = await warm_up.wait()
+
+    await commands.resume_message_campaigns(application)
+
+    message = (
+        f"Bot started in {time.perf_counter() - started_at:.2f} seconds.\n"
+        f"Initialization: {initialized_in:.2f} s; warm-up: {warm_up_summary}"
+    )
+    logger.info(message)
+
+    try:
+        await application.bot.send_message(
+            chat_id=settings.DEBUG_CHAT_ID,
+            text=message,
+        )
+    except telegram.error.TelegramError as e:
+        logger.warning("Failed to report startup time: %s", e)
+
+
+def build_application(started_at: float) -> Application | None:
+    """
+    Configures the application.
+
+    `started_at` is a `time.perf_counter()` value of the process start, used to report startup time.
+    """
+    # Started before anything else, so it runs concurrently with the initialization
+    warm_up = WarmUp()
+
+    persistence = PicklePersistence(filepath=settings.PERSISTENCE_FILEPATH)
+
+    application = (
+        Application.builder()
+        .token(settings.BOT_TOKEN.get_secret_value())
+        .persistence(persistence)
+        .post_init(
+            functools.partial(
+                post_init,
+                warm_up=warm_up,
+                started_at=started_at,
+            )
+        )
+        .arbitrary_callback_data(True)  # noqa: FBT003
+        .concurrent_updates(
+            UpdateProcessor(
+                max_concurrency=settings.UPDATE_MAX_CONCURRENCY,
+                queue_limit=settings.UPDATE_QUEUE_LIMIT,
+                chat_queue_limit=settings.UPDATE_CHAT_QUEUE_LIMIT,
+            )
+        )
+        .rate_limiter(
+            LaneRateLimiter(
+                max_rate=settings.TELEGRAM_MAX_MESSAGES_PER_SECOND,
+                max_retries=5,
+            )
+        )
+        .build()
+    )
+
+    application.add_error_handler(
+        commands.error_handler,
+    )
+
+    application.add_handler(
+        CommandHandler(
+            command="start",
+            callback=commands.start_command,
+        )
+    )
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.start_command,
+            pattern=patterns.start_pattern,
+        )
+    )
+
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.manage_subscription,
+            pattern=patterns.manage_subscription_pattern,
+        )
+    )
+
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.manage_subscription_groups,
+            pattern=patterns.manage_subscription_groups_pattern,
+        )
+    )
+
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.manage_subscription_teachers,
+            pattern=patterns.manage_subscription_teachers_pattern,
+        )
+    )
+
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.add_subscription_group,
+            pattern=patterns.add_subscription_group_pattern,
+        )
+    )
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.add_subscription_teacher,
+            pattern=patterns.add_subscription_teacher_pattern,
+        )
+    )
+
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.select_faculty,
+            pattern=patterns.select_faculty_pattern,
+        )
+    )
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.select_department,
+            pattern=patterns.select_department_pattern,
+        )
+    )
+
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.add_subscription_item,
+            pattern=patterns.add_subscription_item_pattern,
+        )
+    )
+
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.remove_subscription_items,
+            pattern=patterns.remove_subscription_items_pattern,
+        )
+    )
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.remove_subscription_item,
+            pattern=patterns.remove_subscription_item_pattern,
+        )
+    )
+
+    application.add_handler(
+        CommandHandler(
+            command="today",
+            callback=commands.get_today_schedule,
+        )
+    )
+    application.add_handler(
+        CommandHandler(
+            command="tomorrow",
+            callback=commands.get_tomorrow_schedule,
+        )
+    )
+    application.add_handler(
+        CommandHandler(
+            command="week",
+            callback=commands.get_week_schedule,
+        )
+    )
+    application.add_handler(
+        CommandHandler(
+            "next_pair",
+            commands.next_pair,
+        )
+    )
+
+    application.add_handler(
+        CommandHandler(
+            "send_message_campaign",
+            commands.send_message_campaign,
+        )
+    )
+    application.add_handler(
+        CommandHandler(
+            "metrics",
+            commands.send_metrics,
+        )
+    )
+
+    application.add_handler(
+        CommandHandler(
+            "search",
+            commands.search_catalog,
+        )
+    )
+    application.add_handler(
+        InlineQueryHandler(
+            callback=commands.inline_search,
+        )
+    )
+
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.get_week_schedule,
+            pattern=patterns.get_week_schedule_pattern,
+        )
+    )
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.get_schedule,
+            pattern=patterns.get_schedule_pattern,
+        )
+    )
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.get_pair_details,
+            pattern=patterns.get_pair_details_pattern,
+        )
+    )
+
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.toggle_subscription,
+            pattern=patterns.toggle_subscription_pattern,
+        )
+    )
+    application.add_handler(
+        CallbackQueryHandler(
+            callback=commands.set_reminder_mode,
+            pattern=patterns.set_reminder_mode_pattern,
+        )
+    )
+
+    # Registered last, so buttons and commands are handled first
+    application.add_handler(
+        MessageHandler(
+            filters=filters.ChatType.PRIVATE & filters.TEXT & ~filters.COMMAND,
+            callback=commands.search_catalog,
+        )
+    )
+
+    # A separate group, so it runs after the handler of an update, even if it failed
+    application.add_handler(
+        TypeHandler(
+            type=Update,
+            callback=commands.finish_update,
+        ),
+        group=1,
+    )
+
+    # application.add_handler(
+    #     CommandHandler(
+    #         command="manual_batch_pair_check",
+    #         callback=commands.manual_batch_pair_check,
+    #     )
+    # )
+
+    if not isinstance(application.job_queue, JobQueue):
+        logger.error("Application doesn't have job_queue")
+        return None
+
+    # Every replica keeps its own index, so it's refreshed everywhere
+    application.job_queue.run_repeating(
+        commands.refresh_search_index,
+        interval=max(settings.CATALOG_CACHE_TTL, 60),
+        first=0,
+        name="Refresh search index",
+    )
+
+    if settings.RUN_PERIODIC_JOBS:
+        # Notifications are planned by a single replica (per round), others load the plan.
+        # Every replica schedules them, sending of each due instant is leased
+        application.job_queue.run_once(
+            commands.periodic_plan_notifications,
+            when=0,
+            data={
+                "catch_up": True,
+            },
+            name="Plan notifications (startup)",
+        )
+
+        for plan_time in settings.NOTIFICATION_PLAN_TIMES:
+            application.job_queue.run_daily(
+                commands.periodic_plan_notifications,
+                time=plan_time.replace(tzinfo=KYIV_TIMEZONE),
+                days=(1, 2, 3, 4, 5, 6),  # Monday-Saturday
+                data={
+                    "round": plan_time.isoformat("minutes"),
+                },
+                name=f"Plan notifications ({plan_time.isoformat('minutes')})",
+                job_kwargs={
+                    "misfire_grace_time": None,
+                },
+            )
+
+        application.job_queue.run_daily(
+            commands.plan_evening_reminders,
+            time=settings.EVENING_REMINDER_TIME.replace(tzinfo=KYIV_TIMEZONE),
+            days=(0, 1, 2, 3, 4, 5),  # Sunday-Friday, the evening before Monday-Saturday
+            name="Plan evening reminders",
+            job_kwargs={
+                "misfire_grace_time": None,
+            },
+        )
+
+    return application
+
+
+def run(application: Application) -> None:
+    # Add choice between webhook and polling later
+    if settings.WEBHOOK_URL is None:
+        application.run_polling(
+            drop_pending_updates=True,
+            bootstrap_retries=5,
+        )
+    else:
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=int(os.environ.get("PORT", "443")),
+            webhook_url=str(settings.WEBHOOK_URL),
+        )
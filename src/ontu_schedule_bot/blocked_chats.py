@@ -0,0 +1,151 @@
+"""
+Registry of chats that can't receive messages: the bot was blocked (or kicked),
+the chat was deleted, or it migrated to a supergroup.
+
+Notifications and campaigns skip such chats instead of failing on them again and again.
+A chat is suppressed for `BLOCKED_CHAT_REPROBE_AFTER`, then the next message probes it:
+if it fails again, the chat is suppressed again, if it's sent, the chat is removed.
+A chat is also removed as soon as the bot gets an update from it (e.g. it was unblocked).
+
+Entries are kept in the state database, and in memory (by chat ID) for O(1) checks.
+Chats suppressed since the last report are reported in bulk to the debug chat.
+"""
+
+import functools
+import sqlite3
+import time
+from typing import NamedTuple
+
+import telegram.error
+
+from ontu_schedule_bot import storage, utils
+from ontu_schedule_bot.settings import settings
+
+BLOCKED = "blocked"
+DELETED = "deleted"
+MIGRATED = "migrated"
+
+
+class BlockedChat(NamedTuple):
+    chat_id: str
+    reason: str
+    detail: str
+    migrated_to: str | None
+
+
+def create_tables(connection: sqlite3.Connection) -> None:
+    with connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS blocked_chats ("
+            "chat_id TEXT PRIMARY KEY, "
+            "reason TEXT NOT NULL, "
+            "detail TEXT NOT NULL, "
+            "migrated_to TEXT, "
+            "blocked_at REAL NOT NULL, "
+            "probe_at REAL NOT NULL, "
+            "reported INTEGER NOT NULL DEFAULT 0)"
+        )
+
+
+def reason_of(error: telegram.error.TelegramError) -> str | None:
+    """Returns why a chat can't receive messages, None if the error isn't about that"""
+    if isinstance(error, telegram.error.ChatMigrated):
+        return MIGRATED
+
+    message = error.message.lower()
+
+    if isinstance(error, telegram.error.Forbidden):
+        return DELETED if "deactivated" in message else BLOCKED
+
+    if isinstance(error, telegram.error.BadRequest) and "chat not found" in message:
+        return DELETED
+
+    return None
+
+
+class BlockedChats:
+    """Blocked chats by chat ID (without the topic: a chat is blocked with all of its topics)"""
+
+    def __init__(self) -> None:
+        create_tables(storage.get_connection())
+
+        # Chat ID -> when it's probed again
+        self.probe_at: dict[str, float] = {}
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Reloads chats from the database (other replicas may have added some)"""
+        self.probe_at = dict(
+            storage.get_connection().execute("SELECT chat_id, probe_at FROM blocked_chats")
+        )
+
+    def is_suppressed(self, platform_chat_id: str) -> bool:
+        """Whether nothing should be sent to the chat now"""
+        chat_id, _message_thread_id = utils.split_platform_chat_id(platform_chat_id)
+        probe_at = self.probe_at.get(chat_id)
+
+        return probe_at is not None and time.time() < probe_at
+
+    def add(self, platform_chat_id: str, error: telegram.error.TelegramError) -> bool:
+        """Suppresses the chat if the error means it can't receive messages, returns whether so"""
+        reason = reason_of(error)
+        if reason is None:
+            return False
+
+        chat_id, _message_thread_id = utils.split_platform_chat_id(platform_chat_id)
+        migrated_to = (
+            str(error.new_chat_id) if isinstance(error, telegram.error.ChatMigrated) else None
+        )
+        now = time.time()
+        probe_at = now + settings.BLOCKED_CHAT_REPROBE_AFTER
+        connection = storage.get_connection()
+
+        # A chat that is still blocked after a probe isn't reported again
+        with connection:
+            connection.execute(
+                "INSERT INTO blocked_chats "
+                "(chat_id, reason, detail, migrated_to, blocked_at, probe_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET probe_at = excluded.probe_at, "
+                "reported = reported AND reason = excluded.reason, "
+                "reason = excluded.reason, detail = excluded.detail, "
+                "migrated_to = excluded.migrated_to",
+                (chat_id, reason, error.message, migrated_to, now, probe_at),
+            )
+
+        self.probe_at[chat_id] = probe_at
+        return True
+
+    def discard(self, platform_chat_id: str) -> None:
+        """Removes the chat (a message was delivered to it, or it sent an update)"""
+        chat_id, _message_thread_id = utils.split_platform_chat_id(platform_chat_id)
+
+        if self.probe_at.pop(chat_id, None) is None:
+            return
+
+        connection = storage.get_connection()
+        with connection:
+            connection.execute("DELETE FROM blocked_chats WHERE chat_id = ?", (chat_id,))
+
+    def unreported(self) -> list[BlockedChat]:
+        """Returns chats that were suppressed since the last report"""
+        cursor = storage.get_connection().execute(
+            "SELECT chat_id, reason, detail, migrated_to FROM blocked_chats "
+            "WHERE reported = 0 ORDER BY blocked_at"
+        )
+
+        return [BlockedChat(*row) for row in cursor]
+
+    def mark_reported(self, chats: list[BlockedChat]) -> None:
+        connection = storage.get_connection()
+
+        with connection:
+            connection.executemany(
+                "UPDATE blocked_chats SET reported = 1 WHERE chat_id = ?",
+                ((chat.chat_id,) for chat in chats),
+            )
+
+
+@functools.cache
+def get_blocked_chats() -> BlockedChats:
+    return BlockedChats()
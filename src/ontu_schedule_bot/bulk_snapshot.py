@@ -0,0 +1,276 @@
+"""
+Compact on-disk snapshot of the last bulk schedule.
+
+Every complete bulk schedule is saved, so notifications can be planned right after
+a restart (before the bulk schedule is fetched), and when the admin API is unavailable.
+
+The file is memory-mapped, and schedules of a chat are found by a binary search over
+the chat index, so a lookup reads only a few pages instead of the whole file.
+Many chats are subscribed to the same group, so every distinct schedule is stored once.
+
+Layout (little-endian):
+- header (see `HEADER`);
+- schedules: distinct day schedules, zlib-compressed JSON;
+- schedule table: offset and length of every schedule;
+- chat records: number of schedules of a chat, and their indexes (-1 for a missing one);
+- chat index: (chat ID offset, chat ID length, record offset), sorted by chat ID;
+- chat IDs, UTF-8.
+"""
+
+import datetime
+import functools
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections.abc import Iterable, Iterator
+
+from ontu_schedule_bot.settings import settings
+from ontu_schedule_bot.third_party.admin.schemas import DaySchedule
+from ontu_schedule_bot.utils import KYIV_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"OSBS"
+VERSION = 1
+
+# Magic, version, created at (timestamp), number of schedules, number of chats,
+# offsets of the schedule table, of the chat index and of chat IDs
+HEADER = struct.Struct("<4sHdIIQQQ")
+SCHEDULE_ENTRY = struct.Struct("<QI")
+RECORD_LENGTH = struct.Struct("<H")
+SCHEDULE_INDEX = struct.Struct("<i")
+CHAT_ENTRY = struct.Struct("<QHQ")
+
+
+class SnapshotWriter:
+    """Collects bulk records (as they're streamed), and writes them as a snapshot"""
+
+    def __init__(self) -> None:
+        # Compact JSON of a schedule -> its index
+        self.schedule_indexes: dict[bytes, int] = {}
+        self.chats: dict[str, list[int]] = {}
+        self.complete = False
+
+    def add(self, record: dict[str, list[dict | None]]) -> None:
+        for platform_chat_id, schedules in record.items():
+            indexes = []
+
+            for schedule in schedules:
+                if schedule is None:
+                    indexes.append(-1)
+                    continue
+
+                body = json.dumps(
+                    schedule,
+                    ensure_ascii=False,
+                    separators=(",", ":"),
+                    sort_keys=True,
+                ).encode()
+                indexes.append(self.schedule_indexes.setdefault(body, len(self.schedule_indexes)))
+
+            self.chats[platform_chat_id] = indexes
+
+    def tee(
+        self,
+        records: Iterable[dict[str, list[dict | None]]],
+    ) -> Iterator[dict[str, list[dict | None]]]:
+        """Passes records through, collecting them. Marks the snapshot complete at the end"""
+        for record in records:
+            self.add(record)
+            yield record
+
+        self.complete = True
+
+    def write(self, path: str) -> None:
+        """Writes the snapshot (atomically, it's renamed into place)"""
+        created_at = datetime.datetime.now(tz=KYIV_TIMEZONE).timestamp()
+
+        schedules = bytearray()
+        schedule_table = bytearray()
+
+        for body in self.schedule_indexes:
+            compressed = zlib.compress(body)
+            schedule_table += SCHEDULE_ENTRY.pack(HEADER.size + len(schedules), len(compressed))
+            schedules += compressed
+
+        records_offset = HEADER.size + len(schedules) + len(schedule_table)
+        records = bytearray()
+        chat_ids = bytearray()
+        chat_entries = []
+
+        for platform_chat_id in sorted(self.chats):
+            indexes = self.chats[platform_chat_id]
+            encoded_id = platform_chat_id.encode()
+
+            chat_entries.append((len(chat_ids), len(encoded_id), records_offset + len(records)))
+            chat_ids += encoded_id
+
+            records += RECORD_LENGTH.pack(len(indexes))
+            records += b"".join(SCHEDULE_INDEX.pack(index) for index in indexes)
+
+        index_offset = records_offset + len(records)
+        chat_ids_offset = index_offset + CHAT_ENTRY.size * len(chat_entries)
+
+        header = HEADER.pack(
+            MAGIC,
+            VERSION,
+            created_at,
+            len(self.schedule_indexes),
+            len(chat_entries),
+            HEADER.size + len(schedules),
+            index_offset,
+            chat_ids_offset,
+        )
+
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(header)
+            file.write(schedules)
+            file.write(schedule_table)
+            file.write(records)
+            file.writelines(CHAT_ENTRY.pack(*entry) for entry in chat_entries)
+            file.write(chat_ids)
+
+        os.replace(temporary_path, path)
+
+        logger.info(
+            "Bulk snapshot is written: %s chats, %s distinct schedules, %s bytes",
+            len(chat_entries),
+            len(self.schedule_indexes),
+            chat_ids_offset + len(chat_ids),
+        )
+
+
+class Snapshot:
+    """A memory-mapped snapshot, read lazily"""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic,
+            version,
+            created_at,
+            self.schedules_count,
+            self.chats_count,
+            self.schedule_table_offset,
+            self.index_offset,
+            self.chat_ids_offset,
+        ) = HEADER.unpack_from(self.data)
+
+        if magic != MAGIC or version != VERSION:
+            self.data.close()
+            raise ValueError(f"{path} is not a bulk snapshot of version {VERSION}")
+
+        self.created_at = datetime.datetime.fromtimestamp(created_at, tz=KYIV_TIMEZONE)
+
+    def __len__(self) -> int:
+        return self.chats_count
+
+    def _chat_entry(self, position: int) -> tuple[str, int]:
+        """Returns chat ID and record offset of the chat at `position` of the index"""
+        id_offset, id_length, record_offset = CHAT_ENTRY.unpack_from(
+            self.data,
+            self.index_offset + position * CHAT_ENTRY.size,
+        )
+        start = self.chat_ids_offset + id_offset
+
+        return self.data[start : start + id_length].decode(), record_offset
+
+    def _schedule(self, index: int) -> DaySchedule:
+        offset, length = SCHEDULE_ENTRY.unpack_from(
+            self.data,
+            self.schedule_table_offset + index * SCHEDULE_ENTRY.size,
+        )
+
+        return DaySchedule.model_validate_json(zlib.decompress(self.data[offset : offset + length]))
+
+    def _indexes(self, record_offset: int) -> tuple[int, ...]:
+        (length,) = RECORD_LENGTH.unpack_from(self.data, record_offset)
+
+        return struct.unpack_from(f"<{length}i", self.data, record_offset + RECORD_LENGTH.size)
+
+    def get(self, platform_chat_id: str) -> list[DaySchedule | None] | None:
+        """Returns schedules of a chat, None if the chat isn't in the snapshot"""
+        low, high = 0, self.chats_count
+
+        while low < high:
+            middle = (low + high) // 2
+            chat_id, record_offset = self._chat_entry(middle)
+
+            if chat_id == platform_chat_id:
+                return [
+                    self._schedule(index) if index >= 0 else None
+                    for index in self._indexes(record_offset)
+                ]
+
+            if chat_id < platform_chat_id:
+                low = middle + 1
+            else:
+                high = middle
+
+        return None
+
+    def records(self) -> Iterator[dict[str, list[DaySchedule | None]]]:
+        """Yields records of all chats, every distinct schedule is decoded once"""
+        decoded: dict[int, DaySchedule] = {}
+
+        for position in range(self.chats_count):
+            chat_id, record_offset = self._chat_entry(position)
+            schedules: list[DaySchedule | None] = []
+
+            for index in self._indexes(record_offset):
+                if index < 0:
+                    schedules.append(None)
+                    continue
+
+                if index not in decoded:
+                    decoded[index] = self._schedule(index)
+
+                schedules.append(decoded[index])
+
+            yield {chat_id: schedules}
+
+
+class SnapshotStore:
+    """Gives the current snapshot, it's re-opened when the file is replaced"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.snapshot: Snapshot | None = None
+        self.modified_at: int | None = None
+        self.lock = threading.Lock()
+
+    def get(self, date: datetime.date) -> Snapshot | None:
+        """Returns the snapshot, if it was made on `date` (older schedules are useless)"""
+        try:
+            modified_at = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        with self.lock:
+            if modified_at != self.modified_at:
+                try:
+                    self.snapshot = Snapshot(self.path)
+                except (OSError, ValueError, struct.error) as e:
+                    logger.warning("Failed to open bulk snapshot: %r", e)
+                    self.snapshot = None
+
+                self.modified_at = modified_at
+
+            snapshot = self.snapshot
+
+        if snapshot is None or snapshot.created_at.date() != date:
+            return None
+
+        return snapshot
+
+
+@functools.cache
+def get_snapshot_store() -> SnapshotStore:
+    return SnapshotStore(settings.BULK_SNAPSHOT_FILEPATH)
@@ -0,0 +1,329 @@
+"""Contains the engine that delivers message campaigns to their recipients"""
+
+import asyncio
+import datetime
+import logging
+import sqlite3
+import time
+from collections.abc import AsyncGenerator, AsyncIterable, Awaitable, Callable
+
+import pydantic
+import telegram.error
+from telegram import Bot
+from telegram.constants import ParseMode
+
+from ontu_schedule_bot import blocked_chats, metrics, storage, utils
+from ontu_schedule_bot.settings import settings
+from ontu_schedule_bot.third_party.admin.schemas import Chat
+
+logger = logging.getLogger(__name__)
+
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+STATUS_SUPPRESSED = "suppressed"
+
+CAMPAIGN_RUNNING = "running"
+CAMPAIGN_FINISHED = "finished"
+# The campaign doesn't exist anymore (e.g. it was deleted on the server)
+CAMPAIGN_FAILED = "failed"
+
+# Progress is checkpointed in batches, so after a crash up to this many chats may get it twice
+CHECKPOINT_BATCH = 50
+
+
+def render_campaign_message(name: str, payload: pydantic.JsonValue) -> str:
+    """Renders the text of a campaign (done once per campaign, not per recipient)"""
+    message = payload.get("message") if isinstance(payload, dict) else payload
+
+    return f"Повідомлення: {name}\n\n{message}"
+
+
+def create_tables(connection: sqlite3.Connection) -> None:
+    with connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS campaigns ("
+            "campaign_id TEXT PRIMARY KEY, "
+            "status TEXT NOT NULL, "
+            "started_at REAL NOT NULL, "
+            "finished_at REAL)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS campaign_recipients ("
+            "campaign_id TEXT NOT NULL, "
+            "platform_chat_id TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "PRIMARY KEY (campaign_id, platform_chat_id))"
+        )
+
+
+class CampaignProgressStore:
+    """
+    Persists which recipients were already processed by a campaign.
+
+    Used to resume a campaign after a restart without sending the message twice.
+    Only successful sends and permanent failures are recorded. Recipients that weren't
+    reached because of transient errors (network, flood waits) are left out, so the next
+    pass sends to them.
+    """
+
+    def __init__(self, campaign_id: str) -> None:
+        self.campaign_id = campaign_id
+        self.connection = storage.get_connection()
+
+        create_tables(self.connection)
+
+    def start(self) -> None:
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO campaigns (campaign_id, status, started_at) "
+                "VALUES (?, ?, ?)",
+                (self.campaign_id, CAMPAIGN_RUNNING, time.time()),
+            )
+
+    def finish(self, status: str = CAMPAIGN_FINISHED) -> None:
+        """Marks the campaign done, so it isn't resumed"""
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO campaigns (campaign_id, status, started_at, finished_at) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (campaign_id) DO UPDATE SET "
+                "status = excluded.status, finished_at = excluded.finished_at",
+                (self.campaign_id, status, time.time(), time.time()),
+            )
+
+    def processed(self, platform_chat_ids: list[str]) -> set[str]:
+        """Returns which of the given chats were already processed"""
+        if not platform_chat_ids:
+            return set()
+
+        placeholders = ", ".join("?" * len(platform_chat_ids))
+        cursor = self.connection.execute(
+            "SELECT platform_chat_id FROM campaign_recipients "
+            f"WHERE campaign_id = ? AND platform_chat_id IN ({placeholders})",
+            (self.campaign_id, *platform_chat_ids),
+        )
+        return {row[0] for row in cursor}
+
+    def mark(self, statuses: list[tuple[str, str]]) -> None:
+        """Records (platform chat ID, status) of processed chats"""
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO campaign_recipients "
+                "(campaign_id, platform_chat_id, status) VALUES (?, ?, ?)",
+                [
+                    (self.campaign_id, platform_chat_id, status)
+                    for platform_chat_id, status in statuses
+                ],
+            )
+
+    @staticmethod
+    def unfinished() -> list[str]:
+        """Returns IDs of campaigns that were interrupted before completion"""
+        connection = storage.get_connection()
+        create_tables(connection)
+
+        cursor = connection.execute(
+            "SELECT campaign_id FROM campaigns WHERE status = ?",
+            (CAMPAIGN_RUNNING,),
+        )
+        return [row[0] for row in cursor]
+
+
+async def iter_recipient_pages(recipients: list[Chat]) -> AsyncGenerator[list[Chat]]:
+    """
+    Yields recipients of a campaign in pages of `CAMPAIGN_RECIPIENTS_PAGE_SIZE`.
+
+    The admin API returns all recipients with the campaign (it can't paginate them),
+    pages only bound the progress store lookups (see `CampaignSender.run`).
+    """
+    page_size = settings.CAMPAIGN_RECIPIENTS_PAGE_SIZE
+
+    for start in range(0, len(recipients), page_size):
+        yield recipients[start : start + page_size]
+
+
+class CampaignSender:
+    """
+    Sends a pre-rendered campaign message to recipients.
+
+    At most `concurrency` messages are in flight at once, progress is checkpointed
+    in batches (see `CHECKPOINT_BATCH`) and periodically reported (throughput & ETA)
+    via `report`.
+    A pass (`run`) skips recipients processed before, so recipients that weren't reached
+    because of network errors (`unreached`) are sent to by the next pass.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        bot: Bot,
+        campaign_id: str,
+        name: str,
+        text: str,
+        total: int,
+        report: Callable[[str], Awaitable[None]],
+        report_error: Callable[[Exception], Awaitable[None]],
+    ) -> None:
+        self.bot = bot
+        self.name = name
+        self.text = text
+        self.total = total
+
+        self.report = report
+        self.report_error = report_error
+
+        self.concurrency = settings.CAMPAIGN_CONCURRENCY
+        self.progress = CampaignProgressStore(campaign_id=campaign_id)
+        self.blocked = blocked_chats.get_blocked_chats()
+
+        # Statuses of processed chats, waiting to be checkpointed
+        self.checkpoints: list[tuple[str, str]] = []
+        self.checkpoint_lock = asyncio.Lock()
+
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.suppressed = 0
+        # Not reached during the last pass, because of network errors
+        self.unreached = 0
+        self.passes = 0
+        self.started_at = time.monotonic()
+
+    async def run(self, recipient_pages: AsyncIterable[list[Chat]]) -> None:
+        """
+        Sends the campaign to recipients, page by page.
+
+        Pages are consumed as they arrive (only a couple of pages are kept in memory),
+        so sending starts before the whole audience is loaded.
+        """
+        self.progress.start()
+        self.blocked.refresh()
+
+        if not self.passes:
+            self.started_at = time.monotonic()
+
+        self.passes += 1
+        self.unreached = 0
+
+        queue: asyncio.Queue[Chat | None] = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        reporter = asyncio.create_task(self._report_progress())
+
+        try:
+            async for recipients in recipient_pages:
+                processed = self.progress.processed(
+                    [recipient.platform_chat_id for recipient in recipients]
+                )
+
+                for recipient in recipients:
+                    if recipient.platform_chat_id in processed:
+                        # Later passes skip recipients processed by the earlier ones
+                        if self.passes == 1:
+                            self.skipped += 1
+                        continue
+
+                    await queue.put(recipient)
+
+            for _ in workers:
+                await queue.put(None)
+
+            await asyncio.gather(*workers)
+        finally:
+            reporter.cancel()
+            for worker in workers:
+                worker.cancel()
+
+            # The next pass (or a resumed campaign) skips what's checkpointed
+            await self._checkpoint()
+
+    async def _worker(self, queue: "asyncio.Queue[Chat | None]") -> None:
+        while (recipient := await queue.get()) is not None:
+            await self._send(recipient)
+
+    async def _send(self, recipient: Chat) -> None:
+        if self.blocked.is_suppressed(recipient.platform_chat_id):
+            self.suppressed += 1
+            metrics.SENDS_SUPPRESSED.inc(kind="campaign")
+            await self._mark(recipient.platform_chat_id, STATUS_SUPPRESSED)
+            return
+
+        chat_id, message_thread_id = utils.split_platform_chat_id(recipient.platform_chat_id)
+
+        try:
+            await self.bot.send_message(
+                chat_id=chat_id,
+                message_thread_id=message_thread_id,
+                text=self.text,
+                disable_notification=True,
+                parse_mode=ParseMode.HTML,
+            )
+        except (
+            telegram.error.Forbidden,
+            telegram.error.ChatMigrated,
+            telegram.error.BadRequest,
+        ) as e:
+            # Permanent, sending again wouldn't help
+            self.failed += 1
+            await self._mark(recipient.platform_chat_id, STATUS_FAILED)
+
+            if self.blocked.add(recipient.platform_chat_id, e):
+                logger.warning("Cannot send campaign to chat %s: %s", recipient.platform_chat_id, e)
+            else:
+                await self.report_error(e)
+            return
+        except (telegram.error.NetworkError, telegram.error.RetryAfter) as e:
+            # Transient (`BadRequest` is a subclass, but it's handled above), the next pass retries.
+            # `RetryAfter` gets here once the rate limiter gave up waiting out the flood wait
+            logger.warning(
+                "Campaign didn't reach chat %s, it'll be retried: %s", recipient.platform_chat_id, e
+            )
+            self.unreached += 1
+            return
+        except Exception as e:  # noqa: BLE001
+            self.failed += 1
+            await self._mark(recipient.platform_chat_id, STATUS_FAILED)
+            await self.report_error(e)
+            return
+
+        self.blocked.discard(recipient.platform_chat_id)
+        self.sent += 1
+        await self._mark(recipient.platform_chat_id, STATUS_SENT)
+
+    async def _mark(self, platform_chat_id: str, status: str) -> None:
+        self.checkpoints.append((platform_chat_id, status))
+
+        if len(self.checkpoints) >= CHECKPOINT_BATCH:
+            await self._checkpoint()
+
+    async def _checkpoint(self) -> None:
+        async with self.checkpoint_lock:
+            checkpoints, self.checkpoints = self.checkpoints, []
+
+            if checkpoints:
+                # Written in a thread (with its own connection), not to block sending
+                await asyncio.to_thread(
+                    lambda: CampaignProgressStore(self.progress.campaign_id).mark(checkpoints)
+                )
+
+    async def _report_progress(self) -> None:
+        while True:
+            await asyncio.sleep(settings.CAMPAIGN_PROGRESS_INTERVAL)
+            await self.report(self.progress_text())
+
+    def progress_text(self) -> str:
+        elapsed = time.monotonic() - self.started_at
+        done = self.sent + self.failed + self.suppressed
+        rate = done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.skipped - done
+
+        eta = "невідомо"
+        if rate > 0:
+            eta = str(datetime.timedelta(seconds=round(max(remaining, 0) / rate)))
+
+        return (
+            f"Розсилка «{self.name}»: {done + self.skipped}/{self.total}\n"
+            f"Надіслано: {self.sent}, помилок: {self.failed}, "
+            f"пропущено (вже оброблено): {self.skipped}, "
+            f"пропущено (бота заблоковано): {self.suppressed}, "
+            f"не доставлено (помилка мережі): {self.unreached}\n"
+            f"Швидкість: {rate:.1f} пов./с, залишилось: {eta}"  # noqa: RUF001
+        )
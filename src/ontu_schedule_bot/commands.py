@@ -1,26 +1,51 @@
 """This module contains all the commands bot may execute"""
 
+import asyncio
 import contextvars
 import datetime
+import functools
 import html
 import json
 import logging
 import time
 import traceback
+from collections.abc import Callable, Hashable, Iterable
 from typing import Literal
 from uuid import UUID
 
 import httpx
 import telegram.error
-from telegram import Update
-from telegram.constants import ParseMode
-from telegram.ext import CallbackContext, ContextTypes
-
-from ontu_schedule_bot import messages, utils
-from ontu_schedule_bot.errors import SubscriptionNotFoundError
-from ontu_schedule_bot.schemas import SendMessageCampaignDTO
+from telegram import Bot, Update
+from telegram.constants import ChatMemberStatus, ParseMode
+from telegram.ext import Application, CallbackContext, ContextTypes
+
+from ontu_schedule_bot import (
+    blocked_chats,
+    bulk_snapshot,
+    campaigns,
+    leader,
+    messages,
+    metrics,
+    notifications,
+    outbox,
+    preferences,
+    prefetch,
+    rate_limiter,
+    schedule_cache,
+    scheduler,
+    search,
+    sharding,
+    timetable,
+    utils,
+)
+from ontu_schedule_bot.errors import ServiceUnavailableError, SubscriptionNotFoundError
+from ontu_schedule_bot.schemas import BatchStats, SendMessageCampaignDTO
 from ontu_schedule_bot.settings import settings
-from ontu_schedule_bot.third_party.admin.client import AdminClient
+from ontu_schedule_bot.third_party.admin.client import (
+    AdminClient,
+    get_admin_client,
+    validate_bulk_record,
+)
 from ontu_schedule_bot.third_party.admin.enums import Platform
 from ontu_schedule_bot.third_party.admin.schemas import (
     Chat,
@@ -29,11 +54,17 @@ from ontu_schedule_bot.third_party.admin.schemas import (
     Department,
     Faculty,
     Group,
+    GroupPaginatedResponse,
     Pair,
     Subscription,
     Teacher,
+    TeacherPaginatedResponse,
+    WeekSchedule,
 )
-from ontu_schedule_bot.utils import PAIR_START_TIME
+
+SEARCH_RESULTS_LIMIT = 10
+# For how long replicas wait for another one to plan notifications, before loading what's stored
+NOTIFICATION_PLAN_WAIT = 30 * 60
 
 current_client = contextvars.ContextVar("current_client")
 current_update = contextvars.ContextVar("update")
@@ -45,7 +76,7 @@ def get_current_client() -> AdminClient:
     try:
         client = current_client.get()
     except LookupError:
-        client = AdminClient()
+        client = get_admin_client()
         current_client.set(client)
     return client
 
@@ -79,7 +110,10 @@ async def get_chat_info(
     ):
         chat_id += f":{update.effective_message.message_thread_id}"
 
-    return client.get_chat(chat_id=chat_id)
+    return await prefetch.get_prefetcher().get(
+        key=("get_chat", chat_id),
+        loader=functools.partial(client.get_chat, chat_id=chat_id),
+    )
 
 
 async def get_subscription_info(
@@ -88,7 +122,52 @@ async def get_subscription_info(
     """Gets subscription info from admin service"""
     client = get_current_client()
 
-    return client.get_subscription(chat_id=chat.platform_chat_id)
+    return await prefetch.get_prefetcher().get(
+        key=("get_subscription", chat.platform_chat_id),
+        loader=functools.partial(client.get_subscription, chat_id=chat.platform_chat_id),
+    )
+
+
+async def get_reminder_mode(chat: Chat) -> preferences.ReminderMode:
+    """Gets reminder mode of a chat, the store is read in a thread (with its own connection)"""
+    return await asyncio.to_thread(
+        lambda: preferences.PreferencesStore().get_reminder_mode(chat.platform_chat_id)
+    )
+
+
+async def get_reminder_modes() -> dict[str, preferences.ReminderMode]:
+    """Gets reminder modes of chats that changed the default one, see `get_reminder_mode`"""
+    return await asyncio.to_thread(lambda: preferences.PreferencesStore().reminder_modes())
+
+
+def prefetch_chat_info(chat: Chat, subscription: bool = True) -> None:
+    """Prefetches data of a chat, that's needed by the subscription management screens"""
+    client = get_current_client()
+
+    loaders: dict[Hashable, Callable[[], object]] = {
+        ("get_chat", chat.platform_chat_id): functools.partial(
+            client.get_chat, chat_id=chat.platform_chat_id
+        ),
+    }
+
+    if subscription:
+        loaders["get_subscription", chat.platform_chat_id] = functools.partial(
+            client.get_subscription, chat_id=chat.platform_chat_id
+        )
+
+    prefetch.get_prefetcher().prefetch(owner=chat.platform_chat_id, loaders=loaders)
+
+
+def invalidate_subscription_info(chat: Chat) -> None:
+    """Drops prefetched subscription and cached schedules of a chat, after it was changed"""
+    prefetch.get_prefetcher().invalidate(("get_subscription", chat.platform_chat_id))
+
+    # See `read_day_schedule` and `read_week_schedule`
+    schedule_cache.get_schedule_cache().invalidate(
+        lambda key: (
+            isinstance(key, tuple) and key[0] in {"day", "week"} and key[1] == chat.platform_chat_id
+        )
+    )
 
 
 async def start_command(
@@ -104,14 +183,15 @@ async def start_command(
 
     await messages.processing_update(update=update)
 
-    client = AdminClient()
+    client = get_current_client()
 
     if message.message_thread_id:
         telegram_chat_id = f"{telegram_chat.id}:{message.message_thread_id}"
     else:
         telegram_chat_id = str(telegram_chat.id)
 
-    chat = client.get_or_create_chat(
+    chat = await asyncio.to_thread(
+        client.get_or_create_chat,
         chat_info=CreateChatRequest(
             platform=Platform.TELEGRAM,
             platform_chat_id=telegram_chat_id,
@@ -125,20 +205,28 @@ async def start_command(
                 "is_forum": telegram_chat.is_forum,
                 "topic_id": message.message_thread_id,
             },
-        )
+        ),
     )
 
     try:
-        subscription = client.get_subscription(chat_id=chat.platform_chat_id)
+        subscription = await asyncio.to_thread(
+            client.get_subscription, chat_id=chat.platform_chat_id
+        )
     except SubscriptionNotFoundError:
-        subscription = client.create_subscription(chat_id=chat.platform_chat_id)
+        subscription = await asyncio.to_thread(
+            client.create_subscription, chat_id=chat.platform_chat_id
+        )
 
     await messages.start_command(
         update=update,
         chat=chat,
         subscription=subscription,
+        reminder_mode=await get_reminder_mode(chat=chat),
     )
 
+    # "Manage subscription" is the usual next step
+    prefetch_chat_info(chat=chat)
+
 
 async def manage_subscription(
     update: "Update",
@@ -159,6 +247,9 @@ async def manage_subscription(
         chat=chat,
     )
 
+    # Followed by managing groups or teachers
+    prefetch_chat_info(chat=chat)
+
 
 async def manage_subscription_groups(
     update: "Update",
@@ -246,18 +337,22 @@ async def remove_subscription_item(
     client = get_current_client()
 
     if item_type == "group":
-        subscription = client.remove_group(
+        subscription = await asyncio.to_thread(
+            client.remove_group,
             chat_id=chat.platform_chat_id,
             group_id=item.uuid,
         )
     elif item_type == "teacher":
-        subscription = client.remove_teacher(
+        subscription = await asyncio.to_thread(
+            client.remove_teacher,
             chat_id=chat.platform_chat_id,
             teacher_id=item.uuid,
         )
     else:
         raise RuntimeError("Unsupported item type")
 
+    invalidate_subscription_info(chat=chat)
+
     await messages.remove_subscription_items(
         update=update,
         chat=chat,
@@ -282,7 +377,7 @@ async def add_subscription_group(
 
     client = get_current_client()
 
-    faculties = client.read_faculties()
+    faculties = await asyncio.to_thread(client.read_faculties)
 
     await messages.add_subscription_group(
         update=update,
@@ -307,7 +402,7 @@ async def add_subscription_teacher(
 
     client = get_current_client()
 
-    departments = client.read_departments()
+    departments = await asyncio.to_thread(client.read_departments)
 
     await messages.add_subscription_teacher(
         update=update,
@@ -334,9 +429,14 @@ async def select_faculty(
 
     client = get_current_client()
 
-    groups = client.read_groups(
-        faculty_id=faculty.uuid,
-        page=page_number,
+    def read_page(page: int) -> Callable[[], GroupPaginatedResponse]:
+        return functools.partial(client.read_groups, faculty_id=faculty.uuid, page=page)
+
+    prefetcher = prefetch.get_prefetcher()
+
+    groups = await prefetcher.get(
+        key=("read_groups", faculty.uuid, page_number),
+        loader=read_page(page_number),
     )
 
     await messages.select_faculty(
@@ -345,6 +445,15 @@ async def select_faculty(
         groups=groups,
     )
 
+    # Users usually go through pages one by one
+    if groups.meta.has_next and update.effective_chat:
+        prefetcher.prefetch(
+            owner=str(update.effective_chat.id),
+            loaders={
+                ("read_groups", faculty.uuid, page_number + 1): read_page(page_number + 1),
+            },
+        )
+
 
 async def select_department(
     update: "Update",
@@ -364,9 +473,14 @@ async def select_department(
 
     client = get_current_client()
 
-    teachers = client.read_teachers(
-        department_id=department.uuid,
-        page=page_number,
+    def read_page(page: int) -> Callable[[], TeacherPaginatedResponse]:
+        return functools.partial(client.read_teachers, department_id=department.uuid, page=page)
+
+    prefetcher = prefetch.get_prefetcher()
+
+    teachers = await prefetcher.get(
+        key=("read_teachers", department.uuid, page_number),
+        loader=read_page(page_number),
     )
 
     await messages.select_department(
@@ -375,6 +489,15 @@ async def select_department(
         teachers=teachers,
     )
 
+    # Users usually go through pages one by one
+    if teachers.meta.has_next and update.effective_chat:
+        prefetcher.prefetch(
+            owner=str(update.effective_chat.id),
+            loaders={
+                ("read_teachers", department.uuid, page_number + 1): read_page(page_number + 1),
+            },
+        )
+
 
 async def add_subscription_item(
     update: "Update",
@@ -394,33 +517,153 @@ async def add_subscription_item(
     client = get_current_client()
 
     if item_type == "group":
-        client.add_group(
+        await asyncio.to_thread(
+            client.add_group,
             chat_id=chat.platform_chat_id,
             group_id=item.uuid,
         )
     elif item_type == "teacher":
-        client.add_teacher(
+        await asyncio.to_thread(
+            client.add_teacher,
             chat_id=chat.platform_chat_id,
             teacher_id=item.uuid,
         )
     else:
         raise RuntimeError("Unsupported item type")
 
+    invalidate_subscription_info(chat=chat)
+
     return await messages.manage_subscription(
         update=update,
         chat=chat,
     )
 
 
-async def send_day_schedule(chat: Chat, date: datetime.date) -> None:
-    """Gets day schedule from admin service"""
+async def find_catalog_items(query: str) -> list[search.SearchEntry]:
+    """Finds groups and teachers by name"""
+    index = search.get_search_index()
+
+    if len(index):
+        return index.search(query, limit=SEARCH_RESULTS_LIMIT)
+
+    # The index isn't loaded yet, let the admin API filter by name instead
     client = get_current_client()
 
-    schedule_items = client.schedule_day(
-        chat_id=chat.platform_chat_id,
-        date=date,
+    groups, teachers = await asyncio.gather(
+        asyncio.to_thread(client.read_groups, name=query, page_size=SEARCH_RESULTS_LIMIT),
+        asyncio.to_thread(client.read_teachers, name=query, page_size=SEARCH_RESULTS_LIMIT),
     )
 
+    entries = [search.SearchEntry.from_group(group) for group in groups.items]
+    entries.extend(search.SearchEntry.from_teacher(teacher) for teacher in teachers.items)
+
+    return entries[:SEARCH_RESULTS_LIMIT]
+
+
+async def search_catalog(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+) -> None:
+    """
+    Searches groups and teachers to subscribe to.
+
+    Handles `/search <query>`, and plain text messages in private chats.
+    """
+    message = update.effective_message
+    if not message or not message.text:
+        return
+
+    query = " ".join(context.args) if context.args is not None else message.text
+
+    if not query.strip():
+        await message.reply_text(
+            "Введіть частину назви групи або прізвища викладача після команди, "  # noqa: RUF001
+            "наприклад: /search Іванов"
+        )
+        return
+
+    await send_search_results(update=update, query=query)
+
+
+async def send_search_results(update: Update, query: str) -> None:
+    await messages.processing_update(update=update)
+
+    results = await find_catalog_items(query)
+
+    await messages.send_search_results(
+        update=update,
+        query=query,
+        results=results,
+    )
+
+
+async def inline_search(
+    update: Update,
+    _context: ContextTypes.DEFAULT_TYPE,
+) -> None:
+    """Answers inline queries with groups and teachers found by name"""
+    if not update.inline_query:
+        return
+
+    query = update.inline_query.query
+
+    results = await find_catalog_items(query) if query.strip() else []
+
+    await messages.answer_inline_search(update=update, results=results)
+
+
+async def refresh_search_index(
+    _context: ContextTypes.DEFAULT_TYPE,
+) -> None:
+    """Job that reloads the catalog of groups and teachers into the search index"""
+    await asyncio.to_thread(
+        search.refresh_index,
+        index=search.get_search_index(),
+        client=get_current_client(),
+    )
+
+
+async def read_day_schedule(
+    chat: Chat,
+    date: datetime.date,
+) -> tuple[list[DaySchedule | None], datetime.datetime | None]:
+    """
+    Reads day schedule of a chat through the schedule cache.
+
+    Returns schedules and, if they're served from cache (or from the bulk snapshot),
+    since the admin API is unavailable, when they were fetched.
+    """
+    client = get_current_client()
+
+    try:
+        return await schedule_cache.get_schedule_cache().get(
+            key=("day", chat.platform_chat_id, date),
+            loader=functools.partial(client.schedule_day, chat_id=chat.platform_chat_id, date=date),
+        )
+    except ServiceUnavailableError:
+        snapshot = bulk_snapshot.get_snapshot_store().get(date)
+        if snapshot is None or (schedules := snapshot.get(chat.platform_chat_id)) is None:
+            raise
+
+        return schedules, snapshot.created_at
+
+
+async def read_week_schedule(
+    chat: Chat,
+) -> tuple[list[WeekSchedule], datetime.datetime | None]:
+    """Reads week schedule of a chat through the schedule cache (see `read_day_schedule`)"""
+    client = get_current_client()
+
+    return await schedule_cache.get_schedule_cache().get(
+        key=("week", chat.platform_chat_id),
+        loader=functools.partial(client.schedule_week, chat_id=chat.platform_chat_id),
+    )
+
+
+async def send_day_schedule(chat: Chat, date: datetime.date) -> None:
+    """Gets day schedule from admin service"""
+    schedule_items, stale_since = await read_day_schedule(chat=chat, date=date)
+
     sent = False
 
     for item in schedule_items:
@@ -430,6 +673,7 @@ async def send_day_schedule(chat: Chat, date: datetime.date) -> None:
         await messages.send_day_schedule(
             update=get_current_update(),
             day_schedule=item,
+            stale_since=stale_since,
         )
         sent = True
 
@@ -437,6 +681,7 @@ async def send_day_schedule(chat: Chat, date: datetime.date) -> None:
         await messages.send_no_classes_message(
             update=get_current_update(),
             date=date,
+            stale_since=stale_since,
         )
 
 
@@ -478,7 +723,7 @@ async def get_tomorrow_schedule(
     await send_day_schedule(chat=chat, date=tomorrow)
 
 
-async def next_pair(  # noqa: C901
+async def next_pair(
     update: "Update",
     _context: ContextTypes.DEFAULT_TYPE,
 ) -> None:
@@ -497,50 +742,34 @@ async def next_pair(  # noqa: C901
     if not telegram_chat:
         raise RuntimeError("No chat in update")
 
-    client = get_current_client()
-
     chat = await get_chat_info(update=update)
 
     now = utils.current_time_in_kiev()
     today = now.date()
 
-    schedule_items = client.schedule_day(
-        chat_id=chat.platform_chat_id,
-        date=today,
-    )
+    schedule_items, stale_since = await read_day_schedule(chat=chat, date=today)
 
     # Check for today's pairs
     for item in schedule_items:
         if not item:
             continue
 
-        for pair in item.pairs:
-            pair_start_time = datetime.datetime.combine(
-                item.date,
-                PAIR_START_TIME.get(pair.number, datetime.time(hour=0, minute=0)),
-                tzinfo=now.tzinfo,
+        if pair := timetable.next_pair_with_lessons(item, now):
+            await messages.send_pair_details(
+                update=update,
+                pair=pair,
+                day_schedule=item,
+                stale_since=stale_since,
             )
-
-            if pair_start_time < now:
-                continue
-
-            if pair.lessons:
-                await messages.send_pair_details(
-                    update=update,
-                    pair=pair,
-                    day_schedule=item,
-                )
-                return
+            return
 
     delta = 1
 
     # Find the next closest pair in the upcoming days
     while delta <= 7:  # noqa: PLR2004
         date = today + datetime.timedelta(days=delta)
-        schedule_items = client.schedule_day(
-            chat_id=chat.platform_chat_id,
-            date=date,
-        )
+        schedule_items, day_stale_since = await read_day_schedule(chat=chat, date=date)
+        stale_since = stale_since or day_stale_since
 
         for item in schedule_items:
             if not item:
@@ -552,6 +781,7 @@ async def next_pair(  # noqa: C901
                         update=update,
                         pair=pair,
                         day_schedule=item,
+                        stale_since=stale_since,
                     )
                     return
         delta += 1
@@ -559,6 +789,7 @@ async def next_pair(  # noqa: C901
     await messages.send_no_classes_message(
         update=update,
         date=today,
+        stale_since=stale_since,
     )
 
 
@@ -575,13 +806,9 @@ async def get_week_schedule(
     if not telegram_chat:
         raise RuntimeError("No chat in update")
 
-    client = get_current_client()
-
     chat = await get_chat_info(update=update)
 
-    schedule_items = client.schedule_week(
-        chat_id=chat.platform_chat_id,
-    )
+    schedule_items, stale_since = await read_week_schedule(chat=chat)
 
     for item in schedule_items:
         if not item:
@@ -590,6 +817,7 @@ async def get_week_schedule(
         await messages.send_week_schedule(
             update=get_current_update(),
             week_schedule=item,
+            stale_since=stale_since,
         )
 
 
@@ -643,85 +871,613 @@ async def manual_batch_pair_check(
     update: Update,  # noqa: ARG001
     context: ContextTypes.DEFAULT_TYPE,
 ) -> None:
-    await batch_pair_check(context=context)
+    await plan_notifications(context=context)
 
 
-async def process_record(
-    record: dict[str, list[DaySchedule | None]],
-    now: datetime.datetime,
+async def send_chat_notifications(
+    bot: Bot,
+    platform_chat_id: str,
+    chat_notifications: list[notifications.Notification],
+    stats: BatchStats,
+    ledger: outbox.Outbox,
+) -> None:
+    """
+    Sends notifications of a chat (due at the same instant) in one message, unless it's too late.
+
+    Notifications about pairs that already started are sent silently (the message is loud
+    if any of them is on time), and ones about pairs that already ended are dropped.
+    Notifications are marked done in the `ledger` right after that (in a thread, since
+    it commits to the state database).
+    """
+    blocked = blocked_chats.get_blocked_chats()
+    now = utils.current_time_in_kiev()
+
+    def pair_label(notification: notifications.Notification) -> int | str:
+        return notification.pair.number if notification.pair else "digest"
+
+    to_send = []
+    dropped = []
+    for notification in chat_notifications:
+        if now >= notification.expires_at:
+            stats.dropped += 1
+            metrics.NOTIFICATIONS_DROPPED.inc(pair=pair_label(notification))
+            dropped.append(notification)
+        else:
+            to_send.append(notification)
+
+    if dropped:
+        await asyncio.to_thread(ledger.complete, dropped, status="dropped")
+
+    if not to_send:
+        return
+
+    on_time = [now < notification.deadline for notification in to_send]
+
+    chat_id, message_thread_id = utils.split_platform_chat_id(platform_chat_id)
+
+    try:
+        sent_messages = await messages.send_notifications_with_bot(
+            bot=bot,
+            chat_id=chat_id,
+            message_thread_id=message_thread_id,
+            reminders=[(notification.pair, notification.day_schedule) for notification in to_send],
+            disable_notification=not any(on_time),
+        )
+    except (telegram.error.Forbidden, telegram.error.ChatMigrated, telegram.error.BadRequest) as e:
+        if not blocked.add(platform_chat_id, e):
+            # E.g. a malformed message, sending it again (on every drain) would fail the same way
+            await asyncio.to_thread(ledger.complete, to_send, status="failed")
+            raise
+
+        stats.forbidden += 1
+        logger.warning(
+            f"Cannot send message to chat {chat_id} (message_thread_id={message_thread_id}): {e}",
+        )
+        await asyncio.to_thread(ledger.complete, to_send, status="forbidden")
+        return
+
+    # The chat may have been probed after a block
+    blocked.discard(platform_chat_id)
+    await asyncio.to_thread(ledger.complete, to_send, status="sent")
+
+    stats.messages += sent_messages
+    metrics.NOTIFICATION_MESSAGES.inc(sent_messages)
+
+    sent_at = utils.current_time_in_kiev()
+
+    for notification, is_on_time in zip(to_send, on_time, strict=True):
+        stats.sent += 1
+        metrics.NOTIFICATIONS_SENT.inc(pair=pair_label(notification))
+        metrics.NOTIFICATION_LATENESS.observe((sent_at - notification.due_at).total_seconds())
+
+        if is_on_time:
+            metrics.NOTIFICATIONS_ON_TIME.inc(pair=pair_label(notification))
+        else:
+            stats.downgraded += 1
+            metrics.NOTIFICATIONS_DOWNGRADED.inc(pair=pair_label(notification))
+
+
+async def send_notifications_due_at(
+    context: CallbackContext,
+    due_at: datetime.datetime,
+    due: list[notifications.Notification],
+) -> None:
+    """
+    Sends notifications due at the same instant, a message per chat.
+
+    Chats with the earliest deadline go first. Notifications are written to the outbox
+    before sending, those that were already sent (e.g. before a restart) are skipped.
+    Nothing is sent to chats that are known to be blocked.
+    """
+    stats = BatchStats()
+
+    blocked = blocked_chats.get_blocked_chats()
+    # Other replicas may have found blocked chats since the last instant
+    blocked.refresh()
+
+    ledger = outbox.Outbox()
+    # Written in a thread (with its own connection), since an instant may have many of them
+    pending = await asyncio.to_thread(lambda: outbox.Outbox().add(due))
+
+    suppressed: list[notifications.Notification] = []
+    by_chat: dict[str, list[notifications.Notification]] = {}
+    for notification in sorted(pending, key=lambda item: item.deadline):
+        if blocked.is_suppressed(notification.platform_chat_id):
+            suppressed.append(notification)
+        else:
+            by_chat.setdefault(notification.platform_chat_id, []).append(notification)
+
+    if suppressed:
+        stats.suppressed += len(suppressed)
+        metrics.SENDS_SUPPRESSED.inc(len(suppressed), kind="notification")
+        # Nothing is sent to them, so they're marked done in one go
+        await asyncio.to_thread(ledger.complete, suppressed, status="suppressed")
+
+    for platform_chat_id, chat_notifications in by_chat.items():
+        try:
+            await send_chat_notifications(
+                bot=context.bot,
+                platform_chat_id=platform_chat_id,
+                chat_notifications=chat_notifications,
+                stats=stats,
+                ledger=ledger,
+            )
+        except Exception as e:
+            stats.errors += 1
+            logger.error(f"Error sending notification: {e}", exc_info=True)
+            await send_message_to_debug_chat(
+                context=context,
+                message=get_error_message_text(
+                    error=e,
+                    context=context,
+                    base_error_message="Error sending notification",
+                ),
+            )
+
+    if sent := metrics.NOTIFICATIONS_SENT.total():
+        metrics.NOTIFICATIONS_ON_TIME_RATIO.set(metrics.NOTIFICATIONS_ON_TIME.total() / sent)
+
+    logger.info("Notifications due at %s are sent: %s", due_at, stats.as_string())
+
+    await report_blocked_chats(context=context)
+
+
+async def report_blocked_chats(context: CallbackContext) -> None:
+    """Reports chats that were found blocked since the last report, in one go"""
+    blocked = blocked_chats.get_blocked_chats()
+
+    unreported = blocked.unreported()
+    if not unreported:
+        return
+
+    lines = [
+        f"{chat.chat_id}: {chat.reason}"
+        + (f" (to {chat.migrated_to})" if chat.migrated_to else "")
+        + f" - {chat.detail}"
+        for chat in unreported
+    ]
+
+    await send_message_to_debug_chat(
+        context=context,
+        message=(
+            f"{len(unreported)} chat(s) can't receive messages, they're skipped for now:\n"
+            + html.escape("\n".join(lines))
+        ),
+    )
+
+    blocked.mark_reported(unreported)
+
+
+async def send_notifications(
+    context: CallbackContext,
+    due: list[notifications.Notification],
+) -> None:
+    """
+    Sends notifications that are due (called by the scheduler).
+
+    Every replica schedules the same notifications, so each due instant is sent by a single
+    replica. Others wait for it until the last of the pairs ends, and take over if it dies.
+    Messages wait in the bulk lane of the rate limiter, so replies to users go first.
+    """
+    by_due_at: dict[datetime.datetime, list[notifications.Notification]] = {}
+    for notification in due:
+        by_due_at.setdefault(notification.due_at, []).append(notification)
+
+    # When several instants are due at once (e.g. after a restart), the most urgent go first
+    for due_at, items in sorted(
+        by_due_at.items(),
+        key=lambda item: min(notification.deadline for notification in item[1]),
+    ):
+        with rate_limiter.lane(rate_limiter.Lane.BULK):
+            await leader.run_exclusively(
+                name=f"notifications:{due_at.isoformat()}",
+                job=functools.partial(
+                    send_notifications_due_at,
+                    context=context,
+                    due_at=due_at,
+                    due=items,
+                ),
+                deadline=max(notification.expires_at for notification in items).timestamp(),
+            )
+
+
+def _plan_records(
+    planner: notifications.Planner,
+    records: Iterable[dict[str, list[DaySchedule | None]]],
+    stats: BatchStats,
+) -> tuple[list[notifications.Notification], list[Exception]]:
+    planned: list[notifications.Notification] = []
+    errors: list[Exception] = []
+
+    for record in records:
+        try:
+            planned.extend(planner.plan_record(record=record, stats=stats))
+        except Exception as e:
+            stats.errors += 1
+            logger.error(f"Error processing record: {e}", exc_info=True)
+            errors.append(e)
+
+    return planned, errors
+
+
+async def plan_records(
     context: ContextTypes.DEFAULT_TYPE,
+    planner: notifications.Planner,
+    records: Iterable[dict[str, list[DaySchedule | None]]],
+    stats: BatchStats,
+) -> list[notifications.Notification]:
+    """
+    Plans notifications of (validated) bulk records in the bot process.
+
+    Records are consumed in a thread, since reading them (e.g. the bulk schedule stream)
+    and planning don't yield to the event loop. Errors are reported once it's done.
+    """
+    planned, errors = await asyncio.to_thread(_plan_records, planner, records, stats)
+
+    for error in errors:
+        await send_message_to_debug_chat(
+            context=context,
+            message=get_error_message_text(
+                error=error,
+                context=context,
+                base_error_message="Error processing record in batch pair check",
+            ),
+        )
+
+    return planned
+
+
+async def plan_bulk_schedule(
+    context: ContextTypes.DEFAULT_TYPE,
+    planner: notifications.Planner,
+    stats: BatchStats,
+) -> tuple[list[notifications.Notification], list[BatchStats]]:
+    """Fetches the bulk schedule and plans notifications, the schedule is saved as a snapshot"""
+    client = get_current_client()
+
+    snapshot = bulk_snapshot.SnapshotWriter()
+    records = snapshot.tee(client.bulk_schedule_raw())
+
+    planned: list[notifications.Notification] = []
+    shard_stats: list[BatchStats] = []
+
+    if settings.BATCH_WORKER_PROCESSES > 1:
+        planned, shard_stats = await sharding.plan(
+            records=records,
+            planner=planner,
+            shards=settings.BATCH_WORKER_PROCESSES,
+        )
+
+        for item in shard_stats:
+            stats.merge(item)
+    else:
+        planned = await plan_records(
+            context=context,
+            planner=planner,
+            records=(validate_bulk_record(record) for record in records),
+            stats=stats,
+        )
+
+    if snapshot.complete:
+        try:
+            await asyncio.to_thread(snapshot.write, settings.BULK_SNAPSHOT_FILEPATH)
+        except OSError as e:
+            logger.warning("Failed to write bulk snapshot: %r", e)
+
+    return planned, shard_stats
+
+
+def drain_outbox(
+    context: ContextTypes.DEFAULT_TYPE,
+    now: datetime.datetime,
 ) -> None:
-    for chat_id, schedules in record.items():
-        message_thread_id = None
+    """
+    Schedules notifications that weren't sent before a restart (unless their pair started).
 
-        if chat_id.find(":") != -1:
-            chat_id, message_thread_id = chat_id.split(":", 1)  # noqa: PLW2901
-            message_thread_id = int(message_thread_id)
+    They keep their plan, so planning replaces them as usual.
+    """
+    ledger = outbox.Outbox()
+    ledger.purge(before=now.date() - datetime.timedelta(days=1))
+    outbox.PlanStore().purge(before=now - datetime.timedelta(days=2))
 
-        for schedule in schedules:
-            if not schedule:
-                continue
+    by_plan: dict[str, list[notifications.Notification]] = {}
+    for notification in ledger.unfinished(now=now):
+        by_plan.setdefault(notification.plan, []).append(notification)
+
+    if not by_plan:
+        return
 
-            for pair in schedule.pairs:
-                pair_start_time = datetime.datetime.combine(
-                    schedule.date,
-                    PAIR_START_TIME.get(pair.number, datetime.time(hour=0, minute=0)),
-                    tzinfo=now.tzinfo,
-                )
+    notification_scheduler = scheduler.get_scheduler()
 
-                if pair_start_time < now:
-                    continue
+    for plan, items in by_plan.items():
+        logger.info("Draining %s unsent notifications of %s from the outbox", len(items), plan)
+        notification_scheduler.replace(plan=plan, notifications=items)
 
-                if pair.lessons:
-                    try:
-                        await messages.send_pair_details_with_bot(
-                            bot=context.bot,
-                            chat_id=chat_id,
-                            message_thread_id=message_thread_id,
-                            pair=pair,
-                            day_schedule=schedule,
-                        )
-                    except telegram.error.Forbidden as e:
-                        logger.warning(
-                            f"Cannot send message to chat {chat_id} "
-                            f"(message_thread_id={message_thread_id}): {e}",
-                        )
-                # Only send the next upcoming pair for each schedule
-                break
-
-
-async def batch_pair_check(
+    if context.job_queue:
+        notification_scheduler.arm(context.job_queue, send_notifications)
+
+
+async def plan_notifications(
     context: ContextTypes.DEFAULT_TYPE,
+    catch_up: bool = False,
 ) -> None:
+    """
+    Plans today's notifications (and digests) from bulk schedules and (re-)arms the scheduler.
+
+    Planning replaces notifications planned earlier today, so schedule changes are picked up.
+    If the bulk schedule can't be fetched, the snapshot of the last one is used (if it's
+    today's). Planned notifications are stored, so other replicas load them (see `load_plan`).
+    With `catch_up` (right after a restart), reminders that are overdue are planned too.
+    """
     start_time = time.time()
 
-    client = get_current_client()
+    now = utils.current_time_in_kiev()
+
+    planner = notifications.Planner(
+        plan=day_plan(now.date()),
+        now=now,
+        reminder_modes=await get_reminder_modes(),
+        catch_up=catch_up,
+        digest_time=settings.DIGEST_TIME,
+    )
+
+    notification_scheduler = scheduler.get_scheduler()
+    snapshots = bulk_snapshot.get_snapshot_store()
+
+    stats = BatchStats()
+    source = "bulk schedule"
+
+    try:
+        planned, shard_stats = await plan_bulk_schedule(
+            context=context,
+            planner=planner,
+            stats=stats,
+        )
+    except (ServiceUnavailableError, httpx.HTTPError) as e:
+        snapshot = snapshots.get(now.date())
+        if snapshot is None:
+            raise
+
+        logger.warning("Failed to fetch bulk schedule, planning from the snapshot: %r", e)
+        source = f"snapshot of {snapshot.created_at.strftime('%H:%M')} (bulk schedule failed)"
+
+        stats = BatchStats()
+        shard_stats = []
+        planned = await plan_records(
+            context=context,
+            planner=planner,
+            records=snapshot.records(),
+            stats=stats,
+        )
+
+    # Written in a thread (with its own connection), since there may be many of them
+    await asyncio.to_thread(lambda: outbox.PlanStore().replace(planner.plan, planned))
+
+    notification_scheduler.replace(plan=planner.plan, notifications=planned)
+
+    if context.job_queue:
+        notification_scheduler.arm(context.job_queue, send_notifications)
+
+    end_time = time.time()
+
+    duration = end_time - start_time
+
+    message = (
+        f"Notifications planned from {source} in {round(duration, 2)} seconds.\n"
+        f"{stats.as_string()}\n"
+        f"Pending notifications: {len(notification_scheduler)}"
+    )
+    for shard, item in enumerate(shard_stats):
+        message += f"\nShard {shard}: {item.as_string()}"
+
+    await send_message_to_debug_chat(
+        context=context,
+        message=message,
+    )
+
+
+def day_plan(date: datetime.date) -> str:
+    return f"day:{date.isoformat()}"
 
-    batch_generator = client.bulk_schedule()
 
+async def load_plan(
+    context: ContextTypes.DEFAULT_TYPE,
+    plan: str,
+) -> bool:
+    """
+    Schedules stored notifications of a plan (made by any replica), returns whether it's stored.
+
+    Each replica keeps its own schedule of notifications, so any of them can send
+    a due instant (see `send_notifications`).
+    """
     now = utils.current_time_in_kiev()
 
-    for record in batch_generator:
+    planned = await asyncio.to_thread(lambda: outbox.PlanStore().get(plan, now=now))
+    if planned is None:
+        return False
+
+    logger.info("Loaded %s notifications of %s planned by a replica", len(planned), plan)
+
+    notification_scheduler = scheduler.get_scheduler()
+    notification_scheduler.replace(plan=plan, notifications=planned)
+
+    if context.job_queue:
+        notification_scheduler.arm(context.job_queue, send_notifications)
+
+    return True
+
+
+async def periodic_plan_notifications(
+    context: ContextTypes.DEFAULT_TYPE,
+) -> None:
+    """
+    Job that runs `plan_notifications` on a single replica per planning round.
+
+    Other replicas wait for it and load the stored plan. If the planning replica dies
+    (or fails), one of them takes over. Right after a restart (`catch_up`), the stored
+    plan (or, if there's none, the bulk snapshot) is scheduled before that, so
+    notifications that are due soon don't wait for the bulk schedule.
+    """
+    data = context.job.data if context.job and isinstance(context.job.data, dict) else {}
+    catch_up = bool(data.get("catch_up"))
+
+    now = utils.current_time_in_kiev()
+    plan = day_plan(now.date())
+
+    if catch_up:
+        drain_outbox(context=context, now=now)
+
+    if (
+        catch_up
+        and not await load_plan(context=context, plan=plan)
+        and (snapshot := bulk_snapshot.get_snapshot_store().get(now.date()))
+    ):
+        notification_scheduler = scheduler.get_scheduler()
+        notification_scheduler.replace(
+            plan=plan,
+            notifications=await plan_records(
+                context=context,
+                planner=notifications.Planner(
+                    plan=plan,
+                    now=now,
+                    reminder_modes=await get_reminder_modes(),
+                    catch_up=True,
+                    digest_time=settings.DIGEST_TIME,
+                ),
+                records=snapshot.records(),
+                stats=BatchStats(),
+            ),
+        )
+
+        if context.job_queue:
+            notification_scheduler.arm(context.job_queue, send_notifications)
+
+    planned_here = await leader.run_exclusively(
+        name=f"plan:{plan}:{data.get('round', 'startup')}",
+        job=functools.partial(plan_notifications, context=context, catch_up=catch_up),
+        deadline=time.time() + NOTIFICATION_PLAN_WAIT,
+    )
+
+    if not planned_here:
+        await load_plan(context=context, plan=plan)
+
+
+async def plan_evening_reminders(
+    context: ContextTypes.DEFAULT_TYPE,
+) -> None:
+    """
+    Job that plans reminders about tomorrow's pairs for chats that chose the evening mode.
+
+    They're planned by a single replica, others load the stored plan (see `load_plan`).
+    """
+    tomorrow = utils.current_time_in_kiev().date() + datetime.timedelta(days=1)
+
+    planned_here = await leader.run_exclusively(
+        name=f"plan:{evening_plan(tomorrow)}",
+        job=functools.partial(plan_tomorrow_reminders, context=context, tomorrow=tomorrow),
+        deadline=time.time() + NOTIFICATION_PLAN_WAIT,
+    )
+
+    if not planned_here:
+        await load_plan(context=context, plan=evening_plan(tomorrow))
+
+
+def evening_plan(date: datetime.date) -> str:
+    return f"evening:{date.isoformat()}"
+
+
+async def plan_tomorrow_reminders(
+    context: ContextTypes.DEFAULT_TYPE,
+    tomorrow: datetime.date,
+) -> None:
+    """
+    Plans reminders (due right away) about pairs of `tomorrow` for chats in the evening mode.
+
+    The bulk schedule only covers today, so schedules are read chat by chat,
+    at most `EVENING_REMINDER_CONCURRENCY` at once.
+    """
+    start_time = time.time()
+    client = get_current_client()
+
+    planner = notifications.Planner(
+        plan=evening_plan(tomorrow),
+        now=datetime.datetime.combine(
+            tomorrow - datetime.timedelta(days=1),
+            settings.EVENING_REMINDER_TIME,
+            tzinfo=utils.KYIV_TIMEZONE,
+        ),
+        reminder_modes={},
+    )
+    stats = BatchStats()
+    slots = asyncio.Semaphore(settings.EVENING_REMINDER_CONCURRENCY)
+
+    async def read_schedules(platform_chat_id: str) -> list[DaySchedule | None]:
+        async with slots:
+            subscription = await asyncio.to_thread(
+                client.get_subscription, chat_id=platform_chat_id
+            )
+            if not subscription.is_active:
+                return []
+
+            return await asyncio.to_thread(
+                client.schedule_day, chat_id=platform_chat_id, date=tomorrow
+            )
+
+    async def plan_chat(platform_chat_id: str) -> list[notifications.Notification]:
         try:
-            await process_record(record=record, now=now, context=context)
+            schedules = await read_schedules(platform_chat_id)
+        except SubscriptionNotFoundError:
+            return []
         except Exception as e:
-            logger.error(f"Error processing record: {e}", exc_info=True)
+            stats.errors += 1
+            logger.error(f"Error planning evening reminders: {e}", exc_info=True)
             await send_message_to_debug_chat(
                 context=context,
                 message=get_error_message_text(
                     error=e,
                     context=context,
-                    base_error_message="Error processing record in batch pair check",
+                    base_error_message=f"Error planning evening reminders of {platform_chat_id}",
                 ),
             )
+            return []
+
+        stats.chats += 1
+
+        return [
+            notification
+            for schedule in schedules
+            if schedule
+            for notification in planner.plan_schedule(
+                platform_chat_id=platform_chat_id,
+                schedule=schedule,
+                lead_time=None,
+            )
+        ]
 
-    end_time = time.time()
+    results = await asyncio.gather(
+        *(
+            plan_chat(platform_chat_id)
+            for platform_chat_id, mode in (await get_reminder_modes()).items()
+            if mode == preferences.ReminderMode.EVENING_BEFORE
+        )
+    )
+    planned = [notification for result in results for notification in result]
+    stats.planned = len(planned)
 
-    duration = end_time - start_time
+    await asyncio.to_thread(lambda: outbox.PlanStore().replace(planner.plan, planned))
+
+    notification_scheduler = scheduler.get_scheduler()
+    notification_scheduler.replace(plan=planner.plan, notifications=planned)
+
+    if context.job_queue:
+        notification_scheduler.arm(context.job_queue, send_notifications)
 
     await send_message_to_debug_chat(
         context=context,
-        message=f"Batch pair check completed in {round(duration, 2)} seconds.",
+        message=(
+            f"Evening reminders for {tomorrow.isoformat()} planned "
+            f"in {round(time.time() - start_time, 2)} seconds.\n{stats.as_string()}"
+        ),
     )
 
 
@@ -736,14 +1492,47 @@ async def toggle_subscription(
 
     client = get_current_client()
 
-    subscription = client.toggle_subscription(chat_id=chat.platform_chat_id)
+    subscription = await asyncio.to_thread(
+        client.toggle_subscription, chat_id=chat.platform_chat_id
+    )
+    invalidate_subscription_info(chat=chat)
 
     await messages.start_command(
         update=update,
         chat=chat,
         subscription=subscription,
+        reminder_mode=await get_reminder_mode(chat=chat),
+    )
+
+    prefetch_chat_info(chat=chat)
+
+
+async def set_reminder_mode(
+    update: Update,
+    _context: ContextTypes.DEFAULT_TYPE,
+) -> None:
+    """Switches to the next reminder mode (how long before a pair a chat is notified)"""
+    await messages.processing_update(update=update)
+
+    chat = await get_chat_info(update=update)
+
+    client = get_current_client()
+
+    reminder_mode = await asyncio.to_thread(
+        lambda: preferences.PreferencesStore().next_reminder_mode(chat.platform_chat_id)
     )
 
+    subscription = await asyncio.to_thread(client.get_subscription, chat_id=chat.platform_chat_id)
+
+    await messages.start_command(
+        update=update,
+        chat=chat,
+        subscription=subscription,
+        reminder_mode=reminder_mode,
+    )
+
+    prefetch_chat_info(chat=chat)
+
 
 async def send_message_campaign(
     update: Update,
@@ -763,7 +1552,9 @@ async def send_message_campaign(
 
     client = get_current_client()
 
-    message_campaign = client.read_message_campaign(message_campaign_id=UUID(arguments[1]))
+    message_campaign = await asyncio.to_thread(
+        client.read_message_campaign, message_campaign_id=UUID(arguments[1])
+    )
 
     if not context.application.job_queue:
         return
@@ -773,18 +1564,40 @@ async def send_message_campaign(
         f"Відправка до {len(message_campaign.recipients)} отримувачів."
     )
 
-    context.application.job_queue.run_once(
+    schedule_message_campaign(
+        application=context.application,
+        message_campaign_id=str(message_campaign.uuid),
+    )
+
+
+def schedule_message_campaign(
+    application: "Application",
+    message_campaign_id: str,
+) -> None:
+    """Adds a job that sends (or resumes sending) a message campaign"""
+    if not application.job_queue:
+        return
+
+    application.job_queue.run_once(
         send_messages_for_campaign,
         when=5,
         data={
-            "name": message_campaign.name,
-            "payload": message_campaign.payload,
-            "recipients": message_campaign.recipients,
+            "uuid": message_campaign_id,
         },
-        name=f"Send Message Campaign ({message_campaign.uuid})",
+        name=f"Send Message Campaign ({message_campaign_id})",
     )
 
 
+async def resume_message_campaigns(application: "Application") -> None:
+    """Re-schedules campaigns that were interrupted by a restart"""
+    for message_campaign_id in campaigns.CampaignProgressStore.unfinished():
+        logger.info("Resuming message campaign %s", message_campaign_id)
+        schedule_message_campaign(
+            application=application,
+            message_campaign_id=message_campaign_id,
+        )
+
+
 async def send_messages_for_campaign(
     context: CallbackContext,
 ) -> None:
@@ -794,38 +1607,94 @@ async def send_messages_for_campaign(
 
     data = SendMessageCampaignDTO.model_validate(context.job.data)
 
-    for recipient in data.recipients:
-        message_thread_id = None
-        chat_id = recipient.platform_chat_id
+    # Don't wait for other replicas, whoever gets the campaign first sends it
+    with rate_limiter.lane(rate_limiter.Lane.BULK):
+        await leader.run_exclusively(
+            name=f"campaign:{data.uuid}",
+            job=functools.partial(send_campaign, context=context, message_campaign_id=data.uuid),
+            deadline=time.time(),
+        )
 
-        if ":" in chat_id:
-            chat_id, message_thread_id = chat_id.split(":")
 
-        try:
-            await context.bot.send_message(
-                chat_id=recipient.platform_chat_id,
-                message_thread_id=message_thread_id,
-                text=f"Повідомлення: {data.name}\n\n{data.payload.get('message')}",
-                disable_notification=True,
-                parse_mode=ParseMode.HTML,
-            )
-        except Exception as e:  # noqa: BLE001
-            text = get_error_message_text(
-                e,
+async def send_campaign(
+    context: CallbackContext,
+    message_campaign_id: UUID,
+) -> None:
+    """
+    Sends a message campaign to all of its (not yet processed) recipients.
+
+    Recipients that weren't reached because of network errors are retried
+    in up to `CAMPAIGN_MAX_PASSES` passes, `CAMPAIGN_RETRY_INTERVAL` apart.
+    """
+    client = get_current_client()
+
+    try:
+        message_campaign = await asyncio.to_thread(
+            client.read_message_campaign, message_campaign_id=message_campaign_id
+        )
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code != httpx.codes.NOT_FOUND:
+            raise
+
+        # E.g. deleted in the admin panel, it would be resumed (and fail) on every start
+        logger.warning("Message campaign %s doesn't exist anymore", message_campaign_id)
+        campaigns.CampaignProgressStore(campaign_id=str(message_campaign_id)).finish(
+            status=campaigns.CAMPAIGN_FAILED
+        )
+        await send_message_to_debug_chat(
+            context=context,
+            message=f"Розсилку {message_campaign_id} не знайдено, її скасовано.",
+        )
+        return
+
+    async def report_error(error: Exception) -> None:
+        await send_message_to_debug_chat(
+            context=context,
+            message=get_error_message_text(
+                error,
                 context=context,
                 base_error_message="Exception in campaign processing",
-            )
-            await send_message_to_debug_chat(
-                context=context,
-                message=text,
-            )
-            continue
+            ),
+        )
+
+    sender = campaigns.CampaignSender(
+        bot=context.bot,
+        campaign_id=str(message_campaign.uuid),
+        name=message_campaign.name,
+        text=campaigns.render_campaign_message(
+            name=message_campaign.name,
+            payload=message_campaign.payload,
+        ),
+        total=len(message_campaign.recipients),
+        report=functools.partial(send_message_to_debug_chat, context),
+        report_error=report_error,
+    )
+
+    for attempt in range(1, settings.CAMPAIGN_MAX_PASSES + 1):
+        await sender.run(campaigns.iter_recipient_pages(message_campaign.recipients))
+
+        if not sender.unreached or attempt == settings.CAMPAIGN_MAX_PASSES:
+            break
+
+        await send_message_to_debug_chat(
+            context=context,
+            message=(
+                f"Розсилку буде повторено через {settings.CAMPAIGN_RETRY_INTERVAL:.0f} сек. "
+                f"для {sender.unreached} отримувачів.\n\n{sender.progress_text()}"
+            ),
+        )
+        await asyncio.sleep(settings.CAMPAIGN_RETRY_INTERVAL)
+
+    # Recipients still unreached after the last pass are given up on
+    sender.progress.finish()
 
     await context.bot.send_message(
         chat_id=settings.DEBUG_CHAT_ID,
-        text="Розсилка компанії завершена.",
+        text=f"Розсилка компанії завершена.\n\n{sender.progress_text()}",
     )
 
+    await report_blocked_chats(context=context)
+
 
 def get_error_message_text(
     error: Exception,
@@ -853,6 +1722,20 @@ def get_error_message_text(
     )
 
 
+async def send_metrics(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+) -> None:
+    """Sends metrics of this replica to the debug chat"""
+    if not update.message or update.message.chat_id != settings.DEBUG_CHAT_ID:
+        return
+
+    await send_message_to_debug_chat(
+        context=context,
+        message=f"<pre>{html.escape(metrics.render())}</pre>",
+    )
+
+
 async def send_message_to_debug_chat(
     context: ContextTypes.DEFAULT_TYPE,
     message: str,
@@ -871,14 +1754,49 @@ async def send_message_to_debug_chat(
         )
 
 
+async def finish_update(
+    update: Update,
+    _context: ContextTypes.DEFAULT_TYPE,
+) -> None:
+    """
+    Runs after every handled update (including failed ones).
+
+    Answers the callback query, if the handler didn't send its response with an edit.
+    A chat that sent an update isn't blocked anymore.
+    """
+    await messages.finish_processing()
+
+    # The update about the bot being blocked (or removed from a group) isn't one
+    member = update.my_chat_member
+    if member and member.new_chat_member.status in (ChatMemberStatus.BANNED, ChatMemberStatus.LEFT):
+        return
+
+    if update.effective_chat:
+        blocked_chats.get_blocked_chats().discard(str(update.effective_chat.id))
+
+
 async def error_handler(
     update: object,
     context: ContextTypes.DEFAULT_TYPE,
 ) -> None:
-    logger.error("Exception while handling an update:", exc_info=context.error)
-
     assert context.error is not None
 
+    if isinstance(context.error, ServiceUnavailableError):
+        # Expected while the admin API is down, users get a short reply instead of a report
+        logger.warning("Admin API is unavailable while handling an update: %s", context.error)
+
+        if isinstance(update, Update) and update.effective_chat:
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text=(
+                    "Сервіс розкладу тимчасово недоступний, спробуйте трохи пізніше.\n"
+                    "Ви можете перевірити його стан за посиланням: https://rozklad.ontu.edu.ua"
+                ),
+            )
+        return
+
+    logger.error("Exception while handling an update:", exc_info=context.error)
+
     message = get_error_message_text(
         error=context.error,
         context=context,
@@ -0,0 +1,104 @@
+"""
+Fingerprints of what the bot's messages currently show.
+
+Users often re-tap the same button (or toggle something back and forth), so a message
+would be edited to exactly what it already shows. Such edits are skipped: every sent or
+edited message is remembered by a fingerprint of its text and keyboard.
+
+Fingerprints are kept in the state database: updates of a chat may be handled by any
+replica, so a message may have been changed by another one since this one edited it.
+"""
+
+import functools
+import hashlib
+import sqlite3
+import time
+
+from telegram import InlineKeyboardMarkup
+
+from ontu_schedule_bot import storage
+from ontu_schedule_bot.settings import settings
+
+type MessageKey = tuple[int, int]
+
+# Fingerprints over the limit are forgotten once per this many remembered ones
+PRUNE_EVERY = 100
+
+
+def create_tables(connection: sqlite3.Connection) -> None:
+    with connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS message_fingerprints ("
+            "chat_id INTEGER NOT NULL, "
+            "message_id INTEGER NOT NULL, "
+            "fingerprint BLOB NOT NULL, "
+            "updated_at REAL NOT NULL, "
+            "PRIMARY KEY (chat_id, message_id))"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS message_fingerprints_updated_at "
+            "ON message_fingerprints (updated_at)"
+        )
+
+
+def fingerprint(text: str, reply_markup: InlineKeyboardMarkup | None) -> bytes:
+    """
+    Hashes text and keyboard of a message.
+
+    Callback data is included: the same buttons with other data must still be edited.
+    """
+    markup = repr(reply_markup.to_dict()) if reply_markup else ""
+
+    return hashlib.blake2b(f"{text}\0{markup}".encode(), digest_size=16).digest()
+
+
+class FingerprintStore:
+    """
+    Fingerprints by (chat ID, message ID), least recently remembered are forgotten.
+
+    Methods are blocking (and may be called from any thread).
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.remembered = 0
+
+        create_tables(storage.get_connection())
+
+    def is_shown(self, key: MessageKey, value: bytes) -> bool:
+        """Returns whether the message already shows content with this fingerprint"""
+        row = (
+            storage.get_connection()
+            .execute(
+                "SELECT fingerprint FROM message_fingerprints WHERE chat_id = ? AND message_id = ?",
+                key,
+            )
+            .fetchone()
+        )
+
+        return row is not None and row[0] == value
+
+    def remember(self, key: MessageKey, value: bytes) -> None:
+        connection = storage.get_connection()
+
+        with connection:
+            connection.execute(
+                "INSERT INTO message_fingerprints (chat_id, message_id, fingerprint, updated_at) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (chat_id, message_id) DO UPDATE SET "
+                "fingerprint = excluded.fingerprint, updated_at = excluded.updated_at",
+                (*key, value, time.time()),
+            )
+
+            self.remembered += 1
+            if self.remembered % PRUNE_EVERY == 0:
+                connection.execute(
+                    "DELETE FROM message_fingerprints WHERE updated_at < ("
+                    "SELECT updated_at FROM message_fingerprints "
+                    "ORDER BY updated_at DESC LIMIT 1 OFFSET ?)",
+                    (self.max_entries - 1,),
+                )
+
+
+@functools.cache
+def get_fingerprint_store() -> FingerprintStore:
+    return FingerprintStore(max_entries=settings.EDIT_FINGERPRINTS_MAX_ENTRIES)
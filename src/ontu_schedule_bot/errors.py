@@ -28,3 +28,13 @@ class SubscriptionNotFoundError(EntityNotFoundError):
             f"Subscription not found for {self.chat_id=} in request: "
             f"{self.request.method} {self.request.url}"
         )
+
+
+class ServiceUnavailableError(Exception):
+    """Raised when the admin API is unavailable (failing, or its circuit breaker is open)."""
+
+    def __init__(self, endpoint: str, retry_after: float = 0.0) -> None:
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+        super().__init__(f"Admin API is unavailable ({endpoint}), retry after {retry_after:.0f} s")
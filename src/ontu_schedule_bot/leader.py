@@ -0,0 +1,192 @@
+"""
+Leader election between bot replicas.
+
+Periodic work is guarded by named leases: only the replica holding a lease runs the work,
+others keep watching the lease and take it over if the holder stops renewing it (dies).
+"""
+
+import abc
+import asyncio
+import functools
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+
+from ontu_schedule_bot import storage
+from ontu_schedule_bot.settings import settings
+
+logger = logging.getLogger(__name__)
+
+REPLICA_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Completed leases are kept for a while, so a late replica doesn't redo the work
+COMPLETED_LEASE_RETENTION = 7 * 24 * 60 * 60
+
+
+class Lease(abc.ABC):
+    """Interface of a lease backend"""
+
+    @abc.abstractmethod
+    def acquire(self, name: str, ttl: float) -> bool:
+        """Acquires (or renews) a lease for `ttl` seconds. Returns whether this replica holds it"""
+
+    @abc.abstractmethod
+    def release(self, name: str) -> None:
+        """Releases a lease, so another replica may acquire it right away"""
+
+    @abc.abstractmethod
+    def complete(self, name: str) -> None:
+        """Marks the work guarded by a lease as done, so nobody acquires it again"""
+
+    @abc.abstractmethod
+    def is_completed(self, name: str) -> bool:
+        pass
+
+
+class LocalLease(Lease):
+    """Lease for a single replica deployment, always acquired"""
+
+    def acquire(self, name: str, ttl: float) -> bool:  # noqa: ARG002
+        return True
+
+    def release(self, name: str) -> None:
+        pass
+
+    def complete(self, name: str) -> None:
+        pass
+
+    def is_completed(self, name: str) -> bool:  # noqa: ARG002
+        return False
+
+
+class SQLiteLease(Lease):
+    """Lease stored in the state database, works for replicas on a single host"""
+
+    def __init__(self) -> None:
+        create_tables(storage.get_connection())
+
+    def acquire(self, name: str, ttl: float) -> bool:
+        connection = storage.get_connection()
+        now = time.time()
+
+        with connection:
+            connection.execute(
+                "INSERT INTO leases (name, holder, expires_at, completed) VALUES (?, ?, ?, 0) "
+                "ON CONFLICT (name) DO UPDATE SET "
+                "holder = excluded.holder, expires_at = excluded.expires_at "
+                "WHERE leases.completed = 0 "
+                "AND (leases.holder = excluded.holder OR leases.expires_at < ?)",
+                (name, REPLICA_ID, now + ttl, now),
+            )
+            row = connection.execute(
+                "SELECT holder, completed FROM leases WHERE name = ?",
+                (name,),
+            ).fetchone()
+
+        return row == (REPLICA_ID, 0)
+
+    def release(self, name: str) -> None:
+        connection = storage.get_connection()
+
+        with connection:
+            connection.execute(
+                "UPDATE leases SET expires_at = 0 WHERE name = ? AND holder = ?",
+                (name, REPLICA_ID),
+            )
+
+    def complete(self, name: str) -> None:
+        connection = storage.get_connection()
+        now = time.time()
+
+        with connection:
+            connection.execute(
+                "UPDATE leases SET completed = 1, expires_at = ? WHERE name = ? AND holder = ?",
+                (now, name, REPLICA_ID),
+            )
+            connection.execute(
+                "DELETE FROM leases WHERE completed = 1 AND expires_at < ?",
+                (now - COMPLETED_LEASE_RETENTION,),
+            )
+
+    def is_completed(self, name: str) -> bool:
+        row = (
+            storage.get_connection()
+            .execute(
+                "SELECT completed FROM leases WHERE name = ?",
+                (name,),
+            )
+            .fetchone()
+        )
+
+        return bool(row and row[0])
+
+
+def create_tables(connection: sqlite3.Connection) -> None:
+    with connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            "name TEXT PRIMARY KEY, "
+            "holder TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, "
+            "completed INTEGER NOT NULL DEFAULT 0)"
+        )
+
+
+LEASE_BACKENDS: dict[str, Callable[[], Lease]] = {
+    "none": LocalLease,
+    "sqlite": SQLiteLease,
+}
+
+
+@functools.cache
+def get_lease() -> Lease:
+    return LEASE_BACKENDS[settings.LEADER_ELECTION]()
+
+
+async def _renew(lease: Lease, name: str, ttl: float) -> None:
+    while True:
+        await asyncio.sleep(ttl / 3)
+
+        if not await asyncio.to_thread(lease.acquire, name, ttl):
+            logger.error("Lost lease %s, it may be taken over by another replica", name)
+
+
+async def run_exclusively(
+    name: str,
+    job: Callable[[], Awaitable[None]],
+    deadline: float,
+) -> bool:
+    """
+    Runs `job` on a single replica.
+
+    Replicas that didn't get the lease keep polling it until the job is completed
+    or `deadline` (a timestamp) passes. If the holder dies, its lease expires and
+    one of them takes over. Returns whether the job was run by this replica.
+    """
+    lease = get_lease()
+    ttl = settings.LEADER_LEASE_TTL
+
+    while not await asyncio.to_thread(lease.acquire, name, ttl):
+        if await asyncio.to_thread(lease.is_completed, name) or time.time() >= deadline:
+            logger.info("Lease %s is held by another replica, skipping", name)
+            return False
+
+        await asyncio.sleep(ttl / 3)
+
+    renewer = asyncio.create_task(_renew(lease, name, ttl))
+
+    try:
+        await job()
+    except BaseException:
+        await asyncio.to_thread(lease.release, name)
+        raise
+    finally:
+        renewer.cancel()
+
+    await asyncio.to_thread(lease.complete, name)
+
+    return True
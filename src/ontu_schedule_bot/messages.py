@@ -1,8 +1,22 @@
+import asyncio
+import contextvars
 import datetime
+import html
+from typing import TYPE_CHECKING
+
+import telegram.error
+from telegram import (
+    Bot,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+    Message,
+    Update,
+)
 
-from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Message, Update
-
-from ontu_schedule_bot import utils
+from ontu_schedule_bot import edit_fingerprints, metrics, utils
+from ontu_schedule_bot.settings import settings
 from ontu_schedule_bot.third_party.admin.schemas import (
     Chat,
     DaySchedule,
@@ -15,6 +29,71 @@ from ontu_schedule_bot.third_party.admin.schemas import (
     WeekSchedule,
 )
 
+if TYPE_CHECKING:
+    from ontu_schedule_bot.preferences import ReminderMode
+    from ontu_schedule_bot.search import SearchEntry
+
+
+def stale_notice(stale_since: datetime.datetime | None) -> str:
+    """Returns a warning for a schedule served from cache, since the admin API is unavailable"""
+    if stale_since is None:
+        return ""
+
+    return (
+        "\n\n⚠️ Сервіс розкладу зараз недоступний, показано розклад "
+        f"станом на {stale_since.strftime('%d.%m %H:%M')}"
+    )
+
+
+class _ProcessingIndicator:
+    """
+    Shows that an update is being handled, but only if it takes a while.
+
+    "Typing" (and an answer to the callback query) is sent once the update has been handled
+    for `PROCESSING_INDICATOR_DELAY`. Otherwise, the callback query is answered
+    by `finish_processing`, right after the response.
+    """
+
+    __slots__ = ("answered", "shown", "task", "update")
+
+    def __init__(self, update: "Update", delay: float) -> None:
+        self.update = update
+        self.answered = False
+        self.shown = False
+        self.task = asyncio.create_task(self.show_after(delay))
+
+    async def show_after(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+
+        self.shown = True
+        metrics.PROCESSING_INDICATORS.inc(result="shown")
+
+        if chat := self.update.effective_chat:
+            await chat.send_chat_action(action="typing")
+
+        await self.answer(text="Будь-ласка, зачекайте...")
+
+    async def answer(self, text: str | None = None) -> None:
+        if self.answered or not self.update.callback_query:
+            return
+
+        self.answered = True
+        await self.update.callback_query.answer(text=text)
+
+    async def finish(self) -> None:
+        if not self.shown:
+            # Not sent yet, so there is nothing to interrupt
+            self.task.cancel()
+            metrics.PROCESSING_INDICATORS.inc(result="skipped")
+
+        await self.answer()
+
+
+# Set per update, every update is handled in its own task
+_processing_indicator: contextvars.ContextVar[_ProcessingIndicator | None] = contextvars.ContextVar(
+    "processing_indicator", default=None
+)
+
 
 async def processing_update(
     update: "Update",
@@ -23,12 +102,19 @@ async def processing_update(
     if chat is None:
         return
 
-    await chat.send_chat_action(action="typing")
+    _processing_indicator.set(
+        _ProcessingIndicator(update=update, delay=settings.PROCESSING_INDICATOR_DELAY)
+    )
+
 
-    if update.callback_query:
-        await update.callback_query.answer(
-            text="Будь-ласка, зачекайте...",
-        )
+async def finish_processing() -> None:
+    """Answers the callback query of the current update, if it wasn't answered yet"""
+    indicator = _processing_indicator.get()
+    if indicator is None:
+        return
+
+    _processing_indicator.set(None)
+    await indicator.finish()
 
 
 async def edit_or_reply(
@@ -36,40 +122,78 @@ async def edit_or_reply(
     text: str,
     reply_markup: InlineKeyboardMarkup | None = None,
 ) -> Message:
+    """Sends the response, the callback query is answered right after it"""
+    result = await _edit_or_reply(update=update, text=text, reply_markup=reply_markup)
+
+    await finish_processing()
+
+    return result
+
+
+async def _edit_or_reply(
+    update: "Update",
+    text: str,
+    reply_markup: InlineKeyboardMarkup | None = None,
+) -> Message:
+    fingerprints = edit_fingerprints.get_fingerprint_store()
+
     if query := update.callback_query:  # noqa: SIM102
         if (update_message := query.message) and update_message.is_accessible:
             assert isinstance(update_message, Message)
 
-            result = await update_message.edit_text(
-                text=text,
-                reply_markup=reply_markup,
-            )
+            key = (update_message.chat_id, update_message.message_id)
+            content = edit_fingerprints.fingerprint(text, reply_markup)
+
+            if await asyncio.to_thread(fingerprints.is_shown, key, content):
+                metrics.MESSAGE_EDITS_AVOIDED.inc()
+                return update_message
+
+            try:
+                result = await update_message.edit_text(
+                    text=text,
+                    reply_markup=reply_markup,
+                )
+            except telegram.error.BadRequest as e:
+                # Shown before the bot started remembering it
+                if "message is not modified" not in e.message.lower():
+                    raise
+
+                await asyncio.to_thread(fingerprints.remember, key, content)
+                return update_message
 
             if isinstance(result, bool):
                 raise RuntimeError("Edited a non-bot message")
 
+            await asyncio.to_thread(fingerprints.remember, key, content)
             return result
 
     if update.effective_message:
-        return await update.effective_message.reply_html(
+        result = await update.effective_message.reply_html(
             text=text,
             reply_markup=reply_markup,
         )
-
-    if update.effective_chat:
-        return await update.effective_chat.send_message(
+    elif update.effective_chat:
+        result = await update.effective_chat.send_message(
             text=text,
             reply_markup=reply_markup,
             parse_mode="HTML",
         )
+    else:
+        raise RuntimeError("No message to edit or reply to")
 
-    raise RuntimeError("No message to edit or reply to")
+    await asyncio.to_thread(
+        fingerprints.remember,
+        (result.chat_id, result.message_id),
+        edit_fingerprints.fingerprint(text, reply_markup),
+    )
+    return result
 
 
 async def start_command(
     update: "Update",
     chat: "Chat",
     subscription: "Subscription",
+    reminder_mode: "ReminderMode",
 ) -> None:
     subscription_text = "Ви не підписані на розклад"
     keyboard = []
@@ -91,6 +215,14 @@ async def start_command(
                 )
             ]
         )
+        keyboard.append(
+            [
+                InlineKeyboardButton(
+                    text=f"Нагадувати про пару: {reminder_mode.as_string()} ⏰",
+                    callback_data=("set_reminder_mode", chat),
+                )
+            ]
+        )
 
         subscription_text = ""
 
@@ -552,14 +684,7 @@ async def select_department(
     )
 
 
-async def send_pair_details(
-    update: "Update",
-    pair: "Pair",
-    day_schedule: "DaySchedule",
-) -> None:
-    """Sends detailed information about a lesson."""
-    lessons = pair.lessons
-
+def pair_details_text(pair: "Pair", day_schedule: "DaySchedule") -> str:
     start_time, end_time = utils.get_pair_time_bounds(pair.number)
 
     text = (
@@ -568,79 +693,53 @@ async def send_pair_details(
         f"({day_schedule.date.strftime('%d.%m')}):\n\n"
     )
 
-    for lesson in lessons:
+    for lesson in pair.lessons:
         text += f"{lesson.as_string(string_format='full')}\n\n"
 
-    keyboard_markup = InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton(
-                    "Повернутися до розкладу 📅",
-                    callback_data=(
-                        "get_schedule",
-                        day_schedule,
-                    ),
-                )
-            ]
-        ]
+    return text
+
+
+def back_to_day_schedule_button(
+    day_schedule: "DaySchedule",
+    text: str = "Повернутися до розкладу 📅",
+) -> InlineKeyboardButton:
+    return InlineKeyboardButton(
+        text,
+        callback_data=(
+            "get_schedule",
+            day_schedule,
+        ),
     )
 
-    await edit_or_reply(
-        update=update,
-        text=text,
-        reply_markup=keyboard_markup,
+
+def back_to_week_schedule_button() -> InlineKeyboardButton:
+    return InlineKeyboardButton(
+        "Повернутися до розкладу тижня 📅",
+        callback_data=("get_week_schedule",),
     )
 
 
-async def send_pair_details_with_bot(
-    bot: "Bot",
-    chat_id: str | int,
-    message_thread_id: int | None,
+async def send_pair_details(
+    update: "Update",
     pair: "Pair",
     day_schedule: "DaySchedule",
+    stale_since: datetime.datetime | None = None,
 ) -> None:
     """Sends detailed information about a lesson."""
-    lessons = pair.lessons
-
-    start_time, end_time = utils.get_pair_time_bounds(pair.number)
-
-    text = (
-        f"Деталі заняття №{pair.number} ({start_time.strftime('%H:%M')} "
-        f"- {end_time.strftime('%H:%M')}) від {utils.get_weekday_name(day_schedule.date)} "
-        f"({day_schedule.date.strftime('%d.%m')}):\n\n"
-    )
-
-    for lesson in lessons:
-        text += f"{lesson.as_string(string_format='full')}\n\n"
+    text = pair_details_text(pair=pair, day_schedule=day_schedule)
+    text += stale_notice(stale_since)
 
-    keyboard_markup = InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton(
-                    "Повернутися до розкладу 📅",
-                    callback_data=(
-                        "get_schedule",
-                        day_schedule,
-                    ),
-                )
-            ]
-        ]
-    )
-
-    await bot.send_message(
-        chat_id=chat_id,
-        message_thread_id=message_thread_id,
+    await edit_or_reply(
+        update=update,
         text=text,
-        reply_markup=keyboard_markup,
-        parse_mode="HTML",
+        reply_markup=InlineKeyboardMarkup([[back_to_day_schedule_button(day_schedule)]]),
     )
 
 
-async def send_day_schedule(
-    update: "Update",
+def day_schedule_content(
     day_schedule: "DaySchedule",
-) -> None:
-    """Gets day schedule from admin service"""
+) -> tuple[str, list[list[InlineKeyboardButton]]]:
+    """Returns the list of day's lessons, and rows of buttons with their details"""
     text = (
         f"Розклад на {utils.get_weekday_name(day_schedule.date)} "
         f"({day_schedule.date.strftime('%d.%m')}) для {day_schedule.for_entity}:\n\n"
@@ -669,28 +768,87 @@ async def send_day_schedule(
 
         keyboard.append(pair_row)
 
-    keyboard.append(
-        [
-            InlineKeyboardButton(
-                "Повернутися до розкладу тижня 📅",
-                callback_data=("get_week_schedule",),
-            )
-        ]
-    )
+    return text, keyboard
+
+
+async def send_day_schedule(
+    update: "Update",
+    day_schedule: "DaySchedule",
+    stale_since: datetime.datetime | None = None,
+) -> None:
+    """Gets day schedule from admin service"""
+    text, keyboard = day_schedule_content(day_schedule)
 
     await edit_or_reply(
         update=update,
-        text=text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        text=text + stale_notice(stale_since),
+        reply_markup=InlineKeyboardMarkup([*keyboard, [back_to_week_schedule_button()]]),
     )
 
 
+async def send_notifications_with_bot(
+    bot: "Bot",
+    chat_id: str | int,
+    message_thread_id: int | None,
+    reminders: list[tuple["Pair | None", "DaySchedule"]],
+    disable_notification: bool = False,
+) -> int:
+    """
+    Sends reminders about pairs (or digests of whole days, without a pair) in one message.
+
+    Reminders about several groups or teachers are titled by them. If the text is too long,
+    it's split into several messages, only the first one is loud. Returns number of messages.
+    """
+    has_digest = any(pair is None for pair, _ in reminders)
+
+    texts = ["Доброго ранку! ☀️"] if has_digest else []
+    keyboard = []
+
+    for pair, day_schedule in reminders:
+        if pair is None:
+            text, rows = day_schedule_content(day_schedule)
+            texts.append(text)
+            keyboard.extend(rows)
+        elif len(reminders) == 1:
+            texts.append(pair_details_text(pair=pair, day_schedule=day_schedule))
+            keyboard.append([back_to_day_schedule_button(day_schedule)])
+        else:
+            texts.append(
+                f"<b>{html.escape(day_schedule.for_entity)}</b>\n"
+                + pair_details_text(pair=pair, day_schedule=day_schedule)
+            )
+            keyboard.append(
+                [back_to_day_schedule_button(day_schedule, f"Розклад {day_schedule.for_entity} 📅")]
+            )
+
+    if has_digest:
+        keyboard.append([back_to_week_schedule_button()])
+
+    chunks = utils.split_message("\n".join(texts).strip())
+
+    for index, chunk in enumerate(chunks):
+        last = index == len(chunks) - 1
+
+        await bot.send_message(
+            chat_id=chat_id,
+            message_thread_id=message_thread_id,
+            text=chunk,
+            reply_markup=InlineKeyboardMarkup(keyboard) if last else None,
+            parse_mode="HTML",
+            disable_notification=disable_notification or index > 0,
+        )
+
+    return len(chunks)
+
+
 async def send_no_classes_message(
     update: "Update",
     date: datetime.date,
+    stale_since: datetime.datetime | None = None,
 ) -> None:
     """Sends a message indicating no classes are scheduled for the given date."""
     text = f"Не знайдено жодних занять на {date.strftime('%d.%m.%Y')}."  # noqa: RUF001
+    text += stale_notice(stale_since)
 
     await edit_or_reply(
         update=update,
@@ -701,6 +859,7 @@ async def send_no_classes_message(
 async def send_week_schedule(
     update: "Update",
     week_schedule: WeekSchedule,
+    stale_since: datetime.datetime | None = None,
 ) -> None:
     """
     Sends a message with keyboard buttons to get a specific day's schedule.
@@ -745,6 +904,75 @@ async def send_week_schedule(
 
     await edit_or_reply(
         update=update,
-        text=f"Оберіть день тижня, щоб побачити розклад.\nДля {week_schedule.for_entity}",
+        text=(
+            f"Оберіть день тижня, щоб побачити розклад.\nДля {week_schedule.for_entity}"
+            f"{stale_notice(stale_since)}"
+        ),
         reply_markup=InlineKeyboardMarkup(keyboard),
     )
+
+
+async def send_search_results(
+    update: "Update",
+    query: str,
+    results: list["SearchEntry"],
+) -> None:
+    """Shows groups and teachers found by a search, pressing one adds it to the subscription"""
+    if not results:
+        await edit_or_reply(
+            update=update,
+            text=(
+                f"За запитом «{html.escape(query)}» нічого не знайдено.\n"  # noqa: RUF001
+                "Спробуйте ввести частину назви групи або прізвища викладача."  # noqa: RUF001
+            ),
+        )
+        return
+
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                text=f"{'👥' if entry.kind == 'group' else '🧑‍🏫'} {entry.item.as_string()}",
+                callback_data=(
+                    "add_subscription_item",
+                    entry.kind,
+                    entry.item,
+                    update.effective_chat,
+                ),
+            )
+        ]
+        for entry in results
+    ]
+
+    await edit_or_reply(
+        update=update,
+        text=(
+            f"Результати пошуку за запитом «{html.escape(query)}».\n"
+            "Оберіть групу або викладача, щоб додати до підписки:"  # noqa: RUF001
+        ),
+        reply_markup=InlineKeyboardMarkup(keyboard),
+    )
+
+
+async def answer_inline_search(
+    update: "Update",
+    results: list["SearchEntry"],
+) -> None:
+    """Answers an inline query, a chosen result sends a search command for it to the chat"""
+    if not update.inline_query:
+        return
+
+    await update.inline_query.answer(
+        results=[
+            InlineQueryResultArticle(
+                id=entry.key,
+                title=entry.item.as_string(),
+                description="Група" if entry.kind == "group" else "Викладач",
+                input_message_content=InputTextMessageContent(
+                    message_text=f"/search {entry.item.short_name}",
+                ),
+            )
+            for entry in results
+        ],
+        cache_time=60,
+        is_personal=False,
+    )
@@ -0,0 +1,281 @@
+"""
+In-process metrics of the bot.
+
+Metrics are kept in memory of a replica (they're reset on restart),
+and are reported to the debug chat by the `/metrics` command.
+"""
+
+import abc
+import bisect
+import threading
+
+type Labels = tuple[str, ...]
+
+
+class Metric(abc.ABC):
+    def __init__(self, name: str, description: str, labels: Labels = ()) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.lock = threading.Lock()
+
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict[str, object]) -> Labels:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _format_labels(self, key: Labels) -> str:
+        if not key:
+            return ""
+
+        pairs = ", ".join(
+            f'{label}="{value}"' for label, value in zip(self.labels, key, strict=True)
+        )
+        return f"{{{pairs}}}"
+
+    @abc.abstractmethod
+    def render(self) -> list[str]:
+        """Returns lines of text with values of the metric"""
+
+
+class Counter(Metric):
+    def __init__(self, name: str, description: str, labels: Labels = ()) -> None:
+        super().__init__(name, description, labels)
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels: object) -> float:
+        key = self._key(labels)
+
+        with self.lock:
+            return self.values.get(key, 0)
+
+    def total(self) -> float:
+        with self.lock:
+            return sum(self.values.values())
+
+    def render(self) -> list[str]:
+        with self.lock:
+            return [
+                f"{self.name}{self._format_labels(key)} {value:g}"
+                for key, value in sorted(self.values.items())
+            ]
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """Counts observations in buckets (upper bounds), like a Prometheus histogram"""
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        buckets: tuple[float, ...],
+        labels: Labels = (),
+    ) -> None:
+        super().__init__(name, description, labels)
+        self.buckets = sorted(buckets)
+        # Per labels: counts of buckets (the last one is +Inf), sum of observations
+        self.counts: dict[Labels, list[int]] = {}
+        self.sums: dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self.lock:
+            counts = self.counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self.sums[key] = self.sums.get(key, 0.0) + value
+
+    def render(self) -> list[str]:
+        lines = []
+
+        with self.lock:
+            for key, counts in sorted(self.counts.items()):
+                total = sum(counts)
+                labels = self._format_labels(key)
+                average = self.sums[key] / total if total else 0.0
+
+                lines.append(f"{self.name}{labels} count={total} avg={average:.3g}")
+
+                cumulative = 0
+                for bound, count in zip([*self.buckets, "+Inf"], counts, strict=True):
+                    cumulative += count
+                    lines.append(f"  le={bound}: {cumulative}")
+
+        return lines
+
+
+REGISTRY: list[Metric] = []
+
+
+def render() -> str:
+    """Renders all metrics that have values, as plain text"""
+    lines = []
+
+    for metric in REGISTRY:
+        if rendered := metric.render():
+            lines.append(f"# {metric.name}: {metric.description}")
+            lines.extend(rendered)
+
+    return "\n".join(lines) or "No metrics yet"
+
+
+NOTIFICATIONS_SENT = Counter(
+    "notifications_sent",
+    "Notifications sent, by pair number (or 'digest')",
+    labels=("pair",),
+)
+NOTIFICATIONS_ON_TIME = Counter(
+    "notifications_on_time",
+    "Notifications sent before their pair started, by pair number (or 'digest')",
+    labels=("pair",),
+)
+NOTIFICATIONS_ON_TIME_RATIO = Gauge(
+    "notifications_on_time_ratio",
+    "Share of sent notifications that were sent before their pair started",
+)
+NOTIFICATIONS_DOWNGRADED = Counter(
+    "notifications_downgraded",
+    "Notifications sent silently, since their pair already started, by pair number (or 'digest')",
+    labels=("pair",),
+)
+NOTIFICATIONS_DROPPED = Counter(
+    "notifications_dropped",
+    "Notifications not sent, since their pair already ended, by pair number (or 'digest')",
+    labels=("pair",),
+)
+NOTIFICATION_MESSAGES = Counter(
+    "notification_messages",
+    "Messages sent with notifications (notifications of a chat due at once share a message)",
+)
+SENDS_SUPPRESSED = Counter(
+    "sends_suppressed",
+    "Messages not sent, since their chat blocked the bot (or was deleted, migrated), by kind",
+    labels=("kind",),
+)
+NOTIFICATION_LATENESS = Histogram(
+    "notification_lateness_seconds",
+    "Delay between the planned and the actual time of sending a notification",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800),
+)
+
+UPDATE_QUEUE_DEPTH = Gauge(
+    "update_queue_depth",
+    "Updates waiting to be handled (for earlier updates of their chat, or a free slot)",
+)
+UPDATE_QUEUE_WAIT = Histogram(
+    "update_queue_wait_seconds",
+    "Time updates waited before being handled",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 15, 60),
+)
+UPDATES_DROPPED = Counter(
+    "updates_dropped",
+    "Updates dropped, since too many updates were waiting to be handled, by limit (chat, overall)",
+    labels=("limit",),
+)
+CALLBACK_PRESSES_DEBOUNCED = Counter(
+    "callback_presses_debounced",
+    "Repeated presses of a button dropped while the first one was being handled, by action",
+    labels=("action",),
+)
+TELEGRAM_QUEUE_DEPTH = Gauge(
+    "telegram_queue_depth",
+    "Requests to Telegram waiting for the rate limiter, by lane",
+    labels=("lane",),
+)
+TELEGRAM_QUEUE_WAIT = Histogram(
+    "telegram_queue_wait_seconds",
+    "Time requests to Telegram waited for the rate limiter, by lane",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 15, 60),
+    labels=("lane",),
+)
+TELEGRAM_RETRY_AFTER = Counter(
+    "telegram_retry_after",
+    "Requests to Telegram rejected with RetryAfter (flood control), by lane",
+    labels=("lane",),
+)
+TELEGRAM_RATE = Gauge(
+    "telegram_rate",
+    "Current overall rate of requests to Telegram (per second), slowed down after RetryAfter",
+)
+
+ADMIN_API_RETRIES = Counter(
+    "admin_api_retries",
+    "Retried requests to the admin API, by endpoint",
+    labels=("endpoint",),
+)
+ADMIN_API_REJECTED = Counter(
+    "admin_api_rejected",
+    "Requests to the admin API rejected by an open circuit breaker, by endpoint",
+    labels=("endpoint",),
+)
+ADMIN_API_REQUESTS = Counter(
+    "admin_api_requests",
+    "GET requests to the admin API made by the bot (including coalesced), by endpoint",
+    labels=("endpoint",),
+)
+ADMIN_API_COALESCED = Counter(
+    "admin_api_coalesced",
+    "GET requests that shared a response of an identical in-flight request, by endpoint",
+    labels=("endpoint",),
+)
+ADMIN_API_COALESCING_RATIO = Gauge(
+    "admin_api_coalescing_ratio",
+    "Share of GET requests to the admin API that were coalesced",
+)
+ADMIN_API_NOT_MODIFIED = Counter(
+    "admin_api_not_modified",
+    "GET requests answered with 304 Not Modified (the remembered value was reused), by endpoint",
+    labels=("endpoint",),
+)
+BULK_SCHEDULE_BYTES = Counter(
+    "bulk_schedule_bytes",
+    "Bytes of bulk schedules, by stage (transferred or decoded) and content encoding",
+    labels=("stage", "encoding"),
+)
+BULK_SCHEDULE_DECODE_THROUGHPUT = Gauge(
+    "bulk_schedule_decode_throughput_mib",
+    "MiB of the last bulk schedule decompressed and decoded per second of CPU time",
+)
+SCHEDULE_CACHE_REQUESTS = Counter(
+    "schedule_cache_requests",
+    "Schedule reads, by result: fresh, revalidated, stale (served while refreshing) or miss",
+    labels=("result",),
+)
+PREFETCHES = Counter(
+    "prefetches",
+    "Speculative prefetches, by result: started, skipped (too many pending) or cancelled",
+    labels=("result",),
+)
+PREFETCH_REQUESTS = Counter(
+    "prefetch_requests",
+    "Lookups of data that may have been prefetched, by result: hit or miss",
+    labels=("result",),
+)
+PREFETCH_HIT_RATE = Gauge(
+    "prefetch_hit_rate",
+    "Share of lookups served by a prefetch",
+)
+PROCESSING_INDICATORS = Counter(
+    "processing_indicators",
+    "Handled updates, by whether 'typing' was shown (slow) or skipped (fast)",
+    labels=("result",),
+)
+MESSAGE_EDITS_AVOIDED = Counter(
+    "message_edits_avoided",
+    "Message edits skipped, since the message already showed the same text and keyboard",
+)
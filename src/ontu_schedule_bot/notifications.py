@@ -0,0 +1,185 @@
+"""Planning of notifications (reminders about pairs) from schedules"""
+
+import datetime
+
+from ontu_schedule_bot import timetable
+from ontu_schedule_bot.preferences import DEFAULT_REMINDER_MODE, ReminderMode
+from ontu_schedule_bot.schemas import BatchStats
+from ontu_schedule_bot.third_party.admin.schemas import DaySchedule, Pair
+from ontu_schedule_bot.utils import KYIV_TIMEZONE, PAIR_START_TIME
+
+
+class Notification:
+    """
+    A reminder about a pair that has to be sent to a chat at `due_at`.
+
+    It's useful until `deadline` (the pair starts), and worthless after `expires_at` (it ends).
+    A digest (without `pair`) covers the whole day: from the start of its first pair
+    to the end of the last one.
+    """
+
+    __slots__ = (
+        "day_schedule",
+        "deadline",
+        "due_at",
+        "expires_at",
+        "pair",
+        "plan",
+        "platform_chat_id",
+    )
+
+    def __init__(  # noqa: PLR0913
+        self,
+        due_at: datetime.datetime,
+        deadline: datetime.datetime,
+        expires_at: datetime.datetime,
+        platform_chat_id: str,
+        pair: Pair | None,
+        day_schedule: DaySchedule,
+        plan: str,
+    ) -> None:
+        self.due_at = due_at
+        self.deadline = deadline
+        self.expires_at = expires_at
+        self.platform_chat_id = platform_chat_id
+        self.pair = pair
+        self.day_schedule = day_schedule
+        self.plan = plan
+
+
+class Planner:
+    """
+    Turns schedules into notifications, according to reminder modes of chats.
+
+    Can be pickled, so planning may be done by worker processes (see `sharding`).
+    """
+
+    def __init__(
+        self,
+        plan: str,
+        now: datetime.datetime,
+        reminder_modes: dict[str, ReminderMode],
+        catch_up: bool = False,
+        digest_time: datetime.time | None = None,
+    ) -> None:
+        """
+        `plan` names the planned notifications, so they can be replaced by the next planning.
+
+        Digests are due at `digest_time` (Kyiv time), they aren't planned without it.
+
+        With `catch_up`, reminders that should've been sent already (but their pair
+        hasn't started yet) are planned too, so they're sent right away. They keep
+        their original `due_at`, so reminders that were actually sent aren't repeated.
+        """
+        self.plan = plan
+        self.now = now
+        self.reminder_modes = reminder_modes
+        self.catch_up = catch_up
+        self.digest_time = digest_time
+
+    def plan_record(
+        self,
+        record: dict[str, list[DaySchedule | None]],
+        stats: BatchStats,
+    ) -> list[Notification]:
+        """Plans reminders (relative to pairs) and digests for chats of a bulk schedule record"""
+        notifications = []
+
+        for platform_chat_id, schedules in record.items():
+            stats.chats += 1
+
+            mode = self.reminder_modes.get(platform_chat_id, DEFAULT_REMINDER_MODE)
+
+            if mode == ReminderMode.DIGEST:
+                notifications.extend(
+                    digest
+                    for schedule in schedules
+                    if schedule and (digest := self.plan_digest(platform_chat_id, schedule))
+                )
+                continue
+
+            if mode.lead_time is None:
+                # Such chats are planned separately
+                continue
+
+            for schedule in schedules:
+                if schedule:
+                    notifications.extend(
+                        self.plan_schedule(platform_chat_id, schedule, mode.lead_time)
+                    )
+
+        stats.planned += len(notifications)
+
+        return notifications
+
+    def plan_schedule(
+        self,
+        platform_chat_id: str,
+        schedule: DaySchedule,
+        lead_time: datetime.timedelta | None,
+    ) -> list[Notification]:
+        """
+        Plans reminders about upcoming pairs with lessons.
+
+        Without `lead_time`, reminders are due at the time of planning.
+        """
+        slots = timetable.get_day_slots(schedule.date)
+        notifications = []
+
+        for pair in timetable.upcoming_pairs(schedule, self.now):
+            if not pair.lessons:
+                continue
+
+            deadline = slots.start_by_number[pair.number]
+
+            due_at = self.now
+            if lead_time is not None:
+                due_at = deadline - lead_time
+
+            if due_at < self.now and not self.catch_up:
+                continue
+
+            notifications.append(
+                Notification(
+                    due_at=due_at,
+                    deadline=deadline,
+                    expires_at=slots.end_by_number[pair.number],
+                    platform_chat_id=platform_chat_id,
+                    pair=pair,
+                    day_schedule=schedule,
+                    plan=self.plan,
+                )
+            )
+
+        return notifications
+
+    def plan_digest(self, platform_chat_id: str, schedule: DaySchedule) -> Notification | None:
+        """Plans a digest of a day with lessons (unless it's too late for it)"""
+        if self.digest_time is None:
+            return None
+
+        numbers = [
+            pair.number
+            for pair in schedule.pairs
+            if pair.lessons and pair.number in PAIR_START_TIME
+        ]
+        if not numbers:
+            return None
+
+        slots = timetable.get_day_slots(schedule.date)
+
+        due_at = datetime.datetime.combine(schedule.date, self.digest_time, tzinfo=KYIV_TIMEZONE)
+        expires_at = slots.end_by_number[max(numbers)]
+
+        if (due_at < self.now and not self.catch_up) or expires_at <= self.now:
+            return None
+
+        return Notification(
+            due_at=due_at,
+            deadline=slots.start_by_number[min(numbers)],
+            expires_at=expires_at,
+            platform_chat_id=platform_chat_id,
+            pair=None,
+            day_schedule=schedule,
+            plan=self.plan,
+        )
@@ -0,0 +1,254 @@
+"""
+Durable outbox of notifications, which is also a ledger of sent ones.
+
+Notifications due at an instant are written to the state database before they're sent,
+and marked done after. So a rerun (e.g. after a crash in the middle of sending) doesn't
+notify a chat twice, and notifications that weren't sent are drained after a restart,
+unless their pair has already started.
+
+Planned notifications are stored there too (see `PlanStore`): a plan is made by a single
+replica, others load it instead of fetching and planning the same schedules.
+"""
+
+import datetime
+import itertools
+import json
+import sqlite3
+import time
+from collections.abc import Iterable
+
+from ontu_schedule_bot import storage
+from ontu_schedule_bot.notifications import Notification
+from ontu_schedule_bot.third_party.admin.schemas import DaySchedule, Pair
+from ontu_schedule_bot.utils import KYIV_TIMEZONE
+
+PENDING = "pending"
+
+# SQLite limits the number of parameters of a query
+BATCH_SIZE = 500
+
+
+def create_tables(connection: sqlite3.Connection) -> None:
+    with connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS notification_outbox ("
+            "key TEXT PRIMARY KEY, "
+            "day TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "due_at REAL NOT NULL, "
+            "deadline REAL NOT NULL, "
+            "expires_at REAL NOT NULL, "
+            "platform_chat_id TEXT NOT NULL, "
+            "plan TEXT NOT NULL, "
+            "payload TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS notification_outbox_status "
+            "ON notification_outbox (status, deadline)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS plans (plan TEXT PRIMARY KEY, planned_at REAL NOT NULL)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS planned_notifications ("
+            "plan TEXT NOT NULL, "
+            "due_at REAL NOT NULL, "
+            "deadline REAL NOT NULL, "
+            "expires_at REAL NOT NULL, "
+            "platform_chat_id TEXT NOT NULL, "
+            "payload TEXT NOT NULL)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS planned_notifications_plan "
+            "ON planned_notifications (plan, expires_at)"
+        )
+
+
+def notification_key(notification: Notification) -> str:
+    """Identifies a notification: plan (with the date), chat (with the topic), pair and entity"""
+    pair = notification.pair.number if notification.pair else "digest"
+
+    return (
+        f"{notification.plan}/{notification.platform_chat_id}/{pair}/"
+        f"{notification.day_schedule.for_entity}"
+    )
+
+
+def dump_payload(notification: Notification) -> str:
+    """Serializes what a notification is about: the pair and its day schedule"""
+    return json.dumps(
+        {
+            "pair": notification.pair.model_dump(mode="json") if notification.pair else None,
+            "day_schedule": notification.day_schedule.model_dump(mode="json"),
+        },
+        ensure_ascii=False,
+    )
+
+
+def load_notification(  # noqa: PLR0913
+    due_at: float,
+    deadline: float,
+    expires_at: float,
+    platform_chat_id: str,
+    plan: str,
+    payload: str,
+) -> Notification:
+    data = json.loads(payload)
+
+    return Notification(
+        due_at=datetime.datetime.fromtimestamp(due_at, tz=KYIV_TIMEZONE),
+        deadline=datetime.datetime.fromtimestamp(deadline, tz=KYIV_TIMEZONE),
+        expires_at=datetime.datetime.fromtimestamp(expires_at, tz=KYIV_TIMEZONE),
+        platform_chat_id=platform_chat_id,
+        pair=Pair.model_validate(data["pair"]) if data["pair"] else None,
+        day_schedule=DaySchedule.model_validate(data["day_schedule"]),
+        plan=plan,
+    )
+
+
+class Outbox:
+    def __init__(self) -> None:
+        self.connection = storage.get_connection()
+
+        create_tables(self.connection)
+
+    def add(self, notifications: Iterable[Notification]) -> list[Notification]:
+        """
+        Writes notifications as pending (unless they're already there).
+
+        Returns those that still have to be sent: not done yet, without duplicates.
+        """
+        by_key = {notification_key(notification): notification for notification in notifications}
+        now = time.time()
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO notification_outbox "
+                "(key, day, status, due_at, deadline, expires_at, platform_chat_id, plan, "
+                "payload, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        key,
+                        notification.day_schedule.date.isoformat(),
+                        PENDING,
+                        notification.due_at.timestamp(),
+                        notification.deadline.timestamp(),
+                        notification.expires_at.timestamp(),
+                        notification.platform_chat_id,
+                        notification.plan,
+                        dump_payload(notification),
+                        now,
+                    )
+                    for key, notification in by_key.items()
+                ),
+            )
+
+        done = set()
+        for batch in itertools.batched(by_key, BATCH_SIZE):
+            cursor = self.connection.execute(
+                "SELECT key FROM notification_outbox "
+                f"WHERE status != ? AND key IN ({', '.join('?' * len(batch))})",
+                (PENDING, *batch),
+            )
+            done.update(key for (key,) in cursor)
+
+        return [notification for key, notification in by_key.items() if key not in done]
+
+    def complete(self, notifications: Iterable[Notification], status: str) -> None:
+        """
+        Marks notifications done: sent, dropped (too late) or forbidden (bot is blocked).
+
+        May be called from any thread (it uses the connection of the thread).
+        """
+        now = time.time()
+        connection = storage.get_connection()
+
+        with connection:
+            connection.executemany(
+                "UPDATE notification_outbox SET status = ?, updated_at = ? WHERE key = ?",
+                ((status, now, notification_key(notification)) for notification in notifications),
+            )
+
+    def unfinished(self, now: datetime.datetime) -> list[Notification]:
+        """Returns pending notifications whose pair hasn't started yet"""
+        cursor = self.connection.execute(
+            "SELECT due_at, deadline, expires_at, platform_chat_id, plan, payload "
+            "FROM notification_outbox WHERE status = ? AND deadline > ?",
+            (PENDING, now.timestamp()),
+        )
+
+        return [load_notification(*row) for row in cursor]
+
+    def purge(self, before: datetime.date) -> int:
+        """Removes notifications about days before `before`, returns their number"""
+        with self.connection:
+            cursor = self.connection.execute(
+                "DELETE FROM notification_outbox WHERE day < ?",
+                (before.isoformat(),),
+            )
+
+        return cursor.rowcount
+
+
+class PlanStore:
+    """Notifications planned by a replica, by plan (see `notifications.Planner`)"""
+
+    def __init__(self) -> None:
+        self.connection = storage.get_connection()
+
+        create_tables(self.connection)
+
+    def replace(self, plan: str, notifications: Iterable[Notification]) -> None:
+        """Stores notifications of a plan instead of ones planned before"""
+        with self.connection:
+            self.connection.execute("DELETE FROM planned_notifications WHERE plan = ?", (plan,))
+            self.connection.executemany(
+                "INSERT INTO planned_notifications "
+                "(plan, due_at, deadline, expires_at, platform_chat_id, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        plan,
+                        notification.due_at.timestamp(),
+                        notification.deadline.timestamp(),
+                        notification.expires_at.timestamp(),
+                        notification.platform_chat_id,
+                        dump_payload(notification),
+                    )
+                    for notification in notifications
+                ),
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO plans (plan, planned_at) VALUES (?, ?)",
+                (plan, time.time()),
+            )
+
+    def get(self, plan: str, now: datetime.datetime) -> list[Notification] | None:
+        """Returns notifications of a plan that aren't worthless yet, None if it wasn't stored"""
+        if (
+            self.connection.execute("SELECT 1 FROM plans WHERE plan = ?", (plan,)).fetchone()
+            is None
+        ):
+            return None
+
+        cursor = self.connection.execute(
+            "SELECT due_at, deadline, expires_at, platform_chat_id, plan, payload "
+            "FROM planned_notifications WHERE plan = ? AND expires_at > ?",
+            (plan, now.timestamp()),
+        )
+
+        return [load_notification(*row) for row in cursor]
+
+    def purge(self, before: datetime.datetime) -> None:
+        """Removes plans that were made before `before`"""
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM planned_notifications WHERE plan IN "
+                "(SELECT plan FROM plans WHERE planned_at < ?)",
+                (before.timestamp(),),
+            )
+            self.connection.execute(
+                "DELETE FROM plans WHERE planned_at < ?",
+                (before.timestamp(),),
+            )
@@ -76,3 +76,8 @@ def get_pair_details_pattern(callback_data: object) -> bool:
 def toggle_subscription_pattern(callback_data: object) -> bool:
     """Pattern for toggle_subscription"""
     return bool(isinstance(callback_data, tuple) and callback_data[0] == "toggle_subscription")
+
+
+def set_reminder_mode_pattern(callback_data: object) -> bool:
+    """Pattern for set_reminder_mode"""
+    return bool(isinstance(callback_data, tuple) and callback_data[0] == "set_reminder_mode")
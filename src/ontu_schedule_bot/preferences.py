@@ -0,0 +1,92 @@
+"""Notification preferences of chats, stored in the local state database"""
+
+import datetime
+import sqlite3
+from enum import StrEnum
+
+from ontu_schedule_bot import storage
+
+
+class ReminderMode(StrEnum):
+    """When a chat is reminded about a pair"""
+
+    MINUTES_5 = "5"
+    MINUTES_10 = "10"
+    MINUTES_15 = "15"
+    MINUTES_30 = "30"
+    EVENING_BEFORE = "evening"
+    # A single morning message with the whole day, instead of reminders about pairs
+    DIGEST = "digest"
+
+    @property
+    def lead_time(self) -> datetime.timedelta | None:
+        """How long before a pair the reminder is sent (None if not relative to the pair)"""
+        if self in (ReminderMode.EVENING_BEFORE, ReminderMode.DIGEST):
+            return None
+
+        return datetime.timedelta(minutes=int(self.value))
+
+    def next(self) -> "ReminderMode":
+        modes = list(ReminderMode)
+        return modes[(modes.index(self) + 1) % len(modes)]
+
+    def as_string(self) -> str:
+        if self == ReminderMode.EVENING_BEFORE:
+            return "напередодні ввечері"
+
+        if self == ReminderMode.DIGEST:
+            return "розклад на день зранку"
+
+        return f"за {self.value} хв"
+
+
+DEFAULT_REMINDER_MODE = ReminderMode.MINUTES_10
+
+
+def create_tables(connection: sqlite3.Connection) -> None:
+    with connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS notification_preferences ("
+            "platform_chat_id TEXT PRIMARY KEY, "
+            "reminder_mode TEXT NOT NULL)"
+        )
+
+
+class PreferencesStore:
+    def __init__(self) -> None:
+        self.connection = storage.get_connection()
+
+        create_tables(self.connection)
+
+    def get_reminder_mode(self, platform_chat_id: str) -> ReminderMode:
+        row = self.connection.execute(
+            "SELECT reminder_mode FROM notification_preferences WHERE platform_chat_id = ?",
+            (platform_chat_id,),
+        ).fetchone()
+
+        return ReminderMode(row[0]) if row else DEFAULT_REMINDER_MODE
+
+    def set_reminder_mode(self, platform_chat_id: str, mode: ReminderMode) -> None:
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO notification_preferences "
+                "(platform_chat_id, reminder_mode) VALUES (?, ?)",
+                (platform_chat_id, mode.value),
+            )
+
+    def next_reminder_mode(self, platform_chat_id: str) -> ReminderMode:
+        """Switches a chat to the next reminder mode, returns it"""
+        mode = self.get_reminder_mode(platform_chat_id).next()
+        self.set_reminder_mode(platform_chat_id, mode)
+
+        return mode
+
+    def reminder_modes(self) -> dict[str, ReminderMode]:
+        """Returns modes of chats that changed the default one"""
+        cursor = self.connection.execute(
+            "SELECT platform_chat_id, reminder_mode FROM notification_preferences "
+            "WHERE reminder_mode != ?",
+            (DEFAULT_REMINDER_MODE.value,),
+        )
+
+        return {platform_chat_id: ReminderMode(mode) for platform_chat_id, mode in cursor}
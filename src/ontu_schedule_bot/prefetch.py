@@ -0,0 +1,155 @@
+"""
+Speculative prefetching of data for the next navigation step.
+
+After a screen is rendered, data for the most likely next actions (the next page,
+the subscription...) is loaded in background. When the user acts, the handler takes
+the prefetched result (or joins the prefetch in flight) instead of making a request.
+
+Prefetched results are used once and kept only for a short time. Prefetches of a chat
+are cancelled when the chat moves on to a screen that doesn't need them.
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import cast
+
+from ontu_schedule_bot import metrics
+from ontu_schedule_bot.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Prefetches over this number (per concurrency slot) are skipped, not queued
+BACKLOG_FACTOR = 4
+
+
+class Prefetcher:
+    def __init__(self, concurrency: int, ttl: float, max_entries: int) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_pending = concurrency * BACKLOG_FACTOR
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+        # Key -> (expires at (monotonic), value)
+        self.results: OrderedDict[Hashable, tuple[float, object]] = OrderedDict()
+        self.pending: dict[Hashable, asyncio.Task] = {}
+        self.by_owner: dict[str, set[Hashable]] = {}
+
+    def prefetch(self, owner: str, loaders: dict[Hashable, Callable[[], object]]) -> None:
+        """
+        Starts loading data that `owner` (a chat) is likely to need next.
+
+        Prefetches of the owner that aren't needed anymore are cancelled.
+        """
+        previous = self.by_owner.pop(owner, set())
+
+        for key in previous - loaders.keys():
+            if task := self.pending.get(key):
+                task.cancel()
+                metrics.PREFETCHES.inc(result="cancelled")
+
+        keys = self.by_owner[owner] = set()
+
+        for key, loader in loaders.items():
+            keys.add(key)
+
+            if key in self.pending or self._fresh(key):
+                continue
+
+            if len(self.pending) >= self.max_pending:
+                metrics.PREFETCHES.inc(result="skipped")
+                continue
+
+            task = asyncio.create_task(self._load(key, loader))
+            task.add_done_callback(functools.partial(self._done, owner, key))
+            self.pending[key] = task
+            metrics.PREFETCHES.inc(result="started")
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Drops a prefetched result (e.g. when the data was changed by the user).
+
+        A prefetch in flight is cancelled, whoever waits for it (see `get`) loads the data again.
+        """
+        self.results.pop(key, None)
+
+        if task := self.pending.pop(key, None):
+            task.cancel()
+
+    async def get[T](self, key: Hashable, loader: Callable[[], T]) -> T:
+        """Returns the prefetched result, or loads it (blocking `loader` is run in a thread)"""
+        if self._fresh(key):
+            _, value = self.results.pop(key)
+            self._hit(hit=True)
+            return cast("T", value)
+
+        if task := self.pending.get(key):
+            # The user is waiting for it now, so it must not be cancelled as unneeded
+            for keys in self.by_owner.values():
+                keys.discard(key)
+
+            try:
+                value = await asyncio.shield(task)
+            except asyncio.CancelledError:
+                current = asyncio.current_task()
+                if not task.cancelled() or (current and current.cancelling()):
+                    raise
+
+                # Invalidated while loading, so the data has changed
+                logger.debug("Prefetch of %s was invalidated, loading it again", key)
+            except Exception:  # noqa: BLE001
+                logger.debug("Prefetch of %s failed, loading it again", key)
+            else:
+                self.results.pop(key, None)
+                self._hit(hit=True)
+                return cast("T", value)
+
+        self._hit(hit=False)
+        return await asyncio.to_thread(loader)
+
+    def _fresh(self, key: Hashable) -> bool:
+        result = self.results.get(key)
+        return result is not None and result[0] > time.monotonic()
+
+    def _hit(self, hit: bool) -> None:
+        metrics.PREFETCH_REQUESTS.inc(result="hit" if hit else "miss")
+
+        metrics.PREFETCH_HIT_RATE.set(
+            metrics.PREFETCH_REQUESTS.value(result="hit") / metrics.PREFETCH_REQUESTS.total()
+        )
+
+    async def _load(self, key: Hashable, loader: Callable[[], object]) -> object:
+        async with self.semaphore:
+            value = await asyncio.to_thread(loader)
+
+        self.results[key] = (time.monotonic() + self.ttl, value)
+        self.results.move_to_end(key)
+
+        while len(self.results) > self.max_entries:
+            self.results.popitem(last=False)
+
+        return value
+
+    def _done(self, owner: str, key: Hashable, task: asyncio.Task) -> None:
+        if self.pending.get(key) is task:
+            del self.pending[key]
+
+        if (keys := self.by_owner.get(owner)) is not None:
+            keys.discard(key)
+            if not keys:
+                del self.by_owner[owner]
+
+        if not task.cancelled() and (error := task.exception()):
+            logger.debug("Prefetch of %s failed: %r", key, error)
+
+
+@functools.cache
+def get_prefetcher() -> Prefetcher:
+    return Prefetcher(
+        concurrency=settings.PREFETCH_CONCURRENCY,
+        ttl=settings.PREFETCH_TTL,
+        max_entries=settings.PREFETCH_MAX_ENTRIES,
+    )
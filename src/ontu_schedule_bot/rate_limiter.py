@@ -0,0 +1,291 @@
+"""
+Rate limiting of requests to Telegram, with priority lanes.
+
+Replies to users (interactive) and bulk traffic (notifications, campaigns, reports to
+the debug chat) wait in separate lanes. Whenever the overall budget allows a request,
+interactive ones go first, so a `/today` doesn't wait behind thousands of reminders.
+
+- The overall budget is a token bucket of `TELEGRAM_MAX_MESSAGES_PER_SECOND`. A `RetryAfter`
+  halves its rate, and the rate recovers gradually with successful requests;
+- Every chat has its own bucket for sent messages, following Telegram's limits: a message
+  per second in a private chat, 20 messages per minute in a group. A `RetryAfter` pauses
+  the bucket of the chat for the requested time, other chats aren't held up.
+  Edits and chat actions ("typing") aren't messages, they only take the overall budget.
+"""
+
+import asyncio
+import collections
+import contextlib
+import contextvars
+import datetime
+import enum
+import logging
+import time
+from collections.abc import Callable, Coroutine, Iterator
+from typing import Any
+
+from telegram import constants
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from ontu_schedule_bot import metrics
+from ontu_schedule_bot.settings import settings
+
+logger = logging.getLogger(__name__)
+
+type Callback = Callable[..., Coroutine[Any, Any, bool | dict[str, Any] | list[dict[str, Any]]]]
+
+# Buckets of chats are kept only when there are few of them, or they're in use (not full)
+MAX_CHAT_BUCKETS = 512
+# Messages per second of the overall rate regained with every successful request
+RATE_RECOVERY_STEP = 0.05
+# The overall rate isn't slowed down below this share of the maximum
+MIN_RATE_SHARE = 0.1
+# Short bursts in a private chat are fine (e.g. a user quickly pressing buttons)
+PRIVATE_CHAT_BURST = 3
+
+
+class Lane(enum.StrEnum):
+    # In the order of priority
+    INTERACTIVE = "interactive"
+    BULK = "bulk"
+
+
+_lane: contextvars.ContextVar[Lane] = contextvars.ContextVar(
+    "rate_limiter_lane", default=Lane.INTERACTIVE
+)
+
+
+@contextlib.contextmanager
+def lane(value: Lane) -> Iterator[None]:
+    """Requests made within wait in the given lane (they're interactive by default)"""
+    token = _lane.set(value)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, in bursts of up to `capacity` requests"""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self) -> float:
+        """Seconds until a request is allowed (0 if it's allowed now)"""
+        self._refill()
+
+        if self.tokens >= 1:
+            return 0.0
+
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        """Allows nothing for `seconds`"""
+        self._refill()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+def is_message(endpoint: str) -> bool:
+    """Whether a request to the Bot API method sends a message to a chat"""
+    return endpoint.startswith("send") and endpoint != "sendChatAction"
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+
+    if isinstance(retry_after, datetime.timedelta):
+        return retry_after.total_seconds()
+
+    return float(retry_after)
+
+
+class LaneRateLimiter(BaseRateLimiter[int]):
+    """
+    Requests with a `chat_id` wait for the overall budget in their lane, ones that send
+    messages wait for the bucket of the chat before that. Requests without it
+    (e.g. answers to callback queries) aren't limited.
+
+    `rate_limit_args` of a request is the maximum number of retries after a `RetryAfter`.
+    """
+
+    def __init__(self, max_rate: float, max_retries: int = 0) -> None:
+        self.max_rate = max_rate
+        self.max_retries = max_retries
+
+        self.overall = TokenBucket(rate=max_rate, capacity=max_rate)
+        self.chats: dict[int | str, TokenBucket] = {}
+
+        # Waiters for the overall budget, resolved by `_dispatch`
+        self.waiters: dict[Lane, collections.deque[asyncio.Future[None]]] = {
+            lane: collections.deque() for lane in Lane
+        }
+        self.timer: asyncio.TimerHandle | None = None
+        self.queued = dict.fromkeys(Lane, 0)
+
+    async def initialize(self) -> None:
+        metrics.TELEGRAM_RATE.set(self.overall.rate)
+
+    async def shutdown(self) -> None:
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        if len(self.chats) > MAX_CHAT_BUCKETS:
+            for key, bucket in list(self.chats.items()):
+                if key != chat_id and bucket.is_full():
+                    del self.chats[key]
+
+        bucket = self.chats.get(chat_id)
+
+        if bucket is None:
+            # Usernames (strings) are only used for channels and supergroups
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(
+                    rate=constants.FloodLimit.MESSAGES_PER_SECOND_PER_CHAT,
+                    capacity=PRIVATE_CHAT_BURST,
+                )
+            else:
+                bucket = TokenBucket(
+                    rate=constants.FloodLimit.MESSAGES_PER_MINUTE_PER_GROUP / 60,
+                    capacity=constants.FloodLimit.MESSAGES_PER_MINUTE_PER_GROUP,
+                )
+
+            self.chats[chat_id] = bucket
+
+        return bucket
+
+    def _dispatch(self) -> None:
+        """Lets waiters through while the overall budget allows, higher lanes first"""
+        self.timer = None
+
+        for waiters in self.waiters.values():
+            while waiters:
+                if waiters[0].done():
+                    # Cancelled while waiting
+                    waiters.popleft()
+                    continue
+
+                if (delay := self.overall.delay()) > 0:
+                    self.timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                    return
+
+                self.overall.take()
+                waiters.popleft().set_result(None)
+
+    async def _acquire_overall(self, current_lane: Lane) -> None:
+        if not any(self.waiters.values()) and self.overall.delay() == 0:
+            self.overall.take()
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters[current_lane].append(waiter)
+
+        # Otherwise, the timer is already set to dispatch
+        if self.timer is None:
+            self._dispatch()
+
+        await waiter
+
+    async def _acquire(self, current_lane: Lane, bucket: TokenBucket | None) -> None:
+        started_at = time.monotonic()
+
+        self.queued[current_lane] += 1
+        metrics.TELEGRAM_QUEUE_DEPTH.set(self.queued[current_lane], lane=current_lane)
+
+        try:
+            if bucket is not None:
+                # The token is reserved right away, so later requests to the chat wait longer
+                delay = bucket.delay()
+                bucket.take()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            await self._acquire_overall(current_lane)
+        finally:
+            self.queued[current_lane] -= 1
+            metrics.TELEGRAM_QUEUE_DEPTH.set(self.queued[current_lane], lane=current_lane)
+
+        metrics.TELEGRAM_QUEUE_WAIT.observe(time.monotonic() - started_at, lane=current_lane)
+
+    def _slow_down(self, paused: TokenBucket | None, seconds: float) -> None:
+        self.overall.rate = max(self.max_rate * MIN_RATE_SHARE, self.overall.rate / 2)
+        metrics.TELEGRAM_RATE.set(self.overall.rate)
+
+        if paused is not None:
+            paused.pause(seconds)
+
+    def _speed_up(self) -> None:
+        if self.overall.rate < self.max_rate:
+            self.overall.rate = min(self.max_rate, self.overall.rate + RATE_RECOVERY_STEP)
+            metrics.TELEGRAM_RATE.set(self.overall.rate)
+
+    async def process_request(  # noqa: PLR0913
+        self,
+        callback: Callback,
+        args: Any,  # noqa: ANN401
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: int | None,
+    ) -> bool | dict[str, Any] | list[dict[str, Any]]:
+        max_retries = self.max_retries if rate_limit_args is None else rate_limit_args
+
+        chat_id = data.get("chat_id")
+        # Integer IDs may be passed as strings
+        with contextlib.suppress(ValueError, TypeError):
+            chat_id = int(chat_id)  # type: ignore[arg-type]
+
+        # Reports to the debug chat are never urgent
+        current_lane = Lane.BULK if chat_id == settings.DEBUG_CHAT_ID else _lane.get()
+
+        retries = 0
+
+        while True:
+            # Looked up on every attempt, since unused buckets may be removed meanwhile
+            bucket = (
+                self._chat_bucket(chat_id) if chat_id is not None and is_message(endpoint) else None
+            )
+
+            if chat_id is not None:
+                await self._acquire(current_lane, bucket)
+
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                seconds = retry_after_seconds(e)
+                metrics.TELEGRAM_RETRY_AFTER.inc(lane=current_lane)
+                # A request that isn't about a chat pauses everything, an edit pauses only itself
+                self._slow_down(self.overall if chat_id is None else bucket, seconds)
+
+                if retries == max_retries:
+                    logger.exception("Rate limit hit after maximum of %d retries", max_retries)
+                    raise
+
+                retries += 1
+                logger.info("Rate limit hit, retrying after %s seconds", seconds)
+
+                # Otherwise, the paused bucket of the chat holds the retry back
+                if bucket is None:
+                    await asyncio.sleep(seconds)
+                continue
+
+            self._speed_up()
+            return result
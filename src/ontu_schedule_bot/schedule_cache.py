@@ -0,0 +1,131 @@
+"""
+Stale-while-revalidate cache of schedules.
+
+Fresh entries are served right away. Once an entry is older than the freshness TTL,
+it's refreshed, but if the admin API doesn't answer quickly (or fails), the last known
+schedule is served instead (marked as stale), while the refresh continues in background.
+Entries older than the staleness bound are never served, the cache is bounded by LRU.
+"""
+
+import asyncio
+import datetime
+import functools
+import logging
+import math
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+
+from ontu_schedule_bot import metrics
+from ontu_schedule_bot.settings import settings
+from ontu_schedule_bot.utils import KYIV_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+
+class StaleWhileRevalidateCache[V]:
+    def __init__(
+        self,
+        fresh_ttl: float,
+        max_staleness: float,
+        refresh_wait: float,
+        max_entries: int,
+    ) -> None:
+        self.fresh_ttl = fresh_ttl
+        self.max_staleness = max_staleness
+        self.refresh_wait = refresh_wait
+        self.max_entries = max_entries
+
+        # Key -> (fetched at (timestamp), value), least recently used first
+        self.entries: OrderedDict[Hashable, tuple[float, V]] = OrderedDict()
+        self.refreshing: dict[Hashable, asyncio.Task[V]] = {}
+
+    async def get(
+        self,
+        key: Hashable,
+        loader: Callable[[], V],
+    ) -> tuple[V, datetime.datetime | None]:
+        """
+        Returns a value and, if it's stale, when it was fetched.
+
+        `loader` is blocking, it's run in a thread. Its errors are raised
+        only if there is no value that may be served instead.
+        """
+        entry = self.entries.get(key)
+        age = time.time() - entry[0] if entry else math.inf
+
+        if entry and age < self.fresh_ttl:
+            self.entries.move_to_end(key)
+            metrics.SCHEDULE_CACHE_REQUESTS.inc(result="fresh")
+            return entry[1], None
+
+        refresh = self._refresh(key, loader)
+
+        if entry is None or age >= self.max_staleness:
+            metrics.SCHEDULE_CACHE_REQUESTS.inc(result="miss")
+            # Shielded, since other callers may be waiting for the same refresh
+            return await asyncio.shield(refresh), None
+
+        try:
+            value = await asyncio.wait_for(asyncio.shield(refresh), timeout=self.refresh_wait)
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Serving a stale value for %s, refresh failed or is slow: %r", key, e)
+            metrics.SCHEDULE_CACHE_REQUESTS.inc(result="stale")
+
+            self.entries.move_to_end(key)
+            return entry[1], datetime.datetime.fromtimestamp(entry[0], tz=KYIV_TIMEZONE)
+
+        metrics.SCHEDULE_CACHE_REQUESTS.inc(result="revalidated")
+        return value, None
+
+    def invalidate(self, match: Callable[[Hashable], bool]) -> None:
+        """Drops values with matching keys (e.g. after they were changed), with their refreshes"""
+        for key in [key for key in self.entries if match(key)]:
+            del self.entries[key]
+
+        for key in [key for key in self.refreshing if match(key)]:
+            del self.refreshing[key]
+
+    def _refresh(self, key: Hashable, loader: Callable[[], V]) -> "asyncio.Task[V]":
+        """Starts loading a value (unless it's already being loaded)"""
+        if task := self.refreshing.get(key):
+            return task
+
+        task = asyncio.create_task(self._load(key, loader))
+        task.add_done_callback(functools.partial(self._loaded, key))
+        self.refreshing[key] = task
+
+        return task
+
+    async def _load(self, key: Hashable, loader: Callable[[], V]) -> V:
+        value = await asyncio.to_thread(loader)
+
+        # Invalidated while loading, the value may be outdated already
+        if self.refreshing.get(key) is not asyncio.current_task():
+            return value
+
+        self.entries[key] = (time.time(), value)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+        return value
+
+    def _loaded(self, key: Hashable, task: "asyncio.Task[V]") -> None:
+        if self.refreshing.get(key) is task:
+            del self.refreshing[key]
+
+        # Retrieve the error, so it's not reported as unhandled when nobody awaits the refresh
+        if not task.cancelled() and (error := task.exception()):
+            logger.debug("Refresh of %s failed: %r", key, error)
+
+
+@functools.cache
+def get_schedule_cache() -> StaleWhileRevalidateCache:
+    return StaleWhileRevalidateCache(
+        fresh_ttl=settings.SCHEDULE_CACHE_FRESH_TTL,
+        max_staleness=settings.SCHEDULE_CACHE_MAX_STALENESS,
+        refresh_wait=settings.SCHEDULE_CACHE_REFRESH_WAIT,
+        max_entries=settings.SCHEDULE_CACHE_MAX_ENTRIES,
+    )
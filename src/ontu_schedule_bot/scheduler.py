@@ -0,0 +1,93 @@
+"""
+Sends planned notifications when they're due.
+
+Notifications are kept in a heap ordered by their due time, a single job queue timer
+is armed for the earliest of them. When it fires, notifications that are due are
+taken, the timer is re-armed for the next due instant, and then they're sent.
+"""
+
+import datetime
+import functools
+import heapq
+import itertools
+import logging
+from collections.abc import Awaitable, Callable, Iterable
+
+from telegram.ext import CallbackContext, Job, JobQueue
+
+from ontu_schedule_bot.notifications import Notification
+
+logger = logging.getLogger(__name__)
+
+type NotificationSender = Callable[[CallbackContext, list[Notification]], Awaitable[None]]
+
+
+class NotificationScheduler:
+    def __init__(self) -> None:
+        self.heap: list[tuple[datetime.datetime, int, Notification]] = []
+        # Breaks ties between notifications due at the same instant
+        self.counter = itertools.count()
+        self.job: Job | None = None
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def replace(self, plan: str, notifications: Iterable[Notification]) -> None:
+        """Replaces pending notifications of a plan (e.g. when schedules are planned again)"""
+        self.heap = [item for item in self.heap if item[2].plan != plan]
+        self.heap.extend(
+            (notification.due_at, next(self.counter), notification)
+            for notification in notifications
+        )
+        heapq.heapify(self.heap)
+
+    def next_due_at(self) -> datetime.datetime | None:
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now: datetime.datetime) -> list[Notification]:
+        """Removes and returns notifications that are due at `now`, in order of due time"""
+        due = []
+
+        while self.heap and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap)[2])
+
+        return due
+
+    def arm(self, job_queue: JobQueue, send: NotificationSender) -> None:
+        """(Re-)arms the timer for the earliest pending notification"""
+        if self.job:
+            self.job.schedule_removal()
+            self.job = None
+
+        due_at = self.next_due_at()
+        if due_at is None:
+            return
+
+        self.job = job_queue.run_once(
+            functools.partial(self._fire, send=send),
+            # Notifications that are already due are sent right away
+            when=max(due_at, datetime.datetime.now(tz=due_at.tzinfo)),
+            name="Send due notifications",
+            job_kwargs={
+                "misfire_grace_time": None,
+            },
+        )
+
+    async def _fire(self, context: CallbackContext, send: NotificationSender) -> None:
+        self.job = None
+
+        due_at = self.next_due_at()
+        due = self.pop_due(datetime.datetime.now(tz=due_at.tzinfo)) if due_at else []
+
+        # Re-armed before sending, so a slow instant (or a wait for another replica)
+        # doesn't delay the next ones
+        if context.job_queue:
+            self.arm(context.job_queue, send)
+
+        if due:
+            await send(context, due)
+
+
+@functools.cache
+def get_scheduler() -> NotificationScheduler:
+    return NotificationScheduler()
@@ -1,9 +1,39 @@
 import pydantic
 
-from ontu_schedule_bot.third_party.admin.schemas import Chat
-
 
 class SendMessageCampaignDTO(pydantic.BaseModel):
-    name: str
-    payload: dict
-    recipients: list[Chat]
+    uuid: pydantic.UUID4
+
+
+class BatchStats(pydantic.BaseModel):
+    """Counters of a bulk notification run (or of one of its shards)"""
+
+    chats: int = 0
+    planned: int = 0
+    sent: int = 0
+    # Notifications of a chat due at the same instant share messages
+    messages: int = 0
+    downgraded: int = 0
+    dropped: int = 0
+    forbidden: int = 0
+    # Skipped, since the chat is known to be blocked
+    suppressed: int = 0
+    errors: int = 0
+
+    def merge(self, other: "BatchStats") -> None:
+        self.chats += other.chats
+        self.planned += other.planned
+        self.sent += other.sent
+        self.messages += other.messages
+        self.downgraded += other.downgraded
+        self.dropped += other.dropped
+        self.forbidden += other.forbidden
+        self.suppressed += other.suppressed
+        self.errors += other.errors
+
+    def as_string(self) -> str:
+        return (
+            f"chats: {self.chats}, planned: {self.planned}, sent: {self.sent}, "
+            f"messages: {self.messages}, downgraded: {self.downgraded}, dropped: {self.dropped}, "
+            f"forbidden: {self.forbidden}, suppressed: {self.suppressed}, errors: {self.errors}"
+        )
@@ -0,0 +1,182 @@
+"""
+In-memory search over groups and teachers.
+
+Names are indexed by trigrams (and by prefixes, for queries shorter than a trigram),
+so lookups don't need requests to the admin API. The catalog is loaded periodically,
+the index is updated incrementally: only added, changed or removed entries are touched.
+"""
+
+import dataclasses
+import functools
+import logging
+import re
+import threading
+import time
+from collections.abc import Iterable
+from typing import Literal
+
+from ontu_schedule_bot.third_party.admin.client import AdminClient
+from ontu_schedule_bot.third_party.admin.schemas import Group, Teacher
+
+logger = logging.getLogger(__name__)
+
+NGRAM = 3
+# Queries shorter than a trigram are looked up by prefixes of words
+MAX_PREFIX = NGRAM - 1
+
+type EntryKind = Literal["group", "teacher"]
+
+
+def normalize(text: str) -> str:
+    """Lowercases text and replaces everything except letters and digits with spaces"""
+    return " ".join(re.findall(r"\w+", text.casefold().replace("'", "").replace("’", "")))  # noqa: RUF001
+
+
+def ngrams(text: str) -> set[str]:
+    return {text[i : i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+def prefixes(text: str) -> set[str]:
+    return {word[:length] for word in text.split() for length in range(1, MAX_PREFIX + 1)}
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class SearchEntry:
+    kind: EntryKind
+    item: Group | Teacher
+    text: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.kind}:{self.item.uuid}"
+
+    @classmethod
+    def from_group(cls, group: Group) -> "SearchEntry":
+        return cls(kind="group", item=group, text=normalize(group.short_name))
+
+    @classmethod
+    def from_teacher(cls, teacher: Teacher) -> "SearchEntry":
+        return cls(
+            kind="teacher",
+            item=teacher,
+            text=normalize(f"{teacher.full_name} {teacher.short_name}"),
+        )
+
+
+class SearchIndex:
+    def __init__(self) -> None:
+        self.entries: dict[str, SearchEntry] = {}
+        self.postings: dict[str, set[str]] = {}
+        # Lookups run in the event loop, updates in a thread
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _terms(self, entry: SearchEntry) -> set[str]:
+        return ngrams(entry.text) | prefixes(entry.text)
+
+    def _add(self, entry: SearchEntry) -> None:
+        self.entries[entry.key] = entry
+
+        for term in self._terms(entry):
+            self.postings.setdefault(term, set()).add(entry.key)
+
+    def _remove(self, key: str) -> None:
+        entry = self.entries.pop(key)
+
+        for term in self._terms(entry):
+            keys = self.postings[term]
+            keys.discard(key)
+
+            if not keys:
+                del self.postings[term]
+
+    def update(self, entries: Iterable[SearchEntry]) -> tuple[int, int]:
+        """Replaces indexed entries with `entries`, returns numbers of (changed, removed) ones"""
+        new_entries = {entry.key: entry for entry in entries}
+
+        with self.lock:
+            removed = [key for key in self.entries if key not in new_entries]
+            changed = [
+                entry for key, entry in new_entries.items() if self.entries.get(key) != entry
+            ]
+
+            for key in removed:
+                self._remove(key)
+
+            for entry in changed:
+                if entry.key in self.entries:
+                    self._remove(entry.key)
+
+                self._add(entry)
+
+        return len(changed), len(removed)
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        kind: EntryKind | None = None,
+    ) -> list[SearchEntry]:
+        """
+        Returns entries whose name contains the query.
+
+        Entries whose name (or one of its words) starts with the query go first.
+        """
+        text = normalize(query)
+        if not text:
+            return []
+
+        terms = ngrams(text) if len(text) >= NGRAM else {text}
+
+        with self.lock:
+            postings = [self.postings.get(term, set()) for term in terms]
+            keys = set.intersection(*postings) if postings else set()
+            candidates = [self.entries[key] for key in keys]
+
+        matches = [
+            entry
+            for entry in candidates
+            if text in entry.text and (kind is None or entry.kind == kind)
+        ]
+
+        def rank(entry: SearchEntry) -> tuple[int, int, str]:
+            if entry.text.startswith(text):
+                position = 0
+            elif f" {text}" in entry.text:
+                position = 1
+            else:
+                position = 2
+
+            return position, len(entry.text), entry.text
+
+        return sorted(matches, key=rank)[:limit]
+
+
+def load_entries(client: AdminClient) -> list[SearchEntry]:
+    """Reads all groups and teachers from the admin API"""
+    entries = [SearchEntry.from_group(group) for group in client.read_all_groups()]
+    entries.extend(SearchEntry.from_teacher(teacher) for teacher in client.read_all_teachers())
+
+    return entries
+
+
+def refresh_index(index: "SearchIndex", client: AdminClient) -> str:
+    """Loads the catalog and updates the index (blocking), returns a summary"""
+    started_at = time.perf_counter()
+
+    changed, removed = index.update(load_entries(client))
+
+    summary = (
+        f"{len(index)} entries, {changed} changed, {removed} removed "
+        f"in {time.perf_counter() - started_at:.2f} s"
+    )
+    logger.info("Search index is refreshed: %s", summary)
+
+    return summary
+
+
+@functools.cache
+def get_search_index() -> SearchIndex:
+    return SearchIndex()
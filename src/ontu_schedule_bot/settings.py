@@ -1,5 +1,9 @@
 """This module loads (or sets) secrets for the bot (API_TOKEN, API_URL...)"""
 
+import datetime
+import functools
+from typing import Any, Literal, cast
+
 import pydantic
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -25,9 +29,231 @@ class Settings(BaseSettings):
 
     LOG_DIR: str = "/tmp/ontu_schedule_bot_logs"
     PERSISTENCE_FILEPATH: str = "/tmp/ontu_schedule_bot_persistence"
+    STATE_DB_FILEPATH: str = "/tmp/ontu_schedule_bot_state.sqlite3"
+    BULK_SNAPSHOT_FILEPATH: str = "/tmp/ontu_schedule_bot_bulk.snapshot"
 
     WEBHOOK_URL: pydantic.HttpUrl | None = None
     RUN_PERIODIC_JOBS: bool = True
 
+    LEADER_ELECTION: Literal["none", "sqlite"] = pydantic.Field(
+        default="sqlite",
+        description=(
+            "How replicas agree on who runs periodic jobs. "
+            "'sqlite' works for replicas sharing STATE_DB_FILEPATH (single host)."
+        ),
+    )
+    LEADER_LEASE_TTL: float = pydantic.Field(
+        default=10.0,
+        gt=0,
+        description="Seconds after which a lease of a dead replica may be taken over.",
+    )
+
+    BATCH_WORKER_PROCESSES: int = pydantic.Field(
+        default=1,
+        ge=1,
+        description=(
+            "Number of processes planning of bulk notifications is split between "
+            "(by a hash of the chat ID). 1 means the work is done in the bot process."
+        ),
+    )
+    TELEGRAM_MAX_MESSAGES_PER_SECOND: float = pydantic.Field(
+        default=30.0,
+        gt=0,
+        description="Overall rate budget of the bot.",
+    )
+    UPDATE_MAX_CONCURRENCY: int = pydantic.Field(
+        default=64,
+        ge=1,
+        description="How many updates are handled at once (updates of a chat are handled in turn).",
+    )
+    UPDATE_QUEUE_LIMIT: int = pydantic.Field(
+        default=1000,
+        ge=1,
+        description="How many updates may wait to be handled, newer ones are dropped.",
+    )
+    UPDATE_CHAT_QUEUE_LIMIT: int = pydantic.Field(
+        default=10,
+        ge=1,
+        description="How many updates of a chat may be handled or wait, newer ones are dropped.",
+    )
+    CALLBACK_DEBOUNCE_WINDOW: float = pydantic.Field(
+        default=3.0,
+        ge=0,
+        description=(
+            "For how long (in seconds) repeated presses of a button are dropped "
+            "while the first press is still being handled."
+        ),
+    )
+    PROCESSING_INDICATOR_DELAY: float = pydantic.Field(
+        default=0.3,
+        ge=0,
+        description=(
+            "Seconds after which 'typing' is shown for an update that is still being handled. "
+            "Faster updates don't spend a Bot API call on it."
+        ),
+    )
+    EDIT_FINGERPRINTS_MAX_ENTRIES: int = pydantic.Field(
+        default=10_000,
+        ge=1,
+        description="How many messages are remembered to skip edits that wouldn't change them.",
+    )
+
+    NOTIFICATION_PLAN_TIMES: list[datetime.time] = pydantic.Field(
+        default=[
+            datetime.time(hour=7),
+            datetime.time(hour=11),
+            datetime.time(hour=15),
+        ],
+        min_length=1,
+        description=(
+            "When (Kyiv time) notifications for the day are planned from bulk schedules. "
+            "Schedules are also planned on startup."
+        ),
+    )
+    EVENING_REMINDER_TIME: datetime.time = pydantic.Field(
+        default=datetime.time(hour=20),
+        description="When (Kyiv time) chats that chose so are reminded about tomorrow's pairs.",
+    )
+    EVENING_REMINDER_CONCURRENCY: int = pydantic.Field(
+        default=8,
+        ge=1,
+        description="How many chats' schedules are read at once to plan evening reminders.",
+    )
+    DIGEST_TIME: datetime.time = pydantic.Field(
+        default=datetime.time(hour=7, minute=30),
+        description=(
+            "When (Kyiv time) chats in the digest mode get the day's schedule. "
+            "Should be after the first of NOTIFICATION_PLAN_TIMES."
+        ),
+    )
+
+    CAMPAIGN_CONCURRENCY: int = pydantic.Field(
+        default=8,
+        ge=1,
+    )
+    CAMPAIGN_RECIPIENTS_PAGE_SIZE: int = pydantic.Field(
+        default=100,
+        ge=1,
+    )
+    CAMPAIGN_PROGRESS_INTERVAL: float = pydantic.Field(
+        default=60.0,
+        gt=0,
+        description="How often (in seconds) campaign progress is reported to the debug chat.",
+    )
+    CAMPAIGN_MAX_PASSES: int = pydantic.Field(
+        default=3,
+        ge=1,
+        description=(
+            "How many times a campaign goes over its recipients, "
+            "later passes send to recipients that weren't reached because of network errors."
+        ),
+    )
+    CAMPAIGN_RETRY_INTERVAL: float = pydantic.Field(
+        default=60.0,
+        ge=0,
+        description="Pause (in seconds) before a campaign passes over its recipients again.",
+    )
+
+    BLOCKED_CHAT_REPROBE_AFTER: float = pydantic.Field(
+        default=7 * 24 * 60 * 60.0,
+        gt=0,
+        description=(
+            "For how long (in seconds) nothing is sent to a chat that blocked the bot, "
+            "was deleted or migrated. After that, the next message probes it again."
+        ),
+    )
+
+    ADMIN_API_TIMEOUT: float = pydantic.Field(
+        default=5.0,
+        gt=0,
+        description="Timeout (in seconds) of regular requests to the admin API.",
+    )
+    ADMIN_API_MAX_RETRIES: int = pydantic.Field(
+        default=2,
+        ge=0,
+        description="Retries of a failed idempotent request to the admin API.",
+    )
+    ADMIN_API_RETRY_BUDGET_RATIO: float = pydantic.Field(
+        default=0.1,
+        ge=0,
+        description="At most this fraction of requests to the admin API may be retries.",
+    )
+    ADMIN_API_BREAKER_FAILURES: int = pydantic.Field(
+        default=5,
+        ge=1,
+        description="Consecutive failures of an admin API endpoint that open its circuit.",
+    )
+    ADMIN_API_BREAKER_RESET_TIMEOUT: float = pydantic.Field(
+        default=30.0,
+        gt=0,
+        description="Seconds an open circuit waits before letting a trial request through.",
+    )
+    ADMIN_API_CONDITIONAL_CACHE_MAX_ENTRIES: int = pydantic.Field(
+        default=10_000,
+        ge=1,
+        description="How many responses are remembered to re-read them with conditional requests.",
+    )
+    ADMIN_API_CONDITIONAL_CACHE_ON_DISK: bool = pydantic.Field(
+        default=False,
+        description="Whether remembered responses are saved to STATE_DB_FILEPATH (for restarts).",
+    )
+
+    SCHEDULE_CACHE_FRESH_TTL: float = pydantic.Field(
+        default=60.0,
+        ge=0,
+        description="For how long (in seconds) a cached schedule is served without a refresh.",
+    )
+    SCHEDULE_CACHE_MAX_STALENESS: float = pydantic.Field(
+        default=6 * 60 * 60,
+        ge=0,
+        description="Up to what age (in seconds) a cached schedule is served if a refresh fails.",
+    )
+    SCHEDULE_CACHE_REFRESH_WAIT: float = pydantic.Field(
+        default=1.5,
+        gt=0,
+        description="How long (in seconds) a refresh is awaited before a stale schedule is served.",
+    )
+    SCHEDULE_CACHE_MAX_ENTRIES: int = pydantic.Field(
+        default=10_000,
+        ge=1,
+    )
+
+    PREFETCH_CONCURRENCY: int = pydantic.Field(
+        default=4,
+        ge=1,
+        description="How many prefetches of the next navigation step may run at once.",
+    )
+    PREFETCH_TTL: float = pydantic.Field(
+        default=30.0,
+        gt=0,
+        description="For how long (in seconds) a prefetched result may be used.",
+    )
+    PREFETCH_MAX_ENTRIES: int = pydantic.Field(
+        default=1000,
+        ge=1,
+    )
+
+    CATALOG_CACHE_TTL: float = pydantic.Field(
+        default=60 * 60,
+        ge=0,
+        description="For how long (in seconds) faculties and departments are cached.",
+    )
+
+
+@functools.cache
+def get_settings() -> Settings:
+    return Settings()  # pyright: ignore[reportCallIssue]
+
+
+class LazySettings:
+    """
+    Loads settings on first access instead of on import.
+
+    This way invalid settings are reported by the entrypoint, not by a random import.
+    """
+
+    def __getattr__(self, name: str) -> Any:  # noqa: ANN401
+        return getattr(get_settings(), name)
+
 
-settings = Settings()  # pyright: ignore[reportCallIssue]
+settings = cast("Settings", LazySettings())
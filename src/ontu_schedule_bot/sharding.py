@@ -0,0 +1,160 @@
+"""
+Splits planning of bulk notifications between several worker processes.
+
+Records are routed to a shard by a hash of the chat ID, so a chat (and all of its topics)
+is always handled by the same worker. Workers validate records and plan notifications,
+which are sent back to the bot process to be scheduled.
+"""
+
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import queue
+from collections.abc import Iterable
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+
+from ontu_schedule_bot import utils
+from ontu_schedule_bot.notifications import Notification, Planner
+from ontu_schedule_bot.schemas import BatchStats
+from ontu_schedule_bot.third_party.admin.client import validate_bulk_record
+
+logger = logging.getLogger(__name__)
+
+# Bounds memory used by records waiting for a worker
+QUEUE_SIZE = 1000
+
+
+def get_shard(platform_chat_id: str, shards: int) -> int:
+    """Returns the shard of a chat, topics of a chat share the same shard"""
+    chat_id, _ = utils.split_platform_chat_id(platform_chat_id)
+    digest = hashlib.blake2b(chat_id.encode(), digest_size=8).digest()
+
+    return int.from_bytes(digest) % shards
+
+
+def run_worker(
+    shard: int,
+    records: Queue,
+    results: Queue,
+    planner: Planner,
+) -> None:
+    """Entrypoint of a worker process"""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(funcName)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+    )
+
+    stats = BatchStats()
+    notifications: list[Notification] = []
+
+    while (item := records.get()) is not None:
+        try:
+            notifications.extend(planner.plan_record(validate_bulk_record(item), stats))
+        except Exception:
+            logger.exception("Error processing record in batch worker")
+            stats.errors += 1
+
+    results.put((shard, stats.model_dump(), notifications))
+
+
+def _put(records: Queue, item: object, process: BaseProcess) -> None:
+    while True:
+        try:
+            records.put(item, timeout=1.0)
+        except queue.Full:
+            if not process.is_alive():
+                raise RuntimeError(f"{process.name} exited unexpectedly") from None
+        else:
+            return
+
+
+def _route(
+    records: Iterable[dict[str, list[dict | None]]],
+    shard_queues: list[Queue],
+    processes: list[BaseProcess],
+) -> None:
+    shards = len(shard_queues)
+
+    try:
+        for record in records:
+            for platform_chat_id, schedules in record.items():
+                shard = get_shard(platform_chat_id, shards)
+                _put(shard_queues[shard], {platform_chat_id: schedules}, processes[shard])
+    finally:
+        for shard, process in enumerate(processes):
+            if process.is_alive():
+                _put(shard_queues[shard], None, process)
+
+
+def _collect(
+    results: Queue,
+    processes: list[BaseProcess],
+) -> list[tuple[int, dict, list[Notification]]]:
+    collected = []
+
+    while len(collected) < len(processes):
+        try:
+            collected.append(results.get(timeout=1.0))
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+
+    return collected
+
+
+async def plan(
+    records: Iterable[dict[str, list[dict | None]]],
+    planner: Planner,
+    shards: int,
+) -> tuple[list[Notification], list[BatchStats]]:
+    """
+    Routes (not validated) bulk records to worker processes and waits for them to finish.
+
+    Returns planned notifications and stats of each shard.
+    """
+    context = multiprocessing.get_context("spawn")
+
+    shard_queues: list[Queue] = [context.Queue(maxsize=QUEUE_SIZE) for _ in range(shards)]
+    results: Queue = context.Queue()
+
+    processes = [
+        context.Process(
+            target=run_worker,
+            args=(
+                shard,
+                shard_queues[shard],
+                results,
+                planner,
+            ),
+            name=f"Batch worker {shard}",
+        )
+        for shard in range(shards)
+    ]
+
+    for process in processes:
+        process.start()
+
+    try:
+        await asyncio.to_thread(_route, records, shard_queues, processes)
+        collected = await asyncio.to_thread(_collect, results, processes)
+    finally:
+        for process in processes:
+            await asyncio.to_thread(process.join, 5.0)
+            if process.is_alive():
+                process.terminate()
+
+    notifications: list[Notification] = []
+    shard_stats = [BatchStats() for _ in range(shards)]
+
+    for shard, stats, shard_notifications in collected:
+        shard_stats[shard] = BatchStats.model_validate(stats)
+        notifications.extend(shard_notifications)
+
+    for shard, process in enumerate(processes):
+        if process.exitcode != 0:
+            logger.error("%s exited with code %s", process.name, process.exitcode)
+            shard_stats[shard].errors += 1
+
+    return notifications, shard_stats
@@ -0,0 +1,28 @@
+"""This module gives access to the local state database of the bot (SQLite)"""
+
+import sqlite3
+import threading
+
+from ontu_schedule_bot.settings import settings
+
+_local = threading.local()
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Returns a connection to the state database.
+
+    SQLite connections can't be shared between threads, so each thread gets its own one.
+    """
+    connection: sqlite3.Connection | None = getattr(_local, "connection", None)
+
+    if connection is None:
+        connection = sqlite3.connect(
+            settings.STATE_DB_FILEPATH,
+            timeout=30.0,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        _local.connection = connection
+
+    return connection
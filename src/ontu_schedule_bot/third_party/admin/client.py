@@ -1,13 +1,24 @@
 import datetime
+import functools
 import json
 import logging
-from collections.abc import Generator
+import threading
+import time
+from collections.abc import Callable, Generator
+from typing import Any, TypeVar, cast
 
 import httpx
 import pydantic
 
-from ontu_schedule_bot.errors import SubscriptionNotFoundError
+from ontu_schedule_bot import metrics
+from ontu_schedule_bot.errors import ServiceUnavailableError, SubscriptionNotFoundError
 from ontu_schedule_bot.settings import settings
+from ontu_schedule_bot.third_party.admin.conditional import CachedResponse, ConditionalCache
+from ontu_schedule_bot.third_party.admin.resilience import (
+    CircuitBreaker,
+    RetryBudget,
+    backoff_delay,
+)
 from ontu_schedule_bot.third_party.admin.schemas import (
     Chat,
     CreateChatRequest,
@@ -16,17 +27,34 @@ from ontu_schedule_bot.third_party.admin.schemas import (
     DepartmentPaginatedResponse,
     FacultyPaginatedRequest,
     FacultyPaginatedResponse,
+    Group,
     GroupPaginatedRequest,
     GroupPaginatedResponse,
     MessageCampaign,
     Subscription,
+    Teacher,
     TeacherPaginatedRequest,
     TeacherPaginatedResponse,
     WeekSchedule,
 )
+from ontu_schedule_bot.third_party.admin.singleflight import SingleFlight
+from ontu_schedule_bot.third_party.admin.streaming import ACCEPT_ENCODING, JSONArrayDecoder
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = frozenset(
+    {
+        httpx.codes.BAD_GATEWAY,
+        httpx.codes.SERVICE_UNAVAILABLE,
+        httpx.codes.GATEWAY_TIMEOUT,
+    }
+)
+IDEMPOTENT_METHODS = frozenset({"GET"})
+
+CATALOG_PAGE_SIZE = 100
+
 
 def reraise_for_status(response: httpx.Response) -> None:
     try:
@@ -45,6 +73,23 @@ def reraise_for_status(response: httpx.Response) -> None:
         ) from e
 
 
+def validate_bulk_record(
+    record: dict[str, list[dict | None]],
+) -> dict[str, list[DaySchedule | None]]:
+    return {
+        key: [DaySchedule.model_validate(item) if item is not None else None for item in value]
+        for key, value in record.items()
+    }
+
+
+def validate_day_schedules(data: list[dict | None]) -> list[DaySchedule | None]:
+    return [DaySchedule.model_validate(item) if item is not None else None for item in data]
+
+
+def validate_week_schedules(data: list[dict]) -> list[WeekSchedule]:
+    return [WeekSchedule.model_validate(item) for item in data]
+
+
 class AdminClient:
     def __init__(self) -> None:
         self.api_url = settings.API_URL
@@ -58,15 +103,187 @@ class AdminClient:
             auth=self.api_auth,
             base_url=str(self.api_url),
             timeout=httpx.Timeout(
-                30.0,
+                settings.ADMIN_API_TIMEOUT,
             ),
             headers={
                 "Content-Type": "application/json",
             },
         )
 
+        # Reference data (faculties, departments) rarely changes
+        self.catalog_cache: dict[str, tuple[float, Any]] = {}
+
+        # Reference data and schedules are re-read with conditional requests
+        self.conditional_cache = ConditionalCache(
+            max_entries=settings.ADMIN_API_CONDITIONAL_CACHE_MAX_ENTRIES,
+            on_disk=settings.ADMIN_API_CONDITIONAL_CACHE_ON_DISK,
+        )
+
+        # The client is shared by threads, see `get_admin_client`
+        self.single_flight = SingleFlight()
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.breakers_lock = threading.Lock()
+        self.retry_budget = RetryBudget(
+            ratio=settings.ADMIN_API_RETRY_BUDGET_RATIO,
+            min_tokens=settings.ADMIN_API_MAX_RETRIES,
+        )
+
+    def _breaker(self, endpoint: str) -> CircuitBreaker:
+        with self.breakers_lock:
+            breaker = self.breakers.get(endpoint)
+
+            if breaker is None:
+                breaker = self.breakers[endpoint] = CircuitBreaker(
+                    name=endpoint,
+                    failure_threshold=settings.ADMIN_API_BREAKER_FAILURES,
+                    reset_timeout=settings.ADMIN_API_BREAKER_RESET_TIMEOUT,
+                )
+
+        return breaker
+
+    def _allow(self, breaker: CircuitBreaker) -> None:
+        if not breaker.allow():
+            metrics.ADMIN_API_REJECTED.inc(endpoint=breaker.name)
+            raise ServiceUnavailableError(
+                endpoint=breaker.name,
+                retry_after=breaker.retry_after(),
+            )
+
+    def _request(self, method: str, url: str, endpoint: str, **kwargs: Any) -> httpx.Response:  # noqa: ANN401
+        """
+        Sends a request, identical concurrent GET requests share a single response.
+
+        Responses are fully read, so they can be safely shared between threads.
+        """
+        if method not in IDEMPOTENT_METHODS:
+            return self._send(method, url, endpoint, **kwargs)
+
+        key = (
+            url,
+            repr(sorted(kwargs.get("params", {}).items())),
+            repr(sorted(kwargs.get("headers", {}).items())),
+        )
+        response, shared = self.single_flight.do(
+            key,
+            functools.partial(self._send, method, url, endpoint, **kwargs),
+        )
+
+        metrics.ADMIN_API_REQUESTS.inc(endpoint=endpoint)
+        if shared:
+            metrics.ADMIN_API_COALESCED.inc(endpoint=endpoint)
+
+        metrics.ADMIN_API_COALESCING_RATIO.set(
+            metrics.ADMIN_API_COALESCED.total() / metrics.ADMIN_API_REQUESTS.total()
+        )
+
+        return response
+
+    def _send(self, method: str, url: str, endpoint: str, **kwargs: Any) -> httpx.Response:  # noqa: ANN401
+        """
+        Sends a request through the circuit breaker of `endpoint`.
+
+        Idempotent requests are retried on transport errors and gateway errors (5xx),
+        as long as the retry budget allows. Raises `ServiceUnavailableError` if the API
+        is unavailable, so callers fail fast instead of waiting for timeouts.
+        """
+        breaker = self._breaker(endpoint)
+        self.retry_budget.deposit()
+
+        attempt = 0
+
+        while True:
+            self._allow(breaker)
+
+            try:
+                response = self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                error: Exception = e
+            except BaseException:
+                # Not retried, but a trial request (half-open circuit) must get a result
+                breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    breaker.record_success()
+                    return response
+
+                error = httpx.HTTPStatusError(
+                    message=f"Server error '{response.status_code}' for url '{response.url}'",
+                    request=response.request,
+                    response=response,
+                )
+
+            breaker.record_failure()
+            attempt += 1
+
+            if (
+                method not in IDEMPOTENT_METHODS
+                or attempt > settings.ADMIN_API_MAX_RETRIES
+                or not self.retry_budget.withdraw()
+            ):
+                logger.warning("Request to %s failed after %s attempt(s): %s", url, attempt, error)
+                raise ServiceUnavailableError(endpoint=endpoint) from error
+
+            metrics.ADMIN_API_RETRIES.inc(endpoint=endpoint)
+            time.sleep(backoff_delay(attempt, base=0.2, cap=2.0))
+
+    def _get_parsed(
+        self,
+        url: str,
+        endpoint: str,
+        parse: Callable[[Any], T],
+        **kwargs: Any,  # noqa: ANN401
+    ) -> T:
+        """
+        Sends a conditional GET request, returns its parsed (JSON) body.
+
+        If the resource wasn't modified since it was read last time,
+        the value parsed back then is returned.
+        """
+        headers = kwargs.pop("headers", {})
+        key = repr(
+            (
+                url,
+                sorted(kwargs.get("params", {}).items()),
+                sorted(headers.items()),
+            )
+        )
+
+        cached = self.conditional_cache.get(key)
+        if cached is not None:
+            headers = {**headers, **cached.conditional_headers()}
+
+        response = self._request("GET", url, endpoint=endpoint, headers=headers, **kwargs)
+
+        if cached is not None and response.status_code == httpx.codes.NOT_MODIFIED:
+            metrics.ADMIN_API_NOT_MODIFIED.inc(endpoint=endpoint)
+
+            if cached.value is None:
+                cached.value = parse(json.loads(cached.body))
+
+            return cast("T", cached.value)
+
+        reraise_for_status(response)
+
+        value = parse(response.json())
+
+        if entry := CachedResponse.from_response(response, value):
+            self.conditional_cache.put(key, entry)
+
+        return value
+
+    def _cached(self, key: str, loader: Callable[[], T]) -> T:
+        cached = self.catalog_cache.get(key)
+        if cached and time.monotonic() - cached[0] < settings.CATALOG_CACHE_TTL:
+            return cached[1]
+
+        value = loader()
+        self.catalog_cache[key] = (time.monotonic(), value)
+
+        return value
+
     def get_chat(self, chat_id: str) -> Chat:
-        response = self.client.get(url=f"/chat/{chat_id}")
+        response = self._request("GET", f"/chat/{chat_id}", endpoint="get_chat")
 
         if response.status_code != httpx.codes.OK:
             reraise_for_status(response)
@@ -74,8 +291,10 @@ class AdminClient:
         return Chat.model_validate(response.json())
 
     def create_chat(self, chat_info: CreateChatRequest) -> Chat:
-        response = self.client.post(
-            url="/chat/",
+        response = self._request(
+            "POST",
+            "/chat/",
+            endpoint="create_chat",
             json=chat_info.model_dump(),
         )
 
@@ -96,8 +315,10 @@ class AdminClient:
         return chat
 
     def create_subscription(self, chat_id: str) -> Subscription:
-        response = self.client.post(
+        response = self._request(
+            "POST",
             "/chat/subscription/",
+            endpoint="create_subscription",
             headers={
                 "X-Chat-ID": chat_id,
             },
@@ -108,8 +329,10 @@ class AdminClient:
         return Subscription.model_validate(response.json())
 
     def get_subscription(self, chat_id: str) -> Subscription:
-        response = self.client.get(
+        response = self._request(
+            "GET",
             "/chat/subscription/info",
+            endpoint="get_subscription",
             headers={
                 "X-Chat-ID": chat_id,
             },
@@ -126,8 +349,10 @@ class AdminClient:
         return Subscription.model_validate(response.json())
 
     def add_group(self, chat_id: str, group_id: pydantic.UUID4) -> Subscription:
-        response = self.client.post(
+        response = self._request(
+            "POST",
             f"/chat/subscription/info/group/{group_id}",
+            endpoint="add_group",
             headers={
                 "X-Chat-ID": chat_id,
             },
@@ -138,8 +363,10 @@ class AdminClient:
         return Subscription.model_validate(response.json())
 
     def remove_group(self, chat_id: str, group_id: pydantic.UUID4) -> Subscription:
-        response = self.client.delete(
+        response = self._request(
+            "DELETE",
             f"/chat/subscription/info/group/{group_id}",
+            endpoint="remove_group",
             headers={
                 "X-Chat-ID": chat_id,
             },
@@ -150,8 +377,10 @@ class AdminClient:
         return Subscription.model_validate(response.json())
 
     def add_teacher(self, chat_id: str, teacher_id: pydantic.UUID4) -> Subscription:
-        response = self.client.post(
+        response = self._request(
+            "POST",
             f"/chat/subscription/info/teacher/{teacher_id}",
+            endpoint="add_teacher",
             headers={
                 "X-Chat-ID": chat_id,
             },
@@ -162,8 +391,10 @@ class AdminClient:
         return Subscription.model_validate(response.json())
 
     def remove_teacher(self, chat_id: str, teacher_id: pydantic.UUID4) -> Subscription:
-        response = self.client.delete(
+        response = self._request(
+            "DELETE",
             f"/chat/subscription/info/teacher/{teacher_id}",
+            endpoint="remove_teacher",
             headers={
                 "X-Chat-ID": chat_id,
             },
@@ -174,8 +405,10 @@ class AdminClient:
         return Subscription.model_validate(response.json())
 
     def toggle_subscription(self, chat_id: str) -> Subscription:
-        response = self.client.patch(
+        response = self._request(
+            "PATCH",
             "/chat/subscription/status",
+            endpoint="toggle_subscription",
             headers={
                 "X-Chat-ID": chat_id,
             },
@@ -185,103 +418,144 @@ class AdminClient:
 
         return Subscription.model_validate(response.json())
 
-    def bulk_schedule(
+    def bulk_schedule_raw(
         self,
-    ) -> Generator[dict[str, list[DaySchedule | None]], None, None]:
+    ) -> Generator[dict[str, list[dict | None]], None, None]:
+        """Streams bulk schedule records as plain (not validated) data"""
+        breaker = self._breaker("bulk_schedule")
+        self._allow(breaker)
+
+        try:
+            yield from self._stream_bulk_schedule()
+        except BaseException:
+            # Whatever it was, a trial request (half-open circuit) must get a result
+            breaker.record_failure()
+            raise
+
+        breaker.record_success()
+
+    def _stream_bulk_schedule(
+        self,
+    ) -> Generator[dict[str, list[dict | None]], None, None]:
+        decoder = JSONArrayDecoder()
+        decompressed = 0
+        # CPU time of decompression and decoding, network waits aren't counted
+        cpu_time = 0.0
+
         with self.client.stream(
             method="GET",
             url="/chat/bulk/schedule",
+            headers={
+                "Accept-Encoding": ACCEPT_ENCODING,
+            },
             timeout=httpx.Timeout(600.0),
         ) as response:
-            for chunk in response.iter_bytes():
-                if chunk.startswith(b",\n"):
-                    chunk = chunk[2:]  # noqa: PLW2901
-                if chunk.endswith(b","):
-                    chunk = chunk[:-1]  # noqa: PLW2901
-
-                if chunk.find(b']},\n{"') != -1:
-                    chunk = b"[" + chunk + b"]"  # noqa: PLW2901
-
-                if chunk.endswith(b"]]"):
-                    chunk = chunk[:-1]  # noqa: PLW2901
-
-                try:
-                    data = json.loads(chunk)
-                except json.JSONDecodeError as e:
-                    logger.warning("Failed to decode chunk: %s; chunk: %r", e, chunk)
-                    continue
-                if not isinstance(data, list):
-                    data: list[dict] = [data]
-
-                for item in data:
-                    yield {
-                        key: [
-                            DaySchedule.model_validate(item) if item is not None else None
-                            for item in value
-                        ]
-                        for key, value in item.items()
-                    }
+            if not response.is_success:
+                # Its body isn't the bulk schedule, it mustn't be taken for (no) records
+                response.read()
+
+                if response.is_server_error:
+                    logger.warning(
+                        "Bulk schedule failed with %s: %s",
+                        response.status_code,
+                        response.text[:128],
+                    )
+                    raise ServiceUnavailableError(endpoint="bulk_schedule")
+
+                reraise_for_status(response)
+
+            chunks = response.iter_bytes()
+
+            while True:
+                started_at = time.thread_time()
+
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+
+                decompressed += len(chunk)
+                records = list(decoder.feed(chunk))
+
+                cpu_time += time.thread_time() - started_at
+
+                yield from records
+
+            rest = decoder.close()
+            if rest or not decoder.ended:
+                # E.g. the connection was closed early, records after it are missing
+                logger.warning("Bulk schedule is truncated, its end: %r", rest[-128:])
+                raise ServiceUnavailableError(endpoint="bulk_schedule")
+
+            encoding = response.headers.get("Content-Encoding", "identity")
+            compressed = response.num_bytes_downloaded
+
+        metrics.BULK_SCHEDULE_BYTES.inc(compressed, stage="transferred", encoding=encoding)
+        metrics.BULK_SCHEDULE_BYTES.inc(decompressed, stage="decoded", encoding=encoding)
+        if cpu_time > 0:
+            metrics.BULK_SCHEDULE_DECODE_THROUGHPUT.set(decompressed / cpu_time / 1024 / 1024)
+
+        logger.info(
+            "Bulk schedule is read: %s bytes transferred (%s), %s bytes decoded in %.2f s of CPU",
+            compressed,
+            encoding,
+            decompressed,
+            cpu_time,
+        )
+
+    def bulk_schedule(
+        self,
+    ) -> Generator[dict[str, list[DaySchedule | None]], None, None]:
+        for item in self.bulk_schedule_raw():
+            yield validate_bulk_record(item)
 
     def schedule_tomorrow(self, chat_id: str) -> list[DaySchedule | None]:
-        response = self.client.get(
+        return self._get_parsed(
             "/chat/schedule/tomorrow",
+            endpoint="schedule_tomorrow",
+            parse=validate_day_schedules,
             headers={
                 "X-Chat-ID": chat_id,
             },
         )
 
-        reraise_for_status(response)
-
-        return [
-            DaySchedule.model_validate(item) if item is not None else None
-            for item in response.json()
-        ]
-
     def schedule_today(self, chat_id: str) -> list[DaySchedule | None]:
-        response = self.client.get(
+        return self._get_parsed(
             "/chat/schedule/today",
+            endpoint="schedule_today",
+            parse=validate_day_schedules,
             headers={
                 "X-Chat-ID": chat_id,
             },
         )
 
-        reraise_for_status(response)
-
-        return [
-            DaySchedule.model_validate(item) if item is not None else None
-            for item in response.json()
-        ]
-
     def schedule_day(self, chat_id: str, date: datetime.date) -> list[DaySchedule | None]:
-        response = self.client.get(
+        return self._get_parsed(
             f"/chat/schedule/day/{date.isoformat()}",
+            endpoint="schedule_day",
+            parse=validate_day_schedules,
             headers={
                 "X-Chat-ID": chat_id,
             },
         )
 
-        reraise_for_status(response)
-
-        return [
-            DaySchedule.model_validate(item) if item is not None else None
-            for item in response.json()
-        ]
-
     def schedule_week(self, chat_id: str) -> list[WeekSchedule]:
-        response = self.client.get(
+        return self._get_parsed(
             "/chat/schedule/week",
+            endpoint="schedule_week",
+            parse=validate_week_schedules,
             headers={
                 "X-Chat-ID": chat_id,
             },
         )
 
-        reraise_for_status(response)
-
-        return [WeekSchedule.model_validate(item) for item in response.json()]
-
     def read_faculties(self) -> FacultyPaginatedResponse:
-        response = self.client.get(
+        return self._cached("faculties", self._read_faculties)
+
+    def _read_faculties(self) -> FacultyPaginatedResponse:
+        data = self._get_parsed(
             "/public/faculty/",
+            endpoint="read_faculties",
+            parse=FacultyPaginatedResponse.model_validate,
             # Too lazy to implement pagination for faculties
             params=FacultyPaginatedRequest(
                 page=1,
@@ -289,10 +563,6 @@ class AdminClient:
             ).model_dump(),
         )
 
-        reraise_for_status(response)
-
-        data = FacultyPaginatedResponse.model_validate(response.json())
-
         if data.meta.has_next:
             raise ValueError("Too many faculties to read in one request")
 
@@ -303,23 +573,41 @@ class AdminClient:
         page: int = 1,
         page_size: int = 10,
         faculty_id: pydantic.UUID4 | None = None,
+        name: str | None = None,
     ) -> GroupPaginatedResponse:
-        response = self.client.get(
+        return self._get_parsed(
             "/public/group/",
+            endpoint="read_groups",
+            parse=GroupPaginatedResponse.model_validate,
             params=GroupPaginatedRequest(
                 page=page,
                 page_size=page_size,
                 faculty_id=faculty_id,
+                name=name,
             ).model_dump(),
         )
 
-        reraise_for_status(response)
+    def read_all_groups(self) -> Generator[Group, None, None]:
+        """Reads groups of all faculties, page by page"""
+        page = 1
+
+        while True:
+            groups = self.read_groups(page=page, page_size=CATALOG_PAGE_SIZE)
+            yield from groups.items
 
-        return GroupPaginatedResponse.model_validate(response.json())
+            if not groups.meta.has_next:
+                return
+
+            page += 1
 
     def read_departments(self) -> DepartmentPaginatedResponse:
-        response = self.client.get(
+        return self._cached("departments", self._read_departments)
+
+    def _read_departments(self) -> DepartmentPaginatedResponse:
+        data = self._get_parsed(
             "/public/department/",
+            endpoint="read_departments",
+            parse=DepartmentPaginatedResponse.model_validate,
             # Too lazy to implement pagination for departments
             params=DepartmentPaginatedRequest(
                 page=1,
@@ -327,10 +615,6 @@ class AdminClient:
             ).model_dump(),
         )
 
-        reraise_for_status(response)
-
-        data = DepartmentPaginatedResponse.model_validate(response.json())
-
         if data.meta.has_next:
             raise ValueError("Too many departments to read in one request")
 
@@ -341,26 +625,47 @@ class AdminClient:
         page: int = 1,
         page_size: int = 10,
         department_id: pydantic.UUID4 | None = None,
+        name: str | None = None,
     ) -> TeacherPaginatedResponse:
-        response = self.client.get(
+        return self._get_parsed(
             "/public/teacher/",
+            endpoint="read_teachers",
+            parse=TeacherPaginatedResponse.model_validate,
             params=TeacherPaginatedRequest(
                 page=page,
                 page_size=page_size,
                 department_id=department_id,
+                name=name,
             ).model_dump(),
         )
 
-        reraise_for_status(response)
+    def read_all_teachers(self) -> Generator[Teacher, None, None]:
+        """Reads teachers of all departments, page by page"""
+        page = 1
+
+        while True:
+            teachers = self.read_teachers(page=page, page_size=CATALOG_PAGE_SIZE)
+            yield from teachers.items
+
+            if not teachers.meta.has_next:
+                return
 
-        return TeacherPaginatedResponse.model_validate(response.json())
+            page += 1
 
     def read_message_campaign(
         self,
         message_campaign_id: pydantic.UUID4,
     ) -> MessageCampaign:
-        response = self.client.get(f"/chat/message_campaign/{message_campaign_id}")
+        response = self._request(
+            "GET", f"/chat/message_campaign/{message_campaign_id}", endpoint="read_message_campaign"
+        )
 
         reraise_for_status(response)
 
         return MessageCampaign.model_validate(response.json())
+
+
+@functools.cache
+def get_admin_client() -> AdminClient:
+    """Returns a client (and its connection pool) shared by the whole process"""
+    return AdminClient()
@@ -0,0 +1,151 @@
+"""
+Conditional GET requests to the admin API.
+
+Responses with validators (`ETag`, `Last-Modified`) are remembered together with their
+parsed value. The next request of the same resource sends `If-None-Match`/`If-Modified-Since`,
+and on `304 Not Modified` the remembered value is reused: the body is neither downloaded
+nor validated again.
+
+Entries are kept in memory (LRU). Optionally, validators and bodies are also saved to the
+state database, so they survive restarts (such bodies are parsed again on first use).
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+
+from ontu_schedule_bot import storage
+
+# Entries over the limit are removed from the database once per this number of saves
+TRIM_INTERVAL = 100
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "last_modified", "value")
+
+    def __init__(
+        self,
+        etag: str | None,
+        last_modified: str | None,
+        body: bytes,
+        value: object | None = None,
+    ) -> None:
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = body
+        # Parsed body, None until it's parsed (for entries loaded from the database)
+        self.value = value
+
+    @classmethod
+    def from_response(cls, response: httpx.Response, value: object) -> "CachedResponse | None":
+        """Returns an entry for a response, or None if the response has no validators"""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+        if etag is None and last_modified is None:
+            return None
+
+        return cls(etag=etag, last_modified=last_modified, body=response.content, value=value)
+
+    def conditional_headers(self) -> dict[str, str]:
+        headers = {}
+
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+
+        return headers
+
+
+def create_tables(connection: sqlite3.Connection) -> None:
+    with connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS admin_api_responses ("
+            "key TEXT PRIMARY KEY, "
+            "etag TEXT, "
+            "last_modified TEXT, "
+            "body BLOB NOT NULL, "
+            "stored_at REAL NOT NULL)"
+        )
+
+
+class ConditionalCache:
+    """Remembered responses by request key, least recently used are forgotten"""
+
+    def __init__(self, max_entries: int, on_disk: bool = False) -> None:
+        self.max_entries = max_entries
+        self.on_disk = on_disk
+
+        self.entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        # The client is shared by threads
+        self.lock = threading.Lock()
+        self.saves = 0
+
+        if on_disk:
+            create_tables(storage.get_connection())
+
+    def get(self, key: str) -> CachedResponse | None:
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None:
+                self.entries.move_to_end(key)
+                return entry
+
+        if not self.on_disk:
+            return None
+
+        row = (
+            storage.get_connection()
+            .execute(
+                "SELECT etag, last_modified, body FROM admin_api_responses WHERE key = ?",
+                (key,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+
+        entry = CachedResponse(etag=row[0], last_modified=row[1], body=row[2])
+        self._remember(key, entry)
+
+        return entry
+
+    def put(self, key: str, entry: CachedResponse) -> None:
+        self._remember(key, entry)
+
+        if not self.on_disk:
+            return
+
+        connection = storage.get_connection()
+
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO admin_api_responses "
+                "(key, etag, last_modified, body, stored_at) VALUES (?, ?, ?, ?, ?)",
+                (key, entry.etag, entry.last_modified, entry.body, time.time()),
+            )
+
+        with self.lock:
+            self.saves += 1
+            trim = self.saves % TRIM_INTERVAL == 0
+
+        if trim:
+            with connection:
+                connection.execute(
+                    "DELETE FROM admin_api_responses WHERE key NOT IN "
+                    "(SELECT key FROM admin_api_responses ORDER BY stored_at DESC LIMIT ?)",
+                    (self.max_entries,),
+                )
+
+    def _remember(self, key: str, entry: CachedResponse) -> None:
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
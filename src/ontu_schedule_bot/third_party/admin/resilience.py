@@ -0,0 +1,108 @@
+"""
+Protects the bot from a degraded admin API.
+
+- A circuit breaker per endpoint stops sending requests to an endpoint that keeps failing,
+  so callers fail fast instead of waiting for timeouts;
+- Retries are delayed with a jittered exponential backoff, and limited by a retry budget
+  shared by all endpoints, so retries can't multiply load on a struggling API.
+"""
+
+import enum
+import random
+import threading
+import time
+
+
+class CircuitState(enum.StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures.
+
+    While open, requests are rejected. After `reset_timeout` seconds a single trial
+    request is let through (half-open): its success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Returns whether a request may be sent now"""
+        with self.lock:
+            if self.state == CircuitState.CLOSED:
+                return True
+
+            if self.state == CircuitState.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+
+                self.state = CircuitState.HALF_OPEN
+                return True
+
+            # Half-open, a trial request is already in flight
+            return False
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.state = CircuitState.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+
+            if self.state == CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = CircuitState.OPEN
+                self.opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a trial request through"""
+        with self.lock:
+            if self.state != CircuitState.OPEN:
+                return 0.0
+
+            return max(self.reset_timeout - (time.monotonic() - self.opened_at), 0.0)
+
+
+class RetryBudget:
+    """
+    Allows retries only as a fraction (`ratio`) of regular requests.
+
+    Every request deposits `ratio` tokens, every retry withdraws one.
+    `min_tokens` allows a few retries when there is little traffic.
+    """
+
+    def __init__(self, ratio: float, min_tokens: float) -> None:
+        self.ratio = ratio
+        self.max_tokens = max(min_tokens, 1.0) * 10
+        self.tokens = min_tokens
+        self.lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self.lock:
+            self.tokens = min(self.tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self) -> bool:
+        """Returns whether a retry may be made"""
+        with self.lock:
+            if self.tokens < 1:
+                return False
+
+            self.tokens -= 1
+            return True
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter (`attempt` starts from 1)"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
@@ -0,0 +1,55 @@
+"""
+Coalesces identical concurrent calls.
+
+While a call with some key is in flight, other callers with the same key
+(from other threads) wait for it and share its result instead of making their own call.
+"""
+
+import threading
+from collections.abc import Callable, Hashable
+from typing import cast
+
+
+class _Call[T]:
+    __slots__ = ("done", "error", "result")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: T | None = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self.calls: dict[Hashable, _Call] = {}
+        self.lock = threading.Lock()
+
+    def do[T](self, key: Hashable, function: Callable[[], T]) -> tuple[T, bool]:
+        """Calls `function` (or joins an identical call), returns the result and if it was shared"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+
+            if call is None:
+                call = self.calls[key] = _Call[T]()
+
+        if not leader:
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return cast("T", call.result), True
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+            call.done.set()
+
+        return call.result, False
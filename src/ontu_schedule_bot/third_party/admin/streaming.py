@@ -0,0 +1,110 @@
+"""
+Incremental decoding of streamed JSON arrays (the bulk schedule).
+
+The stream is gzip-compressed (httpx decodes other compact encodings only with optional
+packages), and chunks (especially decompressed ones) don't follow boundaries of records.
+So chunks are accumulated in a buffer, and records are decoded from it as soon as they're
+complete. A malformed record is skipped, so it doesn't stall the rest of the stream.
+A stream that doesn't end with the closing bracket of the array is truncated.
+"""
+
+import codecs
+import json
+import logging
+import re
+from collections.abc import Iterator
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+ACCEPT_ENCODING = "gzip"
+
+# Separators between records: whitespace, commas and brackets of (possibly nested) arrays
+SEPARATORS = " \t\r\n,[]"
+# A record that doesn't complete within this many characters is considered invalid
+MAX_BUFFERED = 64 * 1024 * 1024
+
+# Strings (whole, so brackets in them aren't counted), a quote of an unterminated one, brackets
+TOKENS = re.compile(r'"(?:[^"\\]|\\.)*"|["{}\[\]]')
+SCALAR_END = re.compile(r"[\s,\]]")
+
+
+def record_end(text: str, start: int) -> int | None:
+    """Returns where the record starting at `start` ends, None if it isn't complete yet"""
+    if text[start] not in "{[":
+        match = SCALAR_END.search(text, start)
+        return match.start() if match else None
+
+    depth = 0
+
+    for match in TOKENS.finditer(text, start):
+        token = match.group()
+
+        if token == '"':
+            return None
+        if token in "{[":
+            depth += 1
+        elif token in "}]":
+            depth -= 1
+
+            if depth == 0:
+                return match.end()
+
+    return None
+
+
+class JSONArrayDecoder:
+    """Decodes records of a JSON array fed in chunks of bytes of any size"""
+
+    def __init__(self) -> None:
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.skipped = 0
+        # Whether the stream (so far) ends with the closing bracket of the array
+        self.ended = False
+
+    def feed(self, chunk: bytes) -> Iterator[Any]:
+        """Yields records that were completed by the chunk"""
+        text = self.text_decoder.decode(chunk)
+        self.buffer += text
+
+        if text := text.rstrip():
+            self.ended = text.endswith("]")
+
+        position = 0
+
+        while True:
+            while position < len(self.buffer) and self.buffer[position] in SEPARATORS:
+                position += 1
+
+            if position == len(self.buffer):
+                break
+
+            try:
+                record, position = self.decoder.raw_decode(self.buffer, position)
+            except json.JSONDecodeError as e:
+                end = record_end(self.buffer, position)
+                if end is None:
+                    # Not complete yet, the rest of it comes with next chunks
+                    break
+
+                logger.warning(
+                    "Skipping a malformed record (%s): %r", e, self.buffer[position:end][:128]
+                )
+                self.skipped += 1
+                position = end
+                continue
+
+            yield record
+
+        self.buffer = self.buffer[position:]
+
+        if len(self.buffer) > MAX_BUFFERED:
+            raise ValueError(f"Invalid or too large record: {self.buffer[:128]!r}...")
+
+    def close(self) -> str:
+        """Returns what was left undecoded at the end of the stream (empty if nothing)"""
+        self.buffer += self.text_decoder.decode(b"", final=True)
+
+        return self.buffer.strip(SEPARATORS)
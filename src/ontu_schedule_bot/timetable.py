@@ -0,0 +1,79 @@
+"""
+Timetable of pairs.
+
+Timezone-aware start times of pairs are built once per day and cached,
+lookups of "the next pair" are done with a binary search over them.
+"""
+
+import bisect
+import datetime
+import functools
+from collections.abc import Iterator
+
+from ontu_schedule_bot.third_party.admin.schemas import DaySchedule, Pair
+from ontu_schedule_bot.utils import KYIV_TIMEZONE, PAIR_END_TIME, PAIR_START_TIME
+
+
+class DaySlots:
+    """Start (and end) times of pairs of a specific day, sorted"""
+
+    __slots__ = ("date", "end_by_number", "numbers", "start_by_number", "starts")
+
+    def __init__(self, date: datetime.date) -> None:
+        self.date = date
+
+        self.numbers = sorted(PAIR_START_TIME)
+        self.starts = [
+            # zoneinfo (unlike pytz) gives correct offset when passed to `combine`
+            datetime.datetime.combine(date, PAIR_START_TIME[number], tzinfo=KYIV_TIMEZONE)
+            for number in self.numbers
+        ]
+        self.start_by_number = dict(zip(self.numbers, self.starts, strict=True))
+        self.end_by_number = {
+            number: datetime.datetime.combine(date, PAIR_END_TIME[number], tzinfo=KYIV_TIMEZONE)
+            for number in self.numbers
+        }
+
+    def start_of(self, pair_number: int) -> datetime.datetime | None:
+        return self.start_by_number.get(pair_number)
+
+    def first_slot_at_or_after(self, moment: datetime.datetime) -> int | None:
+        """Returns number of the first pair that starts at or after `moment`"""
+        index = bisect.bisect_left(self.starts, moment)
+
+        if index == len(self.starts):
+            return None
+
+        return self.numbers[index]
+
+
+@functools.lru_cache(maxsize=16)
+def get_day_slots(date: datetime.date) -> DaySlots:
+    return DaySlots(date)
+
+
+def _first_upcoming_index(day_schedule: DaySchedule, now: datetime.datetime) -> int:
+    """Returns index of the first pair that starts at or after `now` (pairs go in order)"""
+    first_number = get_day_slots(day_schedule.date).first_slot_at_or_after(now)
+
+    if first_number is None:
+        return len(day_schedule.pairs)
+
+    return bisect.bisect_left(day_schedule.pairs, first_number, key=lambda pair: pair.number)
+
+
+def upcoming_pairs(day_schedule: DaySchedule, now: datetime.datetime) -> Iterator[Pair]:
+    """Yields pairs (even without lessons) that start at or after `now`"""
+    for pair in day_schedule.pairs[_first_upcoming_index(day_schedule, now) :]:
+        if pair.number in PAIR_START_TIME:
+            yield pair
+
+
+def upcoming_pair(day_schedule: DaySchedule, now: datetime.datetime) -> Pair | None:
+    """Returns the first pair (even without lessons) that starts at or after `now`"""
+    return next(upcoming_pairs(day_schedule, now), None)
+
+
+def next_pair_with_lessons(day_schedule: DaySchedule, now: datetime.datetime) -> Pair | None:
+    """Returns the first pair with lessons that starts at or after `now`"""
+    return next((pair for pair in upcoming_pairs(day_schedule, now) if pair.lessons), None)
@@ -0,0 +1,207 @@
+"""
+Processing of incoming updates with bounded concurrency.
+
+- Updates of a chat are handled one by one, in the order they came, so two quick taps
+  don't race each other (e.g. editing the same message);
+- At most `max_concurrency` updates are handled at once, updates waiting for their chat
+  don't take a slot;
+- At most `queue_limit` updates wait (for their chat or a slot), newer ones are dropped,
+  so memory and latency stay bounded under a burst. A chat may have at most
+  `chat_queue_limit` updates in flight, so a flooding chat loses its own excess updates
+  before it fills the queue for everybody;
+- Repeated presses of a button (same chat, message and button) while the first press is
+  still being handled are answered right away and dropped, within
+  `CALLBACK_DEBOUNCE_WINDOW`. So a mutation (e.g. toggling the subscription) isn't done twice.
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+from collections.abc import AsyncIterator, Awaitable
+from typing import Any, NamedTuple
+
+import telegram.error
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from ontu_schedule_bot import metrics
+from ontu_schedule_bot.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Press(NamedTuple):
+    """A press of an inline button"""
+
+    chat_id: int | None
+    # ID of the message, or of the inline message
+    message_id: int | str | None
+    action: str
+    # Callback data is cached by the bot, so presses of a button give the same object
+    button: int
+
+
+def get_press(update: object) -> Press | None:
+    """Returns the press of a button the update is about, None for other updates"""
+    if not isinstance(update, Update) or update.callback_query is None:
+        return None
+
+    query = update.callback_query
+    data = query.data
+    action = data[0] if isinstance(data, tuple) and data and isinstance(data[0], str) else ""
+
+    return Press(
+        chat_id=update.effective_chat.id if update.effective_chat else None,
+        message_id=query.message.message_id if query.message else query.inline_message_id,
+        action=action,
+        button=id(data),
+    )
+
+
+def get_chat_id(update: object) -> int | None:
+    # Inline queries have no chat, they don't interfere with each other
+    if isinstance(update, Update) and update.effective_chat:
+        return update.effective_chat.id
+
+    return None
+
+
+def _close(coroutine: Awaitable[Any]) -> None:
+    """Closes a coroutine that won't be awaited, so it's not reported as a leak"""
+    if asyncio.iscoroutine(coroutine):
+        coroutine.close()
+
+
+class ChatQueue:
+    """Turns of updates of a chat (`asyncio.Lock` wakes its waiters in FIFO order)"""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        # Updates that hold or wait for the lock, the queue is removed when there are none
+        self.users = 0
+
+
+class UpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrency: int, queue_limit: int, chat_queue_limit: int) -> None:
+        # The base class bounds updates that are admitted at once. One more is admitted
+        # over the limits, just to be dropped (so updates over the limit are dropped in turn)
+        super().__init__(max_concurrent_updates=max_concurrency + queue_limit + 1)
+
+        self.queue_limit = queue_limit
+        self.chat_queue_limit = chat_queue_limit
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.chats: dict[int, ChatQueue] = {}
+        self.waiting = 0
+        # Presses of buttons that are being handled -> when they were pressed
+        self.presses: dict[Press, float] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _set_waiting(self, change: int) -> None:
+        self.waiting += change
+        metrics.UPDATE_QUEUE_DEPTH.set(self.waiting)
+
+    @contextlib.asynccontextmanager
+    async def _chat_turn(self, chat_id: int | None) -> AsyncIterator[None]:
+        """Waits until earlier updates of the chat are handled"""
+        if chat_id is None:
+            yield
+            return
+
+        queue = self.chats.get(chat_id)
+        if queue is None:
+            queue = self.chats[chat_id] = ChatQueue()
+
+        queue.users += 1
+        try:
+            async with queue.lock:
+                yield
+        finally:
+            queue.users -= 1
+            if not queue.users:
+                del self.chats[chat_id]
+
+    def _is_duplicate(self, press: Press) -> bool:
+        pressed_at = self.presses.get(press)
+
+        return (
+            pressed_at is not None
+            and time.monotonic() - pressed_at < settings.CALLBACK_DEBOUNCE_WINDOW
+        )
+
+    async def do_process_update(
+        self,
+        update: object,
+        coroutine: Awaitable[Any],
+    ) -> None:
+        press = get_press(update)
+
+        if press is not None and self._is_duplicate(press):
+            metrics.CALLBACK_PRESSES_DEBOUNCED.inc(action=press.action)
+            _close(coroutine)
+
+            # The button stops spinning right away, the first press is still being handled
+            assert isinstance(update, Update) and update.callback_query
+            try:
+                await update.callback_query.answer()
+            except telegram.error.TelegramError as e:
+                logger.warning("Failed to answer a duplicate press: %s", e)
+            return
+
+        chat_id = get_chat_id(update)
+        queue = self.chats.get(chat_id) if chat_id is not None else None
+
+        if queue is not None and queue.users >= self.chat_queue_limit:
+            logger.warning(
+                "Too many updates of chat %s are waiting, dropping update %s",
+                chat_id,
+                update.update_id if isinstance(update, Update) else update,
+            )
+            metrics.UPDATES_DROPPED.inc(limit="chat")
+            _close(coroutine)
+            return
+
+        if self.waiting >= self.queue_limit:
+            logger.warning(
+                "Too many updates are waiting, dropping update %s",
+                update.update_id if isinstance(update, Update) else update,
+            )
+            metrics.UPDATES_DROPPED.inc(limit="overall")
+            _close(coroutine)
+            return
+
+        if press is None:
+            await self._process(chat_id, coroutine)
+            return
+
+        pressed_at = self.presses[press] = time.monotonic()
+        try:
+            await self._process(chat_id, coroutine)
+        finally:
+            # Unless a later press (after the window) took its place
+            if self.presses.get(press) == pressed_at:
+                del self.presses[press]
+
+    async def _process(self, chat_id: int | None, coroutine: Awaitable[Any]) -> None:
+        started_at = time.monotonic()
+        started = False
+
+        self._set_waiting(1)
+        try:
+            async with self._chat_turn(chat_id), self.slots:
+                started = True
+                self._set_waiting(-1)
+                metrics.UPDATE_QUEUE_WAIT.observe(time.monotonic() - started_at)
+
+                await coroutine
+        finally:
+            # Cancelled while waiting
+            if not started:
+                self._set_waiting(-1)
@@ -2,14 +2,14 @@
 
 import datetime
 import re
+import zoneinfo
 
-import pytz
+KYIV_TIMEZONE = zoneinfo.ZoneInfo("Europe/Kyiv")
 
 
 def current_time_in_kiev() -> datetime.datetime:
     """Returns current time in Kiev timezone"""
-    kiev_tz = pytz.timezone("Europe/Kyiv")
-    return datetime.datetime.now(tz=kiev_tz)
+    return datetime.datetime.now(tz=KYIV_TIMEZONE)
 
 
 PAIR_START_TIME = {
@@ -45,6 +45,16 @@ def get_pair_time_bounds(pair_number: int) -> tuple[datetime.time, datetime.time
     return start_time, end_time
 
 
+def split_platform_chat_id(platform_chat_id: str) -> tuple[str, int | None]:
+    """Splits `chat_id:message_thread_id` into its parts (thread is optional)"""
+    if ":" not in platform_chat_id:
+        return platform_chat_id, None
+
+    chat_id, message_thread_id = platform_chat_id.split(":", 1)
+
+    return chat_id, int(message_thread_id)
+
+
 def get_weekday_name(date: datetime.date) -> str:
     """Returns weekday name for some date"""
     weekdays = {
@@ -0,0 +1,63 @@
+"""
+Warms up caches and connections on startup.
+
+Warm-up tasks are started in threads right after settings are loaded, so they run
+concurrently with initialization of the application (bot, persistence),
+and are awaited before the bot starts handling updates.
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from ontu_schedule_bot.third_party.admin.client import get_admin_client
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(task: Callable[[], object]) -> Callable[[], float]:
+    def wrapper() -> float:
+        started_at = time.perf_counter()
+        task()
+        return time.perf_counter() - started_at
+
+    return wrapper
+
+
+class WarmUp:
+    def __init__(self) -> None:
+        client = get_admin_client()
+
+        tasks: dict[str, Callable[[], object]] = {
+            "faculties": client.read_faculties,
+            "departments": client.read_departments,
+        }
+
+        self.started_at = time.perf_counter()
+        self.executor = ThreadPoolExecutor(
+            max_workers=len(tasks),
+            thread_name_prefix="warm-up",
+        )
+        self.futures: dict[str, Future[float]] = {
+            name: self.executor.submit(_timed(task)) for name, task in tasks.items()
+        }
+
+    async def wait(self) -> str:
+        """Waits for warm-up tasks to finish, returns a summary of their durations"""
+        results = await asyncio.gather(
+            *(asyncio.wrap_future(future) for future in self.futures.values()),
+            return_exceptions=True,
+        )
+        self.executor.shutdown(wait=False)
+
+        summary = []
+        for name, result in zip(self.futures, results, strict=True):
+            if isinstance(result, BaseException):
+                logger.warning("Warm-up of %s failed: %s", name, result)
+                summary.append(f"{name}: failed")
+            else:
+                summary.append(f"{name}: {result:.2f} s")
+
+        return ", ".join(summary)
@@ -0,0 +1,28 @@
+"""Required settings for tests, state of every test is kept in its own temporary directory"""
+
+import os
+import pathlib
+import threading
+from collections.abc import Iterator
+
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "test-token")
+os.environ.setdefault("API_URL", "http://admin.test")
+os.environ.setdefault("API_USERNAME", "test")
+os.environ.setdefault("API_PASSWORD", "test")
+os.environ.setdefault("DEBUG_CHAT_ID", "-100")
+
+from ontu_schedule_bot import settings, storage
+
+
+@pytest.fixture(autouse=True)
+def state(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    monkeypatch.setenv("STATE_DB_FILEPATH", str(tmp_path / "state.sqlite3"))
+    monkeypatch.setenv("BULK_SNAPSHOT_FILEPATH", str(tmp_path / "bulk.snapshot"))
+    # Connections (per thread) to the state database of the previous test aren't reused
+    monkeypatch.setattr(storage, "_local", threading.local())
+
+    settings.get_settings.cache_clear()
+    yield
+    settings.get_settings.cache_clear()
@@ -0,0 +1,99 @@
+import datetime
+import os
+import pathlib
+
+from ontu_schedule_bot import utils
+from ontu_schedule_bot.bulk_snapshot import Snapshot, SnapshotStore, SnapshotWriter
+
+
+def day_schedule(for_entity: str, number: int) -> dict:
+    return {
+        "for_entity": for_entity,
+        "date": utils.current_time_in_kiev().date().isoformat(),
+        "pairs": [{"number": number, "lessons": []}],
+    }
+
+
+RECORDS: list[dict[str, list[dict | None]]] = [
+    {"200": [day_schedule("group", 1), None]},
+    {"100": [day_schedule("group", 1)], "100:7": [day_schedule("teacher", 2)]},
+    {"300": []},
+]
+
+
+def write_snapshot(path: pathlib.Path) -> SnapshotWriter:
+    writer = SnapshotWriter()
+
+    assert list(writer.tee(iter(RECORDS))) == RECORDS
+    assert writer.complete
+
+    writer.write(str(path))
+    return writer
+
+
+def test_schedules_of_chats_are_found(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "bulk.snapshot"
+    writer = write_snapshot(path)
+
+    # The same schedule of two chats is stored once
+    assert len(writer.schedule_indexes) == 2
+
+    snapshot = Snapshot(str(path))
+    assert len(snapshot) == 4
+
+    schedules = snapshot.get("200")
+    assert schedules is not None
+    assert schedules[1] is None
+    assert schedules[0] is not None
+    assert schedules[0].for_entity == "group"
+    assert schedules[0].pairs[0].number == 1
+
+    teacher = snapshot.get("100:7")
+    assert teacher is not None
+    assert teacher[0] is not None
+    assert teacher[0].for_entity == "teacher"
+
+    assert snapshot.get("300") == []
+    assert snapshot.get("400") is None
+    assert snapshot.get("") is None
+
+
+def test_records_are_read_back(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "bulk.snapshot"
+    write_snapshot(path)
+
+    records = {
+        chat_id: [schedule.model_dump(mode="json") if schedule else None for schedule in schedules]
+        for record in Snapshot(str(path)).records()
+        for chat_id, schedules in record.items()
+    }
+
+    assert records == {chat_id: value for record in RECORDS for chat_id, value in record.items()}
+
+
+def test_store_gives_only_todays_snapshot(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "bulk.snapshot"
+    store = SnapshotStore(str(path))
+    today = utils.current_time_in_kiev().date()
+
+    assert store.get(today) is None
+
+    write_snapshot(path)
+
+    snapshot = store.get(today)
+    assert snapshot is not None
+    assert store.get(today) is snapshot
+    assert store.get(today - datetime.timedelta(days=1)) is None
+
+
+def test_store_ignores_invalid_file(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "bulk.snapshot"
+    path.write_bytes(b"not a snapshot" * 10)
+
+    store = SnapshotStore(str(path))
+    assert store.get(utils.current_time_in_kiev().date()) is None
+
+    # A replaced file is re-opened
+    write_snapshot(path)
+    os.utime(path, ns=(0, 1))
+    assert store.get(utils.current_time_in_kiev().date()) is not None
@@ -0,0 +1,99 @@
+import datetime
+
+import httpx
+import pytest
+
+from ontu_schedule_bot.third_party.admin import client as admin_client
+
+DATE = datetime.date(2026, 9, 1)
+
+
+def day_schedules(for_entity: str) -> list[dict | None]:
+    return [{"for_entity": for_entity, "date": DATE.isoformat(), "pairs": []}, None]
+
+
+class Server:
+    """Serves day schedules of chats with an ETag, answers 304 if it wasn't changed"""
+
+    def __init__(self) -> None:
+        self.versions: dict[str, int] = {}
+        self.requests: list[httpx.Request] = []
+
+    def etag(self, chat_id: str) -> str:
+        return f'"{chat_id}-{self.versions.setdefault(chat_id, 1)}"'
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        chat_id = request.headers["X-Chat-ID"]
+        etag = self.etag(chat_id)
+
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304, headers={"ETag": etag})
+
+        return httpx.Response(
+            200,
+            json=day_schedules(f"{chat_id} v{self.versions[chat_id]}"),
+            headers={"ETag": etag},
+        )
+
+
+def make_client(server: Server) -> admin_client.AdminClient:
+    client = admin_client.AdminClient()
+    client.client = httpx.Client(
+        base_url="http://admin.test", transport=httpx.MockTransport(server)
+    )
+    return client
+
+
+def test_not_modified_reuses_the_parsed_value() -> None:
+    server = Server()
+    client = make_client(server)
+
+    first = client.schedule_day(chat_id="1", date=DATE)
+    second = client.schedule_day(chat_id="1", date=DATE)
+
+    assert "If-None-Match" not in server.requests[0].headers
+    assert server.requests[1].headers["If-None-Match"] == '"1-1"'
+    # Not validated again
+    assert second is first
+
+
+def test_modified_resource_is_read_again() -> None:
+    server = Server()
+    client = make_client(server)
+
+    client.schedule_day(chat_id="1", date=DATE)
+    server.versions["1"] = 2
+
+    changed = client.schedule_day(chat_id="1", date=DATE)
+    assert changed[0] is not None
+    assert changed[0].for_entity == "1 v2"
+
+    assert client.schedule_day(chat_id="1", date=DATE) is changed
+    assert server.requests[2].headers["If-None-Match"] == '"1-2"'
+
+
+def test_evicted_response_is_read_again(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ADMIN_API_CONDITIONAL_CACHE_MAX_ENTRIES", "1")
+    server = Server()
+    client = make_client(server)
+
+    client.schedule_day(chat_id="1", date=DATE)
+    client.schedule_day(chat_id="2", date=DATE)
+
+    again = client.schedule_day(chat_id="1", date=DATE)
+
+    assert "If-None-Match" not in server.requests[2].headers
+    assert again[0] is not None
+    assert again[0].for_entity == "1 v1"
+
+
+def test_saved_responses_survive_restarts(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ADMIN_API_CONDITIONAL_CACHE_ON_DISK", "true")
+    server = Server()
+
+    first = make_client(server).schedule_day(chat_id="1", date=DATE)
+    restarted = make_client(server).schedule_day(chat_id="1", date=DATE)
+
+    assert server.requests[1].headers["If-None-Match"] == '"1-1"'
+    assert restarted == first
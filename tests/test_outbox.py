@@ -0,0 +1,143 @@
+import asyncio
+import datetime
+import threading
+from typing import cast
+
+import pytest
+import telegram.error
+from telegram import Bot
+
+from ontu_schedule_bot import commands, messages, outbox, utils
+from ontu_schedule_bot.notifications import Notification
+from ontu_schedule_bot.schemas import BatchStats
+from ontu_schedule_bot.third_party.admin.schemas import DaySchedule, Pair
+
+NOW = utils.current_time_in_kiev()
+
+
+def make_notification(
+    platform_chat_id: str,
+    number: int = 1,
+    starts_in: datetime.timedelta = datetime.timedelta(hours=1),
+    plan: str = "day:test",
+) -> Notification:
+    pair = Pair(number=number, lessons=[])
+
+    return Notification(
+        due_at=NOW + starts_in - datetime.timedelta(minutes=10),
+        deadline=NOW + starts_in,
+        expires_at=NOW + starts_in + datetime.timedelta(minutes=80),
+        platform_chat_id=platform_chat_id,
+        pair=pair,
+        day_schedule=DaySchedule(for_entity="group", date=NOW.date(), pairs=[pair]),
+        plan=plan,
+    )
+
+
+def keys(notifications: list[Notification]) -> set[str]:
+    return {outbox.notification_key(notification) for notification in notifications}
+
+
+def test_done_notifications_are_not_sent_again() -> None:
+    ledger = outbox.Outbox()
+    first, second = make_notification("1"), make_notification("2")
+
+    assert keys(ledger.add([first, second, make_notification("1")])) == keys([first, second])
+
+    ledger.complete([first], status="sent")
+
+    # E.g. the instant is rerun after a crash
+    assert keys(ledger.add([first, second])) == keys([second])
+
+
+def test_unfinished_notifications_are_drained() -> None:
+    ledger = outbox.Outbox()
+    upcoming = make_notification("1")
+    started = make_notification("2", starts_in=-datetime.timedelta(minutes=5))
+    sent = make_notification("3")
+
+    ledger.add([upcoming, started, sent])
+    ledger.complete([sent], status="sent")
+
+    unfinished = ledger.unfinished(now=NOW)
+
+    assert keys(unfinished) == keys([upcoming])
+    assert unfinished[0].due_at == upcoming.due_at
+    assert unfinished[0].pair == upcoming.pair
+    assert unfinished[0].day_schedule == upcoming.day_schedule
+
+
+def test_complete_from_another_thread() -> None:
+    ledger = outbox.Outbox()
+    notification = make_notification("1")
+    ledger.add([notification])
+
+    thread = threading.Thread(target=ledger.complete, args=([notification], "sent"))
+    thread.start()
+    thread.join()
+
+    assert ledger.unfinished(now=NOW) == []
+
+
+def test_purge_removes_past_days() -> None:
+    ledger = outbox.Outbox()
+    ledger.add([make_notification("1")])
+
+    assert ledger.purge(before=NOW.date()) == 0
+    assert ledger.purge(before=NOW.date() + datetime.timedelta(days=1)) == 1
+
+
+def test_plans_are_replaced() -> None:
+    plans = outbox.PlanStore()
+
+    assert plans.get("day:test", now=NOW) is None
+
+    plans.replace("day:test", [make_notification("1"), make_notification("2")])
+    plans.replace("evening:test", [make_notification("3", plan="evening:test")])
+    plans.replace("day:test", [make_notification("2", number=2)])
+
+    planned = plans.get("day:test", now=NOW)
+    assert planned is not None
+    assert [(item.platform_chat_id, item.pair and item.pair.number) for item in planned] == [
+        ("2", 2)
+    ]
+
+    evening = plans.get("evening:test", now=NOW)
+    assert evening is not None
+    assert len(evening) == 1
+
+
+def test_plans_skip_worthless_notifications() -> None:
+    plans = outbox.PlanStore()
+    plans.replace("day:test", [make_notification("1", starts_in=-datetime.timedelta(hours=2))])
+
+    # The plan is stored, it just has nothing to send anymore
+    assert plans.get("day:test", now=NOW) == []
+
+    plans.purge(before=NOW + datetime.timedelta(minutes=1))
+    assert plans.get("day:test", now=NOW) is None
+
+
+def test_undeliverable_notifications_are_not_retried(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def send_notifications_with_bot(**_: object) -> int:
+        raise telegram.error.BadRequest("Can't parse entities: unsupported start tag")
+
+    monkeypatch.setattr(messages, "send_notifications_with_bot", send_notifications_with_bot)
+
+    ledger = outbox.Outbox()
+    notification = make_notification("1")
+    ledger.add([notification])
+
+    with pytest.raises(telegram.error.BadRequest):
+        asyncio.run(
+            commands.send_chat_notifications(
+                bot=cast("Bot", None),
+                platform_chat_id="1",
+                chat_notifications=[notification],
+                stats=BatchStats(),
+                ledger=ledger,
+            )
+        )
+
+    # It would fail the same way on every drain
+    assert ledger.unfinished(now=NOW) == []
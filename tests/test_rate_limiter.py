@@ -0,0 +1,153 @@
+import asyncio
+import datetime
+from typing import Any
+
+import pytest
+from telegram.error import RetryAfter
+
+from ontu_schedule_bot import rate_limiter
+from ontu_schedule_bot.rate_limiter import LaneRateLimiter, TokenBucket, is_message
+
+PRIVATE_CHAT = 2
+GROUP_CHAT = -1002
+
+
+class Callback:
+    """Records calls, raises the given errors first"""
+
+    def __init__(self, name: str, calls: list[str], errors: tuple[Exception, ...] = ()) -> None:
+        self.name = name
+        self.calls = calls
+        self.errors = list(errors)
+
+    async def __call__(self) -> bool:
+        self.calls.append(self.name)
+
+        if self.errors:
+            raise self.errors.pop(0)
+
+        return True
+
+
+async def request(  # noqa: PLR0913
+    limiter: LaneRateLimiter,
+    callback: Callback,
+    endpoint: str = "sendMessage",
+    chat_id: int | None = PRIVATE_CHAT,
+    lane: rate_limiter.Lane = rate_limiter.Lane.INTERACTIVE,
+    rate_limit_args: int | None = None,
+) -> Any:  # noqa: ANN401
+    data = {} if chat_id is None else {"chat_id": chat_id}
+
+    with rate_limiter.lane(lane):
+        return await limiter.process_request(
+            callback=callback,
+            args=(),
+            kwargs={},
+            endpoint=endpoint,
+            data=data,
+            rate_limit_args=rate_limit_args,
+        )
+
+
+def test_bucket_allows_bursts_then_the_rate() -> None:
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    for _ in range(2):
+        assert bucket.delay() == 0
+        bucket.take()
+
+    assert bucket.delay() == pytest.approx(0.1, abs=0.01)
+
+    bucket.pause(5)
+    assert bucket.delay() == pytest.approx(5, abs=0.01)
+
+
+@pytest.mark.parametrize(
+    ("endpoint", "expected"),
+    [
+        ("sendMessage", True),
+        ("sendPhoto", True),
+        ("sendChatAction", False),
+        ("editMessageText", False),
+        ("answerCallbackQuery", False),
+    ],
+)
+def test_is_message(endpoint: str, expected: bool) -> None:
+    assert is_message(endpoint) is expected
+
+
+def test_interactive_requests_go_first() -> None:
+    async def run() -> list[str]:
+        limiter = LaneRateLimiter(max_rate=20)
+        limiter.overall.tokens = 0
+        calls: list[str] = []
+
+        await asyncio.gather(
+            request(limiter, Callback("bulk", calls), chat_id=3, lane=rate_limiter.Lane.BULK),
+            request(limiter, Callback("interactive", calls), chat_id=4),
+        )
+        await limiter.shutdown()
+
+        return calls
+
+    assert asyncio.run(run()) == ["interactive", "bulk"]
+
+
+def test_messages_take_tokens_of_their_chat() -> None:
+    async def run() -> LaneRateLimiter:
+        limiter = LaneRateLimiter(max_rate=100)
+        calls: list[str] = []
+
+        for _ in range(rate_limiter.PRIVATE_CHAT_BURST):
+            await request(limiter, Callback("send", calls))
+        for _ in range(10):
+            await request(limiter, Callback("edit", calls), endpoint="editMessageText")
+            await request(limiter, Callback("typing", calls), endpoint="sendChatAction")
+        await request(limiter, Callback("group", calls), chat_id=GROUP_CHAT)
+
+        return limiter
+
+    limiter = asyncio.run(run())
+
+    # Edits and chat actions didn't wait for (or take tokens of) the chat
+    assert limiter.chats[PRIVATE_CHAT].delay() > 0
+    assert limiter.chats[GROUP_CHAT].delay() == 0
+
+
+def test_retry_after_pauses_the_chat_and_slows_down() -> None:
+    async def run() -> tuple[Any, list[str], LaneRateLimiter]:
+        limiter = LaneRateLimiter(max_rate=100, max_retries=1)
+        calls: list[str] = []
+        error = RetryAfter(retry_after=datetime.timedelta(milliseconds=50))
+
+        result = await request(limiter, Callback("send", calls, errors=(error,)))
+
+        return result, calls, limiter
+
+    result, calls, limiter = asyncio.run(run())
+
+    assert result is True
+    assert calls == ["send", "send"]
+    # The rate recovers a bit while the request is retried
+    assert limiter.overall.rate == pytest.approx(50, rel=0.05)
+
+
+def test_retries_are_bounded_by_rate_limit_args() -> None:
+    async def run(rate_limit_args: int | None) -> list[str]:
+        limiter = LaneRateLimiter(max_rate=100, max_retries=3)
+        calls: list[str] = []
+        errors = tuple(RetryAfter(retry_after=datetime.timedelta(milliseconds=1)) for _ in range(5))
+
+        with pytest.raises(RetryAfter):
+            await request(
+                limiter,
+                Callback("edit", calls, errors=errors),
+                endpoint="editMessageText",
+                rate_limit_args=rate_limit_args,
+            )
+
+        return calls
+
+    assert len(asyncio.run(run(rate_limit_args=0))) == 1
+    assert len(asyncio.run(run(rate_limit_args=None))) == 4
@@ -0,0 +1,145 @@
+import types
+
+import httpx
+import pytest
+
+from ontu_schedule_bot.errors import ServiceUnavailableError
+from ontu_schedule_bot.third_party.admin import client as admin_client
+from ontu_schedule_bot.third_party.admin import resilience
+from ontu_schedule_bot.third_party.admin.resilience import (
+    CircuitBreaker,
+    CircuitState,
+    RetryBudget,
+    backoff_delay,
+)
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(resilience, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def test_breaker_opens_after_consecutive_failures(clock: Clock) -> None:  # noqa: ARG001
+    breaker = CircuitBreaker(name="test", failure_threshold=3, reset_timeout=10)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == 10
+
+
+def test_breaker_lets_a_single_trial_through(clock: Clock) -> None:
+    breaker = CircuitBreaker(name="test", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+
+    clock.now += 10
+    assert breaker.allow()
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow()
+
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.allow()
+
+
+def test_retry_budget_is_a_share_of_requests() -> None:
+    budget = RetryBudget(ratio=0.5, min_tokens=1)
+
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def test_backoff_delay_is_capped() -> None:
+    for attempt in range(1, 10):
+        assert 0 <= backoff_delay(attempt, base=0.2, cap=2.0) <= min(2.0, 0.2 * 2 ** (attempt - 1))
+
+
+def make_client(transport: httpx.MockTransport) -> admin_client.AdminClient:
+    client = admin_client.AdminClient()
+    client.client = httpx.Client(base_url="http://admin.test", transport=transport)
+    return client
+
+
+def test_client_opens_circuit_on_server_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ADMIN_API_MAX_RETRIES", "0")
+    monkeypatch.setenv("ADMIN_API_BREAKER_FAILURES", "2")
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(503)
+
+    client = make_client(httpx.MockTransport(handler))
+
+    for _ in range(2):
+        with pytest.raises(ServiceUnavailableError):
+            client.get_chat(chat_id="1")
+
+    with pytest.raises(ServiceUnavailableError):
+        client.get_chat(chat_id="1")
+
+    assert len(requests) == 2
+
+
+def test_client_records_unexpected_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ADMIN_API_BREAKER_FAILURES", "1")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise RuntimeError(request.url)
+
+    client = make_client(httpx.MockTransport(handler))
+
+    with pytest.raises(RuntimeError):
+        client.get_chat(chat_id="1")
+
+    # A half-open circuit isn't left waiting for the result of its trial request
+    assert client.breakers["get_chat"].state == CircuitState.OPEN
+
+
+def test_bulk_schedule_failures_open_the_circuit(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ADMIN_API_BREAKER_FAILURES", "1")
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(503, text="<html>Service Unavailable</html>")
+
+    client = make_client(httpx.MockTransport(handler))
+
+    with pytest.raises(ServiceUnavailableError):
+        list(client.bulk_schedule_raw())
+
+    assert client.breakers["bulk_schedule"].state == CircuitState.OPEN
+
+    with pytest.raises(ServiceUnavailableError):
+        list(client.bulk_schedule_raw())
+
+    assert len(requests) == 1
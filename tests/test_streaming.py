@@ -0,0 +1,125 @@
+import json
+from collections.abc import Callable
+from typing import Any
+
+import httpx
+import pytest
+
+from ontu_schedule_bot.errors import ServiceUnavailableError
+from ontu_schedule_bot.third_party.admin import client as admin_client
+from ontu_schedule_bot.third_party.admin.streaming import JSONArrayDecoder, record_end
+
+RECORDS = [
+    {"1": [{"for_entity": "group", "pairs": []}, None]},
+    {"2": [{"for_entity": "teacher [1]", "note": 'brackets } in "strings"'}]},
+    {"3:4": [], "5": [None]},
+    {"6": [{"for_entity": "Група «Б»", "pairs": [{"number": 1}]}]},
+]
+
+
+def decode(data: bytes, chunk_size: int) -> tuple[list[Any], JSONArrayDecoder]:
+    decoder = JSONArrayDecoder()
+    records = []
+
+    for start in range(0, len(data), chunk_size):
+        records.extend(decoder.feed(data[start : start + chunk_size]))
+
+    return records, decoder
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 1 << 20])
+def test_records_split_between_chunks(chunk_size: int) -> None:
+    data = json.dumps(RECORDS, ensure_ascii=False, indent=2).encode()
+
+    records, decoder = decode(data, chunk_size)
+
+    assert records == RECORDS
+    assert decoder.close() == ""
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 20])
+def test_malformed_records_are_skipped(chunk_size: int) -> None:
+    data = b'[{"1": []}, {"2": [tru]}, {"3": "]"}, nul, {"4": [null]}]'
+
+    records, decoder = decode(data, chunk_size)
+
+    assert records == [{"1": []}, {"3": "]"}, {"4": [None]}]
+    assert decoder.skipped == 2
+    assert decoder.close() == ""
+
+
+def test_incomplete_record_is_left_undecoded() -> None:
+    records, decoder = decode(b'[{"1": []}, {"2": [{"number": 1}', 1 << 20)
+
+    assert records == [{"1": []}]
+    assert decoder.skipped == 0
+    assert decoder.close() == '{"2": [{"number": 1}'
+
+
+@pytest.mark.parametrize(
+    ("text", "end"),
+    [
+        ('{"a": [1, 2]}, {', 13),
+        ('{"a": "}"} ', 10),
+        ('{"a": "\\"}"}', 12),
+        ('{"a": [1, 2]', None),
+        ('{"a": "}', None),
+        ("tru, ", 3),
+        ("tru", None),
+    ],
+)
+def test_record_end(text: str, end: int | None) -> None:
+    assert record_end(text, 0) == end
+
+
+@pytest.mark.parametrize(
+    ("data", "ended"),
+    [
+        (b'[{"1": []}]\n', True),
+        (b"[]", True),
+        (b'[{"1": []}, ', False),
+        (b'[{"1": []}', False),
+        (b"", False),
+    ],
+)
+def test_truncated_stream_is_detected(data: bytes, ended: bool) -> None:
+    _, decoder = decode(data, 3)
+
+    assert decoder.close() == ""
+    assert decoder.ended is ended
+
+
+def make_client(handler: Callable[[httpx.Request], httpx.Response]) -> admin_client.AdminClient:
+    client = admin_client.AdminClient()
+    client.client = httpx.Client(
+        base_url="http://admin.test", transport=httpx.MockTransport(handler)
+    )
+    return client
+
+
+@pytest.mark.parametrize(
+    "response",
+    [
+        httpx.Response(503, text="<html>Service Unavailable</html>"),
+        httpx.Response(500, json={"detail": "boom"}),
+        httpx.Response(200, content=b'[{"1": []}, {"2": []}, '),
+    ],
+)
+def test_failed_bulk_schedule_is_not_taken_for_records(response: httpx.Response) -> None:
+    client = make_client(lambda _: response)
+
+    with pytest.raises(ServiceUnavailableError):
+        list(client.bulk_schedule_raw())
+
+
+def test_bulk_schedule_client_errors_are_raised() -> None:
+    client = make_client(lambda _: httpx.Response(401, json={"detail": "Unauthorized"}))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        list(client.bulk_schedule_raw())
+
+
+def test_bulk_schedule_is_streamed() -> None:
+    client = make_client(lambda _: httpx.Response(200, json=RECORDS))
+
+    assert list(client.bulk_schedule_raw()) == RECORDS